@@ -54,3 +54,20 @@ MASKED_ENV_VARS = {
     'AWS_ACCESS_KEY_ID',
     'AWS_DEFAULT_REGION'
 }
+
+# Caches shared by the deployments of the agent user, unless the cache_dir
+# resource_config property points elsewhere. They hold providers, binaries,
+# sources and results that other operations use, so they are private to
+# the user rather than in a world writable directory.
+DEFAULT_CACHE_DIR = '~/.cloudify-terragrunt'
+SOURCE_CACHE_DIR = 'sources'
+DEFAULT_SOURCE_CACHE_SIZE = 5120  # MiB
+PROVIDER_CACHE_DIR = 'providers'
+DEFAULT_PROVIDER_CACHE_SIZE = 10240  # MiB
+GIT_CACHE_DIR = 'git'
+BINARY_STORE_DIR = 'binaries'
+ADMISSION_DIR = 'admission'
+SINGLEFLIGHT_DIR = 'singleflight'
+DRIFT_DIR = 'drift'
+# How much of an error message a drift report keeps per stack.
+DRIFT_ERROR_LENGTH = 1000
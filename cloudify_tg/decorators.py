@@ -1,16 +1,34 @@
 from sys import exc_info
-from functools import wraps
+from functools import wraps, partial
 
 from . import utils
+from tg_sdk.artifacts import (
+    DEFAULT_MAX_ADDRESSES,
+    compact_plan,
+    property_plan,
+    compact_output,
+    payload_digest
+)
+from tg_sdk.plan_model import PlanModel
+from tg_sdk.plan_delta import compact_delta
 
 from cloudify import utils as cfy_utils
 from cloudify.exceptions import NonRecoverableError
 
 
-def with_terragrunt(func):
+def with_terragrunt(func=None, prewarm=False):
+    """
+    :param prewarm: bool, whether the operation starts the background init
+        of the prewarm property once the source is in place. Only for
+        operations that do not run init themselves, which would otherwise
+        wait for it.
+    """
+    if func is None:
+        return partial(with_terragrunt, prewarm=prewarm)
+
     @wraps(func)
     def wrapper(*args, **kwargs):
-        kwargs['tg'] = utils.terragrunt_from_ctx(kwargs)
+        kwargs['tg'] = utils.terragrunt_from_ctx(kwargs, prewarm=prewarm)
         kwargs['tg'].render_inputs()
         try:
             func(*args, **kwargs)
@@ -21,16 +39,85 @@ def with_terragrunt(func):
                 causes=[cfy_utils.exception_to_error_cause(ex, tb)])
 
         if kwargs['tg'].terraform_plan:
-            kwargs['ctx'].instance.runtime_properties['terraform_plan'] = \
-                kwargs['tg'].terraform_plan
+            delta = kwargs['tg'].terraform_plan_delta
+            if isinstance(delta, dict):
+                store_plan_delta(kwargs['ctx'], kwargs['tg'], delta)
+            else:
+                store_payload(kwargs['ctx'], kwargs['tg'], 'terraform_plan',
+                              kwargs['tg'].terraform_plan)
 
         if kwargs['tg'].terraform_output:
-            kwargs['ctx'].instance.runtime_properties['terraform_output'] = \
-                kwargs['tg'].terraform_output
+            store_payload(kwargs['ctx'], kwargs['tg'], 'terraform_output',
+                          kwargs['tg'].terraform_output)
+
+        if kwargs['tg'].provider_cache:
+            kwargs['ctx'].instance.runtime_properties['plugin_cache'] = \
+                kwargs['tg'].provider_cache.usage()
+
+        if kwargs['tg'].admission_controller:
+            kwargs['ctx'].instance.runtime_properties['admission'] = \
+                kwargs['tg'].admission_controller.metrics()
+
+        if kwargs['tg'].telemetry:
+            kwargs['ctx'].instance.runtime_properties['telemetry'] = \
+                kwargs['tg'].telemetry.summary()
         utils.cleanup_tfvars(kwargs)
     return wrapper
 
 
+def store_payload(ctx, tg, name, payload):
+    """Store payload in the runtime property name, of a plan only the
+    drifts, outputs and change summary. With compact_properties, store only
+    a summary and a digest there, and the payload itself in the node
+    instance directory, see Terragrunt.stored.
+    Runtime properties that did not change are not written again.
+    """
+    if isinstance(payload, PlanModel):
+        payload = payload.to_dict()
+    config = tg.resource_config.get('compact_properties')
+    if isinstance(config, dict) and config.get('enabled'):
+        digest = tg.artifacts.save(name, payload, payload_digest(payload))
+        if name == 'terraform_plan':
+            payload = compact_plan(
+                payload, digest,
+                config.get('max_addresses', DEFAULT_MAX_ADDRESSES))
+        else:
+            payload = compact_output(payload, digest)
+    elif name == 'terraform_plan':
+        payload = property_plan(payload)
+    if ctx.instance.runtime_properties.get(name) != payload:
+        ctx.instance.runtime_properties[name] = payload
+
+
+def store_plan_delta(ctx, tg, delta):
+    """Store what changed since the previous plan in the
+    terraform_plan_delta runtime property, and only a summary of the plan
+    in terraform_plan. With compact_properties the plan itself is still
+    kept in the node instance directory, see Terragrunt.stored.
+    """
+    plan = tg.terraform_plan
+    config = tg.resource_config.get('compact_properties')
+    if not isinstance(config, dict):
+        config = {}
+    summary = {
+        'digest': delta['digest'],
+        'change_summary': plan.get('change_summary', {}),
+        'drifted_count': delta['summary']['drifted'],
+        'planned_count': delta['summary']['planned']
+    }
+    if config.get('enabled'):
+        if isinstance(plan, PlanModel):
+            plan = plan.to_dict()
+        summary['digest'] = tg.artifacts.save(
+            'terraform_plan', plan, payload_digest(plan))
+    delta = compact_delta(
+        delta, config.get('max_addresses', DEFAULT_MAX_ADDRESSES))
+    for name, payload in [('terraform_plan', summary),
+                          ('terraform_plan_delta', delta)]:
+        if ctx.instance.runtime_properties.get(name) != payload:
+            ctx.instance.runtime_properties[name] = payload
+
+
 def skip_if_existing(func):
     @wraps(func)
     def f(*args, **kwargs):
@@ -12,11 +12,21 @@ from .constants import SUPPORTED_TG_COMMANDS_OPTIONS, SUPPORTED_TG_COMMANDS
 @operation
 @decorators.with_terragrunt
 def precreate(tg, **_):
-    utils.check_prerequistes()
-    tg.terragrunt_info()
-    tg.graph_dependencies()
-    tg.validate_inputs()
-    tg.plan()
+    # The checks are independent, and plan is started speculatively next
+    # to them. Its result is only kept if they pass. The only write that
+    # they share is the download of the terraform source to
+    # .terragrunt-cache, which terragrunt-info makes first. Once it is
+    # there, validate-inputs only reads it, and plan and its auto-init add
+    # .terraform and the lock file, so the two overlap.
+    utils.run_preflight([
+        ('check_prerequistes',
+         lambda: utils.check_prerequistes(tg.probe_cache)),
+        ('terragrunt_info', tg.terragrunt_info),
+        ('graph_dependencies', tg.graph_dependencies),
+        ('validate_inputs', tg.validate_inputs),
+        ('plan', tg.plan)
+    ], tg, after={'validate_inputs': ['terragrunt_info'],
+                  'plan': ['terragrunt_info']})
 
 
 @operation
@@ -63,24 +73,39 @@ def terragrunt_apply(tg, **_):
 
 @operation
 @decorators.with_terragrunt
+def terragrunt_drift(tg, report_id=None, timeout=None, **_):
+    utils.check_drift(tg, report_id, timeout)
+
+
+@operation
+def drift_report(ctx, report_id, report_path=None, store_report=True, **_):
+    report_path, report = utils.write_drift_report(
+        report_id, report_path, utils.get_resource_config())
+    ctx.instance.runtime_properties['drift_report_path'] = report_path
+    if store_report:
+        ctx.instance.runtime_properties['drift_report'] = report
+
+
+@operation
+@decorators.with_terragrunt(prewarm=True)
 def terragrunt_info(tg, **_):
     tg.terragrunt_info()
 
 
 @operation
-@decorators.with_terragrunt
+@decorators.with_terragrunt(prewarm=True)
 def validate_inputs(tg, **_):
     tg.validate_inputs()
 
 
 @operation
-@decorators.with_terragrunt
+@decorators.with_terragrunt(prewarm=True)
 def graph_dependencies(tg, **_):
     tg.graph_dependencies()
 
 
 @operation
-@decorators.with_terragrunt
+@decorators.with_terragrunt(prewarm=True)
 def render_json(tg, **_):
     tg.render_json()
 
@@ -135,9 +160,19 @@ def install(ctx, **_):
                         'installation will fail.'.format(
                             loc=executable_path))
 
-        binary_name = "terragrunt"
-        sdk_utils.install_binary(os.path.join(installation_dir, binary_name),
-                                 executable_path, installation_source)
+        binary_store = utils.get_binary_store(resource_config)
+        if binary_store and installation_source:
+            binary_store.install(
+                installation_source,
+                executable_path,
+                sdk_utils.download_file,
+                sha256=resource_config.get('installation_sha256') or None,
+                mode=resource_config.get('link_mode') or 'copy')
+        else:
+            binary_name = "terragrunt"
+            sdk_utils.install_binary(
+                os.path.join(installation_dir, binary_name),
+                executable_path, installation_source)
 
     ctx.instance.runtime_properties['executable_path'] = executable_path
 
@@ -147,7 +182,8 @@ def install(ctx, **_):
 def uninstall(ctx, **_):
     terragrunt_config = utils.get_terragrunt_config()
     resource_config = utils.get_resource_config(ctx)
-    exc_path = terragrunt_config.get('executable_path', '')
+    exc_path = terragrunt_config.get('executable_path') or \
+        ctx.instance.runtime_properties.get('executable_path', '')
     system_exc = resource_config.get('use_existing_resource')
 
     if os.path.isfile(exc_path):
@@ -158,4 +194,6 @@ def uninstall(ctx, **_):
         else:
             ctx.logger.info('Removing executable: {path}'.format(
                 path=exc_path))
-            os.remove(exc_path)
+            binary_store = utils.get_binary_store(resource_config)
+            if not binary_store or not binary_store.release(exc_path):
+                os.remove(exc_path)
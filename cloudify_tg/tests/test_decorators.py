@@ -1,4 +1,10 @@
+import os
+import shutil
+import tempfile
+
+from mock import MagicMock
 from cloudify.exceptions import NonRecoverableError
+from tg_sdk import Terragrunt
 
 from .. import decorators
 from . import mock_context, mock_terragrunt_from_ctx
@@ -52,3 +58,91 @@ def test_decorator_stores_runtime_props():
                    'terraform_plan'] == 'terraform_plan'
         assert kwargs['ctx'].instance.runtime_properties[
                    'terraform_output'] == 'terraform_output'
+
+
+def test_decorator_stores_plan():
+    ctx = mock_context('test_decorator_stores_plan',
+                       'test_decorator_stores_plan',
+                       {},
+                       {})
+    plan = {'change_summary': {'add': 1},
+            'resource_drifts': [{'resource': {'addr': 'aws_vpc.main'}}],
+            'planned_changes': [{'resource': {'addr': 'aws_vpc.main'}}],
+            'diagnostics': [{'severity': 'warning'}],
+            'outputs': []}
+    tg = Terragrunt({'resource_config': {}})
+    decorators.store_payload(ctx, tg, 'terraform_plan', plan)
+    assert ctx.instance.runtime_properties['terraform_plan'] == {
+        'change_summary': {'add': 1},
+        'resource_drifts': [{'resource': {'addr': 'aws_vpc.main'}}],
+        'outputs': []}
+
+
+def test_decorator_stores_compact_runtime_props():
+    cwd = tempfile.mkdtemp()
+    try:
+        ctx = mock_context('test_decorator_stores_compact_runtime_props',
+                           'test_decorator_stores_compact_runtime_props',
+                           {},
+                           {})
+        plan = {'change_summary': {'add': 1},
+                'resource_drifts': [{'resource': {'addr': 'aws_vpc.main'},
+                                     'before': {'cidr': 'x' * 1000}}]}
+        tg = Terragrunt({'resource_config': {
+            'compact_properties': {'enabled': True}}}, cwd=cwd)
+        decorators.store_payload(ctx, tg, 'terraform_plan', plan)
+        decorators.store_payload(ctx, tg, 'terraform_output',
+                                 {'vpc_id': {'value': 'vpc-1'}})
+        stored = ctx.instance.runtime_properties['terraform_plan']
+        assert stored['change_summary'] == {'add': 1}
+        assert stored['drifted'] == ['aws_vpc.main']
+        assert ctx.instance.runtime_properties['terraform_output'][
+            'outputs'] == ['vpc_id']
+        assert dict(tg.stored('terraform_plan', stored)) == plan
+        assert tg.stored('terraform_output')['vpc_id'] == {'value': 'vpc-1'}
+
+        # An unchanged plan is not written again.
+        path = tg.artifacts.path('terraform_plan', stored['digest'])
+        os.utime(path, (0, 0))
+        ctx.instance._runtime_properties = MagicMock(
+            get=lambda name: stored)
+        decorators.store_payload(ctx, tg, 'terraform_plan', dict(plan))
+        ctx.instance.runtime_properties.__setitem__.assert_not_called()
+        assert os.path.getmtime(path) == 0
+    finally:
+        shutil.rmtree(cwd)
+
+
+def test_decorator_stores_plan_delta():
+    cwd = tempfile.mkdtemp()
+    try:
+        ctx = mock_context('test_decorator_stores_plan_delta',
+                           'test_decorator_stores_plan_delta',
+                           {},
+                           {})
+        plan = {'change_summary': {'add': 1},
+                'resource_drifts': [{'resource': {'addr': 'aws_vpc.main'},
+                                     'action': 'update'}],
+                'planned_changes': [{'resource': {'addr': 'aws_vpc.main'},
+                                     'action': 'create'}]}
+        tg = Terragrunt({'resource_config': {
+            'plan_delta': True,
+            'compact_properties': {'enabled': True}}}, cwd=cwd)
+        tg._terraform_plan = plan
+        delta = tg.record_plan_delta(plan)
+        decorators.store_plan_delta(ctx, tg, delta)
+        stored = ctx.instance.runtime_properties['terraform_plan']
+        assert stored['change_summary'] == {'add': 1}
+        assert stored['drifted_count'] == 1
+        assert dict(tg.stored('terraform_plan', stored)) == plan
+        stored_delta = ctx.instance.runtime_properties['terraform_plan_delta']
+        assert stored_delta['new_drifts'] == [
+            {'address': 'aws_vpc.main', 'action': 'update'}]
+
+        delta = tg.record_plan_delta(plan)
+        decorators.store_plan_delta(ctx, tg, delta)
+        stored_delta = ctx.instance.runtime_properties['terraform_plan_delta']
+        assert stored_delta['new_drifts'] == []
+        assert not stored_delta['summary']['changed']
+    finally:
+        shutil.rmtree(cwd)
@@ -1,6 +1,13 @@
-from unittest.mock import patch
+import os
+import time
+import shutil
+import tempfile
+from unittest.mock import Mock, patch
 
-from .. import tasks
+from cloudify.state import current_ctx
+from cloudify.exceptions import NonRecoverableError
+
+from .. import tasks, utils
 from . import mock_context, mock_terragrunt_from_ctx
 
 
@@ -19,6 +26,29 @@ def test_precreate(*_):
         assert 'terraform_plan' in ctx.instance.runtime_properties
 
 
+@patch('cloudify_tg.utils.check_prerequistes')
+def test_precreate_fails_fast(check_prerequistes, *_):
+    ctx = mock_context('test_precreate_fails_fast',
+                       'test_precreate_fails_fast',
+                       {},
+                       {})
+    check_prerequistes.side_effect = NonRecoverableError('Git is not '
+                                                         'installed')
+    contexts = []
+    with mock_terragrunt_from_ctx() as tg:
+        tg.terragrunt_from_ctx().plan.side_effect = \
+            lambda: contexts.append(current_ctx.get_ctx())
+        try:
+            tasks.precreate(ctx=ctx)
+        except NonRecoverableError as e:
+            assert 'Failed applying' in str(e)
+        else:
+            raise RuntimeError('A failed preflight did not raise.')
+        tg.terragrunt_from_ctx().cancel.assert_called_once()
+        assert contexts in [[], [ctx]]
+        assert 'terraform_plan' not in ctx.instance.runtime_properties
+
+
 def test_create():
     ctx = mock_context('test_create',
                        'test_create',
@@ -27,6 +57,8 @@ def test_create():
     with mock_terragrunt_from_ctx() as tg:
         tasks.create(ctx=ctx)
         tg.terragrunt_from_ctx().apply.assert_called_once()
+        assert tg.terragrunt_from_ctx.call_args_list[0][1] == \
+            {'prewarm': False}
         assert 'terraform_plan' in ctx.instance.runtime_properties
 
 
@@ -104,6 +136,8 @@ def test_terragrunt_info():
     with mock_terragrunt_from_ctx() as tg:
         tasks.terragrunt_info(ctx=ctx)
         tg.terragrunt_from_ctx().terragrunt_info.assert_called_once()
+        # It does not run init, so it may start the prewarm.
+        assert tg.terragrunt_from_ctx.call_args_list[0][1] == {'prewarm': True}
         assert 'terraform_plan' in ctx.instance.runtime_properties
 
 
@@ -152,3 +186,43 @@ def test_run_command():
         tg.terragrunt_from_ctx().execute.assert_called_once()
         assert tg._command_options != {}
         assert 'terraform_plan' in ctx.instance.runtime_properties
+
+
+def test_terragrunt_drift():
+    ctx = mock_context('test_terragrunt_drift',
+                       'test_terragrunt_drift',
+                       {},
+                       {})
+    with mock_terragrunt_from_ctx() as tg:
+        tg.terragrunt_from_ctx().drift.return_value = {}
+        tasks.terragrunt_drift(ctx=ctx, timeout=30)
+        tg.terragrunt_from_ctx().drift.assert_called_once()
+        assert 0 < tg.terragrunt_from_ctx().deadline - time.time() <= 30
+        assert ctx.instance.runtime_properties['drift'] == {
+            'status': 'clean'}
+
+
+@patch('cloudify_tg.utils.get_resource_config')
+def test_drift_report(get_resource_config):
+    cache_dir = tempfile.mkdtemp()
+    try:
+        ctx = mock_context('test_drift_report',
+                           'test_drift_report',
+                           {},
+                           {})
+        get_resource_config.return_value = {'cache_dir': cache_dir}
+        tg = Mock(resource_config={'cache_dir': cache_dir})
+        tg.drift.side_effect = RuntimeError('Error: no credentials')
+        utils.check_drift(tg, report_id='execution')
+        assert ctx.instance.runtime_properties['drift']['status'] == 'failed'
+        tasks.drift_report(ctx=ctx, report_id='execution')
+        path = ctx.instance.runtime_properties['drift_report_path']
+        assert path == os.path.join(cache_dir, 'drift', 'execution.json')
+        report = ctx.instance.runtime_properties['drift_report']
+        assert report['summary']['failed'] == 1
+        assert report['stacks'][ctx.instance.id]['error'] == \
+            'Error: no credentials'
+        assert not os.path.exists(os.path.join(cache_dir, 'drift',
+                                               'execution'))
+    finally:
+        shutil.rmtree(cache_dir)
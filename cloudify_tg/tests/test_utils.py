@@ -1,11 +1,15 @@
 import os
+import json
+import shutil
 import tempfile
+from subprocess import check_call, check_output
 
-from mock import patch
+from mock import Mock, patch
 
 from . import mock_context
 from .. import utils
 from tg_sdk import Terragrunt
+from tg_sdk.sources import SOURCE_MANIFEST_FILE
 
 from cloudify.exceptions import NonRecoverableError
 
@@ -122,21 +126,115 @@ def test_terragrunt_from_ctx(mock_ctx_node,
     os.removedirs(node_instance_dir)
 
 
-@patch('cloudify_tg.utils.copy_directory')
+@patch('cloudify_tg.utils.download_terragrunt_source')
+@patch('cloudify_tg.utils.configure_ctx')
+@patch('cloudify_tg.utils.get_node_instance_dir')
+@patch('cloudify_tg.utils.get_ctx_instance')
+@patch('cloudify_tg.utils.get_ctx_node')
+def test_terragrunt_from_ctx_properties(mock_ctx_node,
+                                        mock_ctx_instance,
+                                        mock_node_instance_dir, *_):
+    node_instance_dir = tempfile.mkdtemp()
+    mock_node_instance_dir.return_value = node_instance_dir
+    # The defaults of plugin.yaml.
+    resource_config = {
+        'source': {'location': 'foo'},
+        'source_path': '',
+        'singleflight': False,
+        'plan_delta': False,
+        'admission': {'enabled': False}
+    }
+    properties = {'resource_config': resource_config}
+    runtime_properties = {'resource_config': dict(resource_config)}
+    ctx = mock_context('test_terragrunt_from_ctx_properties',
+                       'test_terragrunt_from_ctx_properties',
+                       properties,
+                       runtime_properties)
+    mock_ctx_node.return_value = ctx.node
+    mock_ctx_instance.return_value = ctx.instance
+    try:
+        tg = utils.terragrunt_from_ctx({'ctx': ctx})
+        assert isinstance(tg, Terragrunt)
+        assert tg.singleflight is None
+        assert tg.cwd == node_instance_dir
+    finally:
+        shutil.rmtree(node_instance_dir)
+
+
+def test_get_cache_dir():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        path = utils.get_cache_dir('providers', {'cache_dir': cache_dir})
+        assert path == os.path.join(cache_dir, 'providers')
+        assert os.stat(path).st_mode & 0o777 == 0o700
+        os.chmod(cache_dir, 0o777)
+        try:
+            utils.get_cache_dir('providers', {'cache_dir': cache_dir})
+            assert False
+        except NonRecoverableError as e:
+            assert 'written by other users' in str(e)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_run_command():
+    directory = tempfile.mkdtemp()
+    try:
+        logger = Mock()
+        tg = Terragrunt({'resource_config': {
+                            'environment_variables': {'TG_TEST': 'value'}}},
+                        logger=logger,
+                        executor=utils.run_command,
+                        cwd=directory)
+        output = tg._execute(
+            ['sh', '-c', 'echo "$TG_TEST"; echo warning >&2'], name='plan')
+        assert output == 'value'
+        logger.info.assert_called_with('value')
+        record, = tg.telemetry.records
+        assert record['stderr_bytes'] == len('warning\n')
+        assert record['max_rss'] > 0
+        logger.debug.assert_any_call('warning')
+        logger.error.assert_not_called()
+        try:
+            tg._execute(['sh', '-c', 'echo failed >&2; exit 3'], name='plan')
+            assert False
+        except NonRecoverableError:
+            pass
+        message, = logger.error.call_args[0]
+        assert 'exit code 3' in message and 'failed' in message
+    finally:
+        shutil.rmtree(directory)
+
+
+@patch('cloudify_tg.utils.sync_tree', return_value=({}, []))
 @patch('cloudify_tg.utils.remove_directory')
 @patch('cloudify_tg.utils.download_source')
-@patch('cloudify_common_sdk.utils.get_node_instance_dir')
-def test_download_terragrunt_source(mock_cp, mock_rm, *_):
-    source = 'foobar'
+@patch('cloudify_tg.utils.source_revision', return_value='etag:"1"')
+def test_download_terragrunt_source(_, mock_download, mock_rm, mock_sync):
+    source = 'https://foo/bar.zip'
     target = tempfile.mkdtemp()
     test_source_tmp_path = tempfile.mkdtemp()
+    mock_download.return_value = test_source_tmp_path
+    mock_context('test_download_terragrunt_source',
+                 'test_download_terragrunt_source',
+                 {},
+                 {})
     try:
         utils.download_terragrunt_source(source, target)
-        assert mock_cp.called_once_with(test_source_tmp_path, target)
-        assert mock_rm.called_once_with(test_source_tmp_path)
+        mock_sync.assert_called_once_with(test_source_tmp_path, target, None)
+        mock_rm.assert_called_once_with(test_source_tmp_path)
+        with open(os.path.join(target, SOURCE_MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        assert manifest['location'] == source
+        assert manifest['revision'] == 'etag:"1"'
+        # The manifest records the revision, so nothing is downloaded or
+        # synced again.
+        utils.download_terragrunt_source(source, target)
+        mock_download.assert_called_once()
+        mock_sync.assert_called_once()
     finally:
-        os.rmdir(test_source_tmp_path)
-        os.rmdir(target)
+        shutil.rmtree(test_source_tmp_path)
+        shutil.rmtree(target)
 
 
 def test_get_terragrunt_source_config():
@@ -200,3 +298,142 @@ def test_cleanup_old_terragrunt_source():
         utils.cleanup_old_terragrunt_source()
 
     assert len(os.listdir(node_instance_dir)) == 0
+
+
+@patch('cloudify_tg.utils.source_revision', return_value='etag:"1"')
+@patch('cloudify_tg.utils.download_source')
+def test_download_terragrunt_source_cached(mock_download, *_):
+    cache_dir = tempfile.mkdtemp()
+    downloads = tempfile.mkdtemp()
+
+    def download(source, target_directory, logger):
+        path = tempfile.mkdtemp(dir=downloads)
+        with open(os.path.join(path, 'terragrunt.hcl'), 'w') as f:
+            f.write(source)
+        return path
+
+    mock_download.side_effect = download
+    resource_config = {
+        'cache_dir': cache_dir,
+        'source_cache': {'enabled': True, 'link_mode': 'hardlink'}
+    }
+    mock_context('test_download_terragrunt_source_cached',
+                 'test_download_terragrunt_source_cached',
+                 {},
+                 {})
+    targets = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+    try:
+        for target in targets:
+            utils.download_terragrunt_source(
+                'https://foo/bar.zip', target, resource_config)
+            assert os.path.exists(os.path.join(target, 'terragrunt.hcl'))
+        mock_download.assert_called_once()
+        assert os.stat(os.path.join(targets[0], 'terragrunt.hcl')).st_ino == \
+            os.stat(os.path.join(targets[1], 'terragrunt.hcl')).st_ino
+    finally:
+        for path in targets + [cache_dir, downloads]:
+            shutil.rmtree(path)
+
+
+def _git_commit(repository, content):
+    with open(os.path.join(repository, 'terragrunt.hcl'), 'w') as f:
+        f.write(content)
+    check_call(['git', '-C', repository, 'add', '-A'])
+    check_call(['git', '-C', repository, '-c', 'user.name=test',
+                '-c', 'user.email=test@example.com',
+                'commit', '--quiet', '-m', content])
+    return check_output(
+        ['git', '-C', repository, 'rev-parse', 'HEAD']).decode().strip()
+
+
+@patch('cloudify_tg.utils.source_revision')
+def test_download_terragrunt_source_cached_git(mock_revision):
+    directory = tempfile.mkdtemp()
+    try:
+        origin = os.path.join(directory, 'origin')
+        check_call(['git', 'init', '--quiet', '-b', 'main', origin])
+        first = _git_commit(origin, 'first')
+        # The branch moves after its revision was resolved.
+        mock_revision.return_value = first
+        second = _git_commit(origin, 'second')
+        resource_config = {
+            'cache_dir': os.path.join(directory, 'cache'),
+            'source_cache': {'enabled': True}
+        }
+        mock_context('test_download_terragrunt_source_cached_git',
+                     'test_download_terragrunt_source_cached_git',
+                     {},
+                     {})
+        target = os.path.join(directory, 'target')
+        utils.download_terragrunt_source(
+            {'location': 'git::file://{}?ref=main'.format(origin)},
+            target, resource_config)
+        with open(os.path.join(target, 'terragrunt.hcl')) as f:
+            assert f.read() == 'second'
+        with open(os.path.join(target, SOURCE_MANIFEST_FILE)) as f:
+            assert json.load(f)['revision'] == second
+        source_cache = utils.get_source_cache(resource_config)
+        location = 'git::file://{}?ref=main'.format(origin)
+        assert source_cache.get(utils.cache_key(location, second))
+        assert not source_cache.get(utils.cache_key(location, first))
+    finally:
+        shutil.rmtree(directory)
+
+
+@patch('cloudify_tg.utils.remove_directory', side_effect=shutil.rmtree)
+@patch('cloudify_tg.utils.source_revision')
+@patch('cloudify_tg.utils.download_source')
+def test_download_terragrunt_source_refresh(mock_download, mock_revision, _):
+    target = tempfile.mkdtemp()
+
+    def download(source, target_directory, logger):
+        path = tempfile.mkdtemp(dir=target_directory)
+        with open(os.path.join(path, 'terragrunt.hcl'), 'w') as f:
+            f.write(mock_revision.return_value)
+        with open(os.path.join(path, 'main.tf'), 'w') as f:
+            f.write('main')
+        return path
+
+    mock_download.side_effect = download
+    mock_context('test_download_terragrunt_source_refresh',
+                 'test_download_terragrunt_source_refresh',
+                 {},
+                 {})
+    try:
+        mock_revision.return_value = 'aaaa'
+        utils.download_terragrunt_source('git@foo:bar.git', target)
+        os.makedirs(os.path.join(target, '.terragrunt-cache', 'x'))
+        main = os.stat(os.path.join(target, 'main.tf'))
+        # Unchanged, nothing is downloaded.
+        utils.download_terragrunt_source('git@foo:bar.git', target)
+        assert mock_download.call_count == 1
+
+        mock_revision.return_value = 'bbbb'
+        utils.download_terragrunt_source('git@foo:bar.git', target)
+        assert mock_download.call_count == 2
+        with open(os.path.join(target, 'terragrunt.hcl')) as f:
+            assert f.read() == 'bbbb'
+        assert os.stat(os.path.join(target, 'main.tf')).st_ino == \
+            main.st_ino
+        assert os.path.isdir(os.path.join(target, '.terragrunt-cache', 'x'))
+        assert sorted(os.listdir(target)) == [
+            '.terragrunt-cache', '.tg_source.json', 'main.tf',
+            'terragrunt.hcl']
+    finally:
+        shutil.rmtree(target)
+
+
+def test_get_sparse_paths():
+    source = {'location': 'git::https://host/repo.git?ref=v1',
+              'sparse': True,
+              'sparse_paths': ['modules']}
+    assert utils.get_sparse_paths(source, 'live/app/', '/work') == \
+        {'source_path': 'live/app', 'extra': ['modules']}
+    assert utils.get_sparse_paths(source, '/work/live', '/work') == \
+        {'source_path': 'live', 'extra': ['modules']}
+    assert utils.get_sparse_paths(source, '', '/work') == \
+        {'source_path': '', 'extra': ['modules']}
+    assert utils.get_sparse_paths(
+        dict(source, sparse=False), 'live', '/work') is None
+    assert utils.get_sparse_paths(
+        dict(source, location='https://host/a.zip'), 'live', '/work') is None
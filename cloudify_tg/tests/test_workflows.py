@@ -0,0 +1,187 @@
+from mock import Mock, patch
+from cloudify.workflows import tasks
+from cloudify.workflows.tasks_graph import TaskDependencyGraph
+
+from .. import workflows
+
+
+def mock_instance(ctx, instance_id, *targets):
+    instance = Mock(id=instance_id)
+    instance.node.id = instance_id.split('_')[0]
+    instance.relationships = [
+        Mock(target_node_instance=target,
+             relationship=Mock(_relationship={workflows.HIERARCHY: []}))
+        for target in targets]
+    for relationship in instance.relationships:
+        relationship.target_node_instance.state = 'started'
+    instance.execute_operation.side_effect = \
+        lambda *_, **__: tasks.NOPLocalWorkflowTask(ctx)
+    return instance
+
+
+def mock_workflow_ctx():
+    """vpc <- db <- app, through a non stack network instance for app,
+    and an unrelated dns."""
+    ctx = Mock()
+    vpc = mock_instance(ctx, 'vpc_1')
+    db = mock_instance(ctx, 'db_1', vpc)
+    network = mock_instance(ctx, 'network_1', db)
+    app = mock_instance(ctx, 'app_1', network)
+    dns = mock_instance(ctx, 'dns_1')
+    ctx.node_instances = [vpc, db, network, app, dns]
+    return ctx
+
+
+def subgraph_dependencies(graph, subgraphs):
+    ids = {s: i for i, s in subgraphs.items()}
+    return {i: {ids[d] for d in graph._dependencies[s] if d in ids}
+            for i, s in subgraphs.items()}
+
+
+def stack_subgraphs(graph):
+    return {t.info['instance_id']: t for t in graph.tasks
+            if t.is_subgraph and 'instance_id' in t.info}
+
+
+def test_stack_dependencies():
+    ctx = mock_workflow_ctx()
+    stacks = [i for i in ctx.node_instances if i.id != 'network_1']
+    assert workflows.stack_dependencies(stacks) == {
+        'vpc_1': set(),
+        'db_1': {'vpc_1'},
+        'app_1': {'db_1'},
+        'dns_1': set()
+    }
+
+
+def test_concurrency_lanes():
+    order = ['a', 'b', 'c', 'd', 'e']
+    assert workflows.concurrency_lanes(order, 0) == []
+    assert workflows.concurrency_lanes(order, 5) == []
+    assert workflows.concurrency_lanes(order, 2) == \
+        [('c', 'a'), ('d', 'b'), ('e', 'c')]
+
+
+def test_execute_operation_graph():
+    ctx = mock_workflow_ctx()
+    graph = TaskDependencyGraph(ctx)
+    failed = workflows.execute_operation(
+        None,
+        ['vpc_1', 'db_1', 'app_1', 'dns_1'],
+        ctx,
+        graph,
+        'terragrunt.terragrunt_plan',
+        {},
+        max_concurrency=2)
+    assert failed == {}
+    subgraphs = stack_subgraphs(graph)
+    # In order dns_1, vpc_1, db_1, app_1, so db_1 also waits for dns_1
+    # and app_1 for vpc_1 to run two at a time.
+    assert subgraph_dependencies(graph, subgraphs) == {
+        'dns_1': set(),
+        'vpc_1': set(),
+        'db_1': {'vpc_1', 'dns_1'},
+        'app_1': {'db_1', 'vpc_1'}
+    }
+    for subgraph in subgraphs.values():
+        assert len(subgraph.tasks) == 1
+
+
+def test_execute_operation_failure():
+    ctx = mock_workflow_ctx()
+    graph = TaskDependencyGraph(ctx)
+    failed = workflows.execute_operation(
+        None,
+        ['vpc_1', 'db_1', 'app_1', 'dns_1'],
+        ctx,
+        graph,
+        'terragrunt.terragrunt_plan',
+        {},
+        max_concurrency=0)
+    subgraphs = stack_subgraphs(graph)
+    result = subgraphs['vpc_1'].on_failure(subgraphs['vpc_1'])
+    assert result.action == tasks.HandlerResult.HANDLER_IGNORE
+    assert failed == {'vpc_1': {'db_1', 'app_1'}}
+    assert set(stack_subgraphs(graph)) == {'vpc_1', 'dns_1'}
+
+
+def test_execute_operation_fail_fast():
+    ctx = mock_workflow_ctx()
+    graph = TaskDependencyGraph(ctx)
+    failed = workflows.execute_operation(
+        None,
+        ['vpc_1', 'db_1', 'app_1', 'dns_1'],
+        ctx,
+        graph,
+        'terragrunt.terragrunt_plan',
+        {},
+        fail_fast=True)
+    subgraphs = stack_subgraphs(graph)
+    subgraphs['vpc_1'].set_state(tasks.TASK_FAILED)
+    subgraphs['dns_1'].set_state(tasks.TASK_STARTED)
+    result = subgraphs['vpc_1'].on_failure(subgraphs['vpc_1'])
+    assert result.action == tasks.HandlerResult.HANDLER_FAIL
+    assert failed == {}
+    assert set(stack_subgraphs(graph)) == {'vpc_1', 'dns_1'}
+
+
+def test_execute_operation_starts_binary_once():
+    ctx = mock_workflow_ctx()
+    binary = mock_instance(ctx, 'terraform_1')
+    binary.state = 'uninitialized'
+    binary.set_state.side_effect = \
+        lambda *_, **__: tasks.NOPLocalWorkflowTask(ctx)
+    stacks = [mock_instance(ctx, 'vpc_1'), mock_instance(ctx, 'dns_1')]
+    for stack in stacks:
+        relationship = Mock(
+            target_node_instance=binary,
+            relationship=Mock(
+                _relationship={workflows.HIERARCHY: [workflows.REL]}))
+        relationship.execute_source_operation.side_effect = \
+            lambda *_, **__: tasks.NOPLocalWorkflowTask(ctx)
+        stack.relationships = [relationship]
+    ctx.node_instances = stacks + [binary]
+    graph = TaskDependencyGraph(ctx)
+    workflows.execute_operation(
+        None,
+        ['vpc_1', 'dns_1'],
+        ctx,
+        graph,
+        'terragrunt.terragrunt_plan',
+        {})
+    binary.execute_operation.assert_called_once_with(workflows.CREATE)
+    start, = [t for t in graph.tasks
+              if t.is_subgraph and 'instance_id' not in t.info]
+    for subgraph in stack_subgraphs(graph).values():
+        assert start in graph._dependencies[subgraph]
+        # The relationship's preconfigure and the operation.
+        assert len(subgraph.tasks) == 2
+
+
+@patch('cloudify_tg.workflows._execute_graph')
+def test_terragrunt_drift_graph(execute_graph):
+    ctx = mock_workflow_ctx()
+    ctx.execution_id = 'execution'
+    graph = TaskDependencyGraph(ctx)
+    ctx.graph_mode.return_value = graph
+    workflows.terragrunt_drift(
+        ctx,
+        node_instance_ids=['vpc_1', 'db_1', 'app_1', 'dns_1'],
+        timeout=60)
+    execute_graph.assert_called_once_with(graph, {})
+    subgraphs = stack_subgraphs(graph)
+    assert set(subgraphs) == {'vpc_1', 'db_1', 'app_1', 'dns_1'}
+    report, = [t for t in graph.tasks if not t.containing_subgraph and
+               not t.is_subgraph]
+    assert set(graph._dependencies[report]) == set(subgraphs.values())
+    vpc = ctx.node_instances[0]
+    operation, = [c for c in vpc.execute_operation.call_args_list
+                  if c[0][0] == 'terragrunt.terragrunt_drift']
+    assert operation[1]['kwargs']['report_id'] == 'execution'
+    assert operation[1]['kwargs']['timeout'] == 60
+    vpc.execute_operation.assert_called_with(
+        'terragrunt.drift_report',
+        kwargs={'report_id': 'execution',
+                'report_path': '',
+                'store_report': True},
+        allow_kwargs_override=True)
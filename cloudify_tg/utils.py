@@ -1,15 +1,20 @@
 import os
+import json
+import time
+import shutil
+import tempfile
 from sys import exc_info
+from functools import partial
 from shutil import rmtree
 
 from cloudify import utils as cfy_utils
 from cloudify import ctx as ctx_from_imports
+from cloudify.state import current_ctx
 from script_runner.tasks import ProcessException
 from cloudify.exceptions import NonRecoverableError
 from cloudify_common_sdk.utils import (
     get_ctx_node,
     run_subprocess,
-    copy_directory,
     find_rel_by_type,
     get_ctx_instance,
     remove_directory,
@@ -23,6 +28,44 @@ from cloudify_common_sdk.secure_property_management import (
 )
 
 from tg_sdk import Terragrunt
+from tg_sdk.utils import basic_executor, convert_secrets
+from tg_sdk.probe import get_probe_cache
+from tg_sdk.preflight import Preflight
+from tg_sdk.cache import (
+    LRUCache,
+    cache_key,
+    sync_tree,
+    tree_digest,
+    private_directory
+)
+from tg_sdk.providers import ProviderCache
+from tg_sdk.admission import AdmissionController
+from tg_sdk.drift import DriftReport, stack_drift
+from tg_sdk.telemetry import TELEMETRY_FILE, Telemetry
+from tg_sdk.fingerprint import FingerprintIndex
+from tg_sdk.binaries import BinaryStore
+from tg_sdk.repositories import GitCache
+from tg_sdk.singleflight import SingleFlight
+from tg_sdk.sources import (
+    SOURCE_MANIFEST_FILE,
+    is_git_source,
+    source_location,
+    source_revision
+)
+
+from .constants import (
+    DEFAULT_CACHE_DIR,
+    DRIFT_DIR,
+    ADMISSION_DIR,
+    BINARY_STORE_DIR,
+    DRIFT_ERROR_LENGTH,
+    GIT_CACHE_DIR,
+    SOURCE_CACHE_DIR,
+    SINGLEFLIGHT_DIR,
+    PROVIDER_CACHE_DIR,
+    DEFAULT_SOURCE_CACHE_SIZE,
+    DEFAULT_PROVIDER_CACHE_SIZE
+)
 
 try:
     from cloudify.constants import RELATIONSHIP_INSTANCE, NODE_INSTANCE
@@ -136,7 +179,7 @@ def validate_resource_config():
                 location = source
             else:
                 return False
-            if location.endswith('.zip') or 'git@' in location:
+            if location.endswith('.zip') or is_git_source(location):
                 return True
             else:
                 return False
@@ -155,7 +198,68 @@ def validate_resource_config():
     ctx_from_imports.logger.info('The provided resource_config is valid.')
 
 
-def terragrunt_from_ctx(kwargs):
+def run_command(command,
+                logger=None,
+                cwd=None,
+                additional_env=None,
+                masked_env_vars=None,
+                return_output=True,
+                **kwargs):
+    """The executor of Terragrunt commands, in place of run_subprocess: it
+    runs the command with the executor of tg_sdk, which streams the output
+    and reaps the process with wait4, so that its peak memory and stderr
+    volume are recorded in the telemetry. stderr, where Terragrunt writes
+    its own logs, is logged at debug, and the last output of a command
+    that fails at error.
+
+    :param command: list
+    :param logger: logger, defaults to the operation logger.
+    :param cwd: str, defaults to the node instance directory.
+    :param additional_env: dict, on top of the environment of this
+        process.
+    :param masked_env_vars: list, unused: only the names of the
+        variables are logged.
+    :param return_output: bool, whether stdout is logged.
+    :return: str, or the StreamingProcess with stream=True.
+    """
+    logger = logger or ctx_from_imports.logger
+    cwd = cwd or get_node_instance_dir()
+    additional_env = convert_secrets(additional_env or {})
+    logger.debug('Running: command={c}, cwd={d}, env={e}'.format(
+        c=command, d=cwd, e=sorted(additional_env)))
+    if return_output:
+        kwargs.setdefault('on_stdout', logger.info)
+    kwargs.setdefault('on_stderr', logger.debug)
+    on_complete = kwargs.get('on_complete')
+
+    def log_failure(result):
+        if result.returncode:
+            logger.error(
+                'The command failed with exit code {r}. Last output:\n'
+                '{t}'.format(r=result.returncode, t='\n'.join(result.tail)))
+        if on_complete:
+            on_complete(result)
+
+    kwargs['on_complete'] = log_failure
+    return basic_executor(command,
+                          cwd=cwd,
+                          additional_env=additional_env,
+                          **kwargs)
+
+
+run_command.supports_streaming = True
+
+
+def terragrunt_from_ctx(kwargs, prewarm=False):
+    """Build the Terragrunt object of the operation, downloading the source
+    to the node instance directory if it is not there yet.
+
+    :param kwargs: dict, the operation inputs.
+    :param prewarm: bool, start the background init of the prewarm
+        property once the source is in place. The operation must not run
+        init itself.
+    :return: Terragrunt
+    """
     _ctx = kwargs.get('ctx')
     ctx_node = get_ctx_node(_ctx)
     ctx_instance = get_ctx_instance(_ctx)
@@ -165,13 +269,21 @@ def terragrunt_from_ctx(kwargs):
 
     # configure_binaries()
     ctx_from_imports.logger.info('Initializing Terragrunt interface...')
-    tg = Terragrunt(
-        ctx_node.properties,
+    resource_config = ctx_instance.runtime_properties['resource_config']
+    tg_kwargs = dict(
         logger=ctx.logger,
-        executor=run_subprocess,
+        executor=run_command,
         cwd=get_node_instance_dir(),
-        **ctx_instance.runtime_properties['resource_config']
-    )
+        provider_cache=get_provider_cache(resource_config),
+        admission_controller=get_admission_controller(resource_config),
+        singleflight=get_singleflight(resource_config),
+        telemetry=Telemetry(os.path.join(node_instance_dir, TELEMETRY_FILE),
+                            ctx_from_imports.logger))
+    # The singleflight property is replaced by the SingleFlight it
+    # enables.
+    tg_kwargs.update((k, v) for k, v in resource_config.items()
+                     if k not in tg_kwargs)
+    tg = Terragrunt(ctx_node.properties, **tg_kwargs)
     if kwargs.get('destroy', False):
         call_tg(tg, 'destroy')
     source_kwargs = kwargs.get('source')
@@ -182,7 +294,9 @@ def terragrunt_from_ctx(kwargs):
             'Downloading new Terragrunt stack to workspace...')
         if source_kwargs:
             tg.source = source_kwargs
-        download_terragrunt_source(tg.source, node_instance_dir)
+        download_terragrunt_source(
+            tg.source, node_instance_dir, tg.resource_config,
+            source_path_kwargs or tg.resource_config.get('source_path'))
         if source_path_kwargs:
             tg.source_path = source_path_kwargs
         abs_source_path = ''
@@ -196,6 +310,9 @@ def terragrunt_from_ctx(kwargs):
             tg.source
         ctx_instance.runtime_properties['resource_config']['source_path'] = \
             tg.source_path
+    if prewarm and isinstance(resource_config, dict) and \
+            resource_config.get('prewarm'):
+        tg.start_prewarm()
     return tg
 
 
@@ -210,16 +327,261 @@ def call_tg(tg, callable_name):
             causes=[cfy_utils.exception_to_error_cause(ex, tb)])
 
 
-def download_terragrunt_source(source, target):
+def download_terragrunt_source(source, target, resource_config=None,
+                               source_path=None):
     """Replace the terraform_source material with a new material.
-    This is used in terraform.reload_template operation."""
+    This is used in terraform.reload_template operation.
+
+    Nothing is downloaded while the source is at the revision that target
+    was last synced to. Otherwise only the files that differ are written,
+    and the .terragrunt-cache and .terraform directories are kept, so a
+    refresh does not throw the warm caches away.
+
+    :param source_path: str, the stack's directory in the source, which a
+        sparse git source is restricted to.
+    """
     ctx_from_imports.logger.info(
         'Using this cloudify.types.terragrunt.SourceSpecification '
         '{source}.'.format(source=source))
-    source_tmp_path = download_source(
-        source, target, ctx_from_imports.logger)
-    copy_directory(source_tmp_path, target)
-    remove_directory(source_tmp_path)
+    manifest_index = FingerprintIndex(
+        os.path.join(target, SOURCE_MANIFEST_FILE), ctx_from_imports.logger)
+    previous = manifest_index.load()
+    location, _, _ = source_location(source)
+    revision = source_revision(source, ctx_from_imports.logger)
+    sparse_paths = get_sparse_paths(source, source_path, target)
+    if revision and previous.get('location') == location and \
+            previous.get('revision') == revision and \
+            previous.get('sparse_paths') == sparse_paths:
+        ctx_from_imports.logger.info(
+            'The source is unchanged at revision {r}, keeping the '
+            'workspace.'.format(r=revision))
+        return
+    source_cache = get_source_cache(resource_config)
+    if sparse_paths is not None:
+        files, changed, revision = download_sparse_source(
+            source, target, resource_config, sparse_paths, revision,
+            previous.get('files'))
+    elif source_cache:
+        link_mode = resource_config['source_cache'].get(
+            'link_mode') or 'reflink'
+        files, changed, revision = download_cached_source(
+            source, target, source_cache, link_mode,
+            revision, previous.get('files'), resource_config)
+    else:
+        source_tmp_path = download_source(
+            source, target, ctx_from_imports.logger)
+        try:
+            files, changed = sync_tree(
+                source_tmp_path, target, previous.get('files'))
+        finally:
+            remove_directory(source_tmp_path)
+    ctx_from_imports.logger.info(
+        'Synced {c} of the {n} files of the source.'.format(
+            c=len(changed), n=len(files)))
+    manifest_index.save({'location': location,
+                         'revision': revision,
+                         'sparse_paths': sparse_paths,
+                         'files': files})
+
+
+def get_sparse_paths(source, source_path, target):
+    """What a sparse git source is restricted to.
+
+    :return: dict with the source_path relative to the repository root and
+        the extra sparse_paths, or None if the source is not sparse.
+    """
+    location, _, _ = source_location(source)
+    if not isinstance(source, dict) or not source.get('sparse') or \
+            not is_git_source(location):
+        return
+    source_path = source_path or ''
+    if os.path.isabs(source_path):
+        source_path = os.path.relpath(source_path, target) \
+            if source_path.startswith(target) else ''
+    source_path = os.path.normpath(source_path or '.').strip('/')
+    return {'source_path': '' if source_path == '.' else source_path,
+            'extra': sorted(source.get('sparse_paths') or [])}
+
+
+def download_sparse_source(source, target, resource_config, sparse_paths,
+                           revision=None, previous=None):
+    """Sync target with a depth 1 fetch of a git source, restricted to the
+    stack's directory, the .hcl files it may include from the directories
+    above and the extra sparse_paths. The fetched objects are kept in a
+    bare repository per URL that every deployment on the manager shares.
+
+    :param sparse_paths: dict, see get_sparse_paths.
+    :param revision: str, the commit, if it was already resolved.
+    :param previous: dict, the manifest of the previous sync of target.
+    :return: (manifest, changed, revision)
+    """
+    location, username, password = source_location(source)
+    git_cache = GitCache(get_cache_dir(GIT_CACHE_DIR, resource_config),
+                         logger=ctx_from_imports.logger)
+    revision = git_cache.fetch(location, username, password, revision)
+    export_dir = tempfile.mkdtemp()
+    try:
+        git_cache.export(location,
+                         revision,
+                         export_dir,
+                         sparse_paths['source_path'],
+                         sparse_paths['extra'])
+        files, changed = sync_tree(export_dir, target, previous)
+    finally:
+        rmtree(export_dir, ignore_errors=True)
+    return files, changed, revision
+
+
+def get_cache_dir(name, resource_config=None):
+    """The cache directory called name, created private to the agent user.
+
+    :raises NonRecoverableError: if another user could change it.
+    """
+    root = os.path.expanduser(
+        (resource_config or {}).get('cache_dir') or DEFAULT_CACHE_DIR)
+    private_directory(root)
+    path = os.path.join(root, name)
+    private_directory(path)
+    return path
+
+
+def get_source_cache(resource_config=None):
+    """The shared source cache, if the source_cache resource_config
+    property enables it.
+
+    :return: LRUCache or None
+    """
+    config = (resource_config or {}).get('source_cache') or {}
+    if not config.get('enabled'):
+        return
+    max_size = config.get('max_size', DEFAULT_SOURCE_CACHE_SIZE)
+    return LRUCache(get_cache_dir(SOURCE_CACHE_DIR, resource_config),
+                    max_size=max_size * 1024 * 1024 if max_size else None,
+                    logger=ctx_from_imports.logger)
+
+
+def get_binary_store(resource_config=None):
+    """The store of installed binaries shared by the deployments of the
+    agent user, if the shared_store resource_config property enables it.
+
+    :return: BinaryStore or None
+    """
+    resource_config = resource_config or {}
+    if not resource_config.get('shared_store', False):
+        return
+    return BinaryStore(get_cache_dir(BINARY_STORE_DIR, resource_config),
+                       logger=ctx_from_imports.logger)
+
+
+def get_singleflight(resource_config=None):
+    """Where identical concurrent read-only commands share one execution,
+    if the singleflight resource_config property enables it.
+
+    :return: SingleFlight or None
+    """
+    if not isinstance(resource_config, dict) or \
+            not resource_config.get('singleflight'):
+        return
+    return SingleFlight(get_cache_dir(SINGLEFLIGHT_DIR, resource_config),
+                        logger=ctx_from_imports.logger)
+
+
+def get_provider_cache(resource_config=None):
+    """The shared Terraform plugin cache, if the plugin_cache
+    resource_config property enables it.
+
+    :return: ProviderCache or None
+    """
+    config = (resource_config or {}).get('plugin_cache') or {}
+    if not isinstance(config, dict) or not config.get('enabled'):
+        return
+    max_size = config.get('max_size', DEFAULT_PROVIDER_CACHE_SIZE)
+    return ProviderCache(get_cache_dir(PROVIDER_CACHE_DIR, resource_config),
+                         max_size=max_size * 1024 * 1024 if max_size else None,
+                         mirror=config.get('mirror') or None,
+                         logger=ctx_from_imports.logger)
+
+
+def get_admission_controller(resource_config=None):
+    """The manager wide admission controller, if the admission
+    resource_config property enables it.
+
+    :return: AdmissionController or None
+    """
+    config = (resource_config or {}).get('admission') or {}
+    if not isinstance(config, dict) or not config.get('enabled'):
+        return
+    return AdmissionController(
+        get_cache_dir(ADMISSION_DIR, resource_config),
+        slots=config.get('slots') or None,
+        weights=config.get('weights'),
+        memory_budget=config.get('memory_budget') or None,
+        slot_memory=config.get('slot_memory'),
+        timeout=config.get('timeout') or None,
+        logger=ctx_from_imports.logger)
+
+
+def download_source_into(source, path):
+    """Download source so that its content is at path."""
+    parent = os.path.dirname(path)
+    source_tmp_path = download_source(source, parent, ctx_from_imports.logger)
+    shutil.move(source_tmp_path, path)
+
+
+def download_cached_source(source, target, source_cache, link_mode,
+                           revision=None, previous=None,
+                           resource_config=None):
+    """Populate target from the source cache.
+
+    The cache is keyed by the location and its current revision, which is
+    the commit for git sources and the ETag or Last-Modified header for
+    HTTP sources. When the revision can not be determined, the source is
+    downloaded and keyed by the digest of its content, which still avoids
+    keeping a separate copy per node instance.
+
+    A git source is fetched to the shared git cache and its entry is keyed
+    by the commit that was fetched, which is not the revision that was
+    resolved before if the branch moved in between.
+
+    :param revision: str, the revision if it was already resolved.
+    :param previous: dict, the manifest of the previous sync of target.
+    :return: (manifest, changed, revision), see sync_tree.
+    """
+    location, username, password = source_location(source)
+    revision = revision or source_revision(source, ctx_from_imports.logger)
+    populate = partial(download_source_into, source)
+    if revision and is_git_source(location):
+        git_cache = GitCache(get_cache_dir(GIT_CACHE_DIR, resource_config),
+                             logger=ctx_from_imports.logger)
+        revision = git_cache.fetch(location, username, password, revision)
+        populate = partial(git_cache.export, location, revision)
+    if revision:
+        key = cache_key(location, revision)
+        ctx_from_imports.logger.debug(
+            'Source {l} is at revision {r}.'.format(l=location, r=revision))
+        result = source_cache.sync(
+            key,
+            populate,
+            target,
+            previous,
+            link_mode)
+    else:
+        download_dir = tempfile.mkdtemp()
+        try:
+            downloaded = os.path.join(download_dir, 'content')
+            download_source_into(source, downloaded)
+            key = cache_key(location, tree_digest(downloaded))
+            result = source_cache.sync(
+                key,
+                lambda path: shutil.move(downloaded, path),
+                target,
+                previous,
+                link_mode)
+        finally:
+            rmtree(download_dir, ignore_errors=True)
+    ctx_from_imports.logger.debug(
+        'Source cache usage: {}'.format(source_cache.usage()))
+    return result + (revision,)
 
 
 def get_terragrunt_source_config(new_source_config=False):
@@ -292,8 +654,96 @@ def update_resource_config(new_values, target=False):
     store_property(ctx_from_imports, 'resource_config', new_values, target)
 
 
-def check_prerequistes():
+def check_prerequistes(probe_cache=None):
+    probe_cache = probe_cache or get_probe_cache(get_node_instance_dir())
     try:
-        run_subprocess(['git', '--version'])
+        probe_cache.probe('git', run_subprocess)
     except ProcessException:
         raise NonRecoverableError('Git is not installed')
+
+
+def with_current_ctx(func):
+    """Make the operation context of the calling thread available to func
+    when it runs in another thread, for its logger and ctx."""
+    _ctx = current_ctx.get_ctx()
+    parameters = current_ctx.get_parameters()
+
+    def wrapper(*args, **kwargs):
+        with current_ctx.push(_ctx, parameters):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def run_preflight(stages, tg=None, after=None):
+    """Run independent checks at the same time, and stop at the first
+    one that fails.
+
+    :param stages: list of (name, callable) tuples.
+    :param tg: Terragrunt, whose running commands are cancelled when a
+        stage fails.
+    :param after: dict of stage name to the names of the stages that it
+        starts after, see Preflight.
+    :return: dict of stage name to what it returned.
+    """
+    preflight = Preflight(stages,
+                          logger=ctx_from_imports.logger,
+                          wrapper=with_current_ctx,
+                          on_cancel=tg.cancel if tg else None,
+                          after=after)
+    return preflight.run()
+
+
+def get_drift_dir(report_id, resource_config=None):
+    return os.path.join(get_cache_dir(DRIFT_DIR, resource_config),
+                        str(report_id))
+
+
+def check_drift(tg, report_id=None, timeout=None):
+    """Run a refresh-only plan and record a compact drift entry for the
+    stack, in the drift runtime property and, with report_id, in the
+    directory that drift_report aggregates. A stack that can not be
+    checked is recorded as failed or timed out instead of failing.
+
+    :param tg: Terragrunt
+    :param report_id: str, the report to add the entry to.
+    :param timeout: int, seconds, 0 or None for no timeout.
+    :return: dict
+    """
+    ctx_instance = get_ctx_instance()
+    start = time.time()
+    # The timeout is for the whole stack, which runs a command per module
+    # with run_all.
+    tg.deadline = start + timeout if timeout else None
+    try:
+        entry = stack_drift(tg.drift())
+    except Exception as e:
+        timed_out = bool(timeout) and time.time() - start >= timeout
+        entry = stack_drift(error=str(e)[-DRIFT_ERROR_LENGTH:],
+                            timed_out=timed_out)
+    ctx_from_imports.logger.info('Drift of {i}: {s}.'.format(
+        i=ctx_instance.id, s=entry['status']))
+    ctx_instance.runtime_properties['drift'] = entry
+    if report_id:
+        directory = get_drift_dir(report_id, tg.resource_config)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory,
+                               '{}.json'.format(ctx_instance.id)), 'w') as f:
+            json.dump(entry, f)
+    return entry
+
+
+def write_drift_report(report_id, report_path=None, resource_config=None):
+    """Aggregate the drift entries of report_id into one JSON file.
+
+    :param report_id: str
+    :param report_path: str, defaults to <cache_dir>/drift/<report_id>.json.
+    :return: (path, dict)
+    """
+    directory = get_drift_dir(report_id, resource_config)
+    report_path = report_path or directory + '.json'
+    report = DriftReport().load(directory).write(report_path)
+    rmtree(directory, ignore_errors=True)
+    ctx_from_imports.logger.info(
+        'Wrote the drift report of {n} stacks to {p}: {s}'.format(
+            n=len(report['stacks']), p=report_path, s=report['summary']))
+    return report_path, report
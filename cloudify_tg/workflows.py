@@ -13,8 +13,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from cloudify.workflows import tasks
 from cloudify.exceptions import NonRecoverableError
 
+from tg_sdk.fingerprint import dependents_closure
+from tg_sdk.scheduler import topological_order
+
+STACK = 'cloudify.nodes.terragrunt.Stack'
+DEFAULT_MAX_CONCURRENCY = 10
 HIERARCHY = 'type_hierarchy'
 NOT_STARTED = ['uninitialized', 'deleted']
 REL = 'cloudify.terraform.relationships.run_on_host'
@@ -28,6 +34,8 @@ def terragrunt_apply(ctx,
                      source=None,
                      source_path=None,
                      destroy=False,
+                     max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                     fail_fast=False,
                      **kwargs):
     """Execute the terragrunt apply on nodes or node instances.
     :param ctx: The Cloudify Workflow Context from Workflow.
@@ -37,12 +45,16 @@ def terragrunt_apply(ctx,
     :param node_instance_ids: A list of node IDs.
       Mutually exclusive with node_ids.
     :param node_instance_ids: list
+    :param max_concurrency: How many stacks may run at the same time,
+      0 for no limit.
+    :type max_concurrency: int
+    :param fail_fast: Stop starting stacks once one of them failed.
+    :type fail_fast: bool
     :return graph execution.
     :rtype: NoneType
     """
 
     graph = ctx.graph_mode()
-    sequence = graph.sequence()
 
     if isinstance(destroy, str):
         if destroy in ['true', 'True']:
@@ -57,13 +69,15 @@ def terragrunt_apply(ctx,
             'destroy': destroy
         }
     )
-    execute_operation(node_ids,
-                      node_instance_ids,
-                      ctx,
-                      sequence,
-                      'terragrunt.terragrunt_apply',
-                      kwargs)
-    return graph.execute()
+    failed = execute_operation(node_ids,
+                               node_instance_ids,
+                               ctx,
+                               graph,
+                               'terragrunt.terragrunt_apply',
+                               kwargs,
+                               max_concurrency,
+                               fail_fast)
+    return _execute_graph(graph, failed)
 
 
 def terragrunt_plan(ctx,
@@ -71,6 +85,8 @@ def terragrunt_plan(ctx,
                     node_instance_ids=None,
                     source=None,
                     source_path=None,
+                    max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                    fail_fast=False,
                     **kwargs):
     """Execute the terragrunt plan on nodes or node instances.
     :param ctx: The Cloudify Workflow Context from Workflow.
@@ -80,12 +96,16 @@ def terragrunt_plan(ctx,
     :param node_instance_ids: A list of node IDs.
       Mutually exclusive with node_ids.
     :param node_instance_ids: list
+    :param max_concurrency: How many stacks may run at the same time,
+      0 for no limit.
+    :type max_concurrency: int
+    :param fail_fast: Stop starting stacks once one of them failed.
+    :type fail_fast: bool
     :return graph execution.
     :rtype: NoneType
     """
 
     graph = ctx.graph_mode()
-    sequence = graph.sequence()
 
     kwargs.update(
         {
@@ -93,16 +113,84 @@ def terragrunt_plan(ctx,
             'source_path': source_path,
         }
     )
-    execute_operation(node_ids,
-                      node_instance_ids,
-                      ctx,
-                      sequence,
-                      'terragrunt.terragrunt_plan',
-                      kwargs)
-    return graph.execute()
+    failed = execute_operation(node_ids,
+                               node_instance_ids,
+                               ctx,
+                               graph,
+                               'terragrunt.terragrunt_plan',
+                               kwargs,
+                               max_concurrency,
+                               fail_fast)
+    return _execute_graph(graph, failed)
+
+
+def terragrunt_drift(ctx,
+                     node_ids=None,
+                     node_instance_ids=None,
+                     max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                     timeout=0,
+                     report_path='',
+                     store_report=True,
+                     **kwargs):
+    """Check stacks for drift with refresh-only plans, and aggregate the
+    results into one report.
+    :param ctx: The Cloudify Workflow Context from Workflow.
+    :type ctx: CloudifyContext
+    :param node_ids: A list of node IDs.
+    :type node_ids: list
+    :param node_instance_ids: A list of node IDs.
+      Mutually exclusive with node_ids.
+    :param node_instance_ids: list
+    :param max_concurrency: How many stacks may run at the same time,
+      0 for no limit.
+    :type max_concurrency: int
+    :param timeout: Seconds after which the check of a stack is stopped,
+      0 for no timeout.
+    :type timeout: int
+    :param report_path: The manager file to write the report to.
+    :type report_path: str
+    :param store_report: Also store the report in the drift_report
+      runtime property of the first stack instance.
+    :type store_report: bool
+    :return graph execution.
+    :rtype: NoneType
+    """
+
+    instances = get_stack_instances(ctx, node_ids, node_instance_ids)
+    if not instances:
+        ctx.logger.info('There are no stack instances to check.')
+        return
+    graph = ctx.graph_mode()
+    kwargs.update(
+        {
+            'report_id': ctx.execution_id,
+            'timeout': timeout
+        }
+    )
+    failed = execute_operation(node_ids,
+                               node_instance_ids,
+                               ctx,
+                               graph,
+                               'terragrunt.terragrunt_drift',
+                               kwargs,
+                               max_concurrency)
+    checks = [task for task in graph.tasks if not task.containing_subgraph]
+    report = instances[0].execute_operation(
+        'terragrunt.drift_report',
+        kwargs={
+            'report_id': ctx.execution_id,
+            'report_path': report_path,
+            'store_report': store_report
+        },
+        allow_kwargs_override=True)
+    graph.add_task(report)
+    for task in checks:
+        graph.add_dependency(report, task)
+    return _execute_graph(graph, failed)
 
 
-def _call_module_instance(operation, ctx, node, instance, sequence, kwargs):
+def _call_module_instance(operation, ctx, node, instance, sequence, kwargs,
+                          graph=None, started=None):
     """ Create a task sequence that will execute a terraform plan on
     a list of nodes.
 
@@ -112,9 +200,15 @@ def _call_module_instance(operation, ctx, node, instance, sequence, kwargs):
     :param instance: CloudifyWorkflowNodeInstance
     :param sequence: TaskSequence
     :param kwargs:
-    :return: None
+    :param graph: TaskDependencyGraph, to add the subgraphs that start
+        Terraform binary instances to.
+    :param started: dict of binary instance ID to the subgraph that starts
+        it, shared by every stack instance in graph.
+    :return: list of the subgraphs that start the binary instances that
+        instance runs on, which sequence must wait for.
     """
-
+    started = {} if started is None else started
+    starts = []
     for rel in instance.relationships:
         if rel.target_node_instance.state in NOT_STARTED:
             if REL not in rel.relationship._relationship[HIERARCHY]:
@@ -131,7 +225,9 @@ def _call_module_instance(operation, ctx, node, instance, sequence, kwargs):
                     )
                 )
             else:
-                _start_terraform_instance(sequence, rel)
+                starts.append(
+                    _start_terraform_instance(graph, started, rel))
+                sequence.add(rel.execute_source_operation(PRECONFIGURE))
     sequence.add(
         instance.execute_operation(
             operation,
@@ -139,24 +235,37 @@ def _call_module_instance(operation, ctx, node, instance, sequence, kwargs):
             allow_kwargs_override=True
         )
     )
+    return starts
 
 
-def _start_terraform_instance(sequence, r):
-    sequence.add(
-        r.target_node_instance.execute_operation(CREATE))
-    sequence.add(
-        r.execute_source_operation(PRECONFIGURE))
-    sequence.add(
-        r.target_node_instance.set_state('started'))
+def _start_terraform_instance(graph, started, r):
+    """Start the Terraform binary instance that r targets, once for all
+    of the stack instances that run on it.
 
+    :return: the subgraph that starts it.
+    """
+    target = r.target_node_instance
+    if target.id not in started:
+        subgraph = graph.subgraph('start {}'.format(target.id))
+        sequence = subgraph.sequence()
+        sequence.add(target.execute_operation(CREATE))
+        sequence.add(target.set_state('started'))
+        started[target.id] = subgraph
+    return started[target.id]
+
+
+def _execute_graph(graph, failed):
+    result = graph.execute()
+    if failed:
+        raise NonRecoverableError(
+            'Stack instances failed: {f}. The instances that depend on '
+            'them were skipped: {s}.'.format(
+                f=sorted(failed),
+                s=sorted(set().union(*failed.values()))))
+    return result
 
-def execute_operation(node_ids,
-                      node_instance_ids,
-                      ctx,
-                      sequence,
-                      operation,
-                      kwargs):
 
+def get_stack_instances(ctx, node_ids=None, node_instance_ids=None):
     if node_ids and node_instance_ids:
         raise NonRecoverableError(
             'The parameters node_ids and node_instance_ids are '
@@ -164,25 +273,134 @@ def execute_operation(node_ids,
             '{} and {} were provided.'.format(node_ids, node_instance_ids)
         )
     elif node_ids or (not node_ids and not node_instance_ids):
+        instances = []
         for node in ctx.nodes:
-            if 'cloudify.nodes.terragrunt.Stack' not in node.type_hierarchy:
+            if STACK not in node.type_hierarchy:
                 continue
             if not node_ids or node.id in node_ids:
-                for instance in node.instances:
-                    _call_module_instance(
-                        operation,
-                        ctx,
-                        instance.node,
-                        instance,
-                        sequence,
-                        kwargs)
-    elif node_instance_ids:
-        for instance in ctx.node_instances:
-            if instance.id in node_instance_ids:
-                _call_module_instance(
-                    operation,
-                    ctx,
-                    instance.node,
-                    instance,
-                    sequence,
-                    kwargs)
+                instances.extend(node.instances)
+        return instances
+    return [instance for instance in ctx.node_instances
+            if instance.id in node_instance_ids]
+
+
+def stack_dependencies(instances):
+    """The stack instances that each stack instance depends on, directly
+    or through relationships to instances that are not in instances.
+
+    :param instances: list of CloudifyWorkflowNodeInstance
+    :return: dict of instance ID to a set of instance IDs.
+    """
+    selected = {instance.id for instance in instances}
+    dependencies = {}
+    for instance in instances:
+        found = set()
+        visited = {instance.id}
+        targets = [r.target_node_instance for r in instance.relationships]
+        while targets:
+            target = targets.pop()
+            if target.id in visited:
+                continue
+            visited.add(target.id)
+            if target.id in selected:
+                found.add(target.id)
+            else:
+                targets.extend(
+                    r.target_node_instance for r in target.relationships)
+        dependencies[instance.id] = found
+    return dependencies
+
+
+def concurrency_lanes(order, max_concurrency):
+    """Spread stack instances over max_concurrency chains, so that no more
+    than max_concurrency of them run at the same time.
+
+    This is an approximation of a bounded scheduler: the dependencies of a
+    graph are fixed before it runs, so the instances are striped over the
+    lanes in order, and an instance waits for the one max_concurrency
+    places before it even when another lane is free. A slow stack holds
+    up the rest of its lane, so fewer than max_concurrency stacks may run
+    at times, but never more.
+
+    :param order: list of instance IDs, every one after its dependencies.
+    :param max_concurrency: int, 0 or None for no limit.
+    :return: list of (instance ID, the instance ID it waits for) pairs.
+    """
+    if not max_concurrency:
+        return []
+    return [(order[i], order[i - max_concurrency])
+            for i in range(max_concurrency, len(order))]
+
+
+def execute_operation(node_ids,
+                      node_instance_ids,
+                      ctx,
+                      graph,
+                      operation,
+                      kwargs,
+                      max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                      fail_fast=False):
+    """Add operation on every selected stack instance to graph.
+
+    Every stack instance gets a subgraph that starts after the subgraphs of
+    the stack instances it depends on, and after the subgraph that starts
+    the Terraform binary instance it runs on, one per binary instance.
+    Unrelated stack instances run in parallel, at most max_concurrency at
+    a time, see concurrency_lanes.
+
+    When a stack instance fails, the instances that depend on it are
+    removed from the graph. With fail_fast the graph fails at once and no
+    other stack instance starts. Otherwise the unrelated instances carry
+    on.
+
+    :return: dict of failed instance ID to the skipped instance IDs that
+        depend on it, filled while the graph executes.
+    """
+    instances = get_stack_instances(ctx, node_ids, node_instance_ids)
+    dependencies = stack_dependencies(instances)
+    subgraphs = {}
+    started = {}
+    failed = {}
+
+    def on_failure(subgraph):
+        instance_id = subgraph.info['instance_id']
+        if fail_fast:
+            skipped = [i for i, s in subgraphs.items()
+                       if s.get_state() == tasks.TASK_PENDING]
+        else:
+            skipped = dependents_closure(dependencies, [instance_id]) - \
+                {instance_id}
+        for skipped_id in skipped:
+            graph.remove_task(subgraphs[skipped_id])
+        ctx.logger.error(
+            '{o} failed on {i}, skipping {s}.'.format(
+                o=operation, i=instance_id, s=sorted(skipped)))
+        if fail_fast:
+            return tasks.HandlerResult.fail()
+        failed[instance_id] = set(skipped)
+        return tasks.HandlerResult.ignore()
+
+    for instance in instances:
+        subgraph = graph.subgraph('{o} {i}'.format(o=operation, i=instance.id))
+        subgraph.info['instance_id'] = instance.id
+        subgraph.on_failure = on_failure
+        starts = _call_module_instance(operation,
+                                       ctx,
+                                       instance.node,
+                                       instance,
+                                       subgraph.sequence(),
+                                       kwargs,
+                                       graph,
+                                       started)
+        for start in starts:
+            graph.add_dependency(subgraph, start)
+        subgraphs[instance.id] = subgraph
+
+    order = topological_order(dependencies)
+    for instance_id in order:
+        for dependency in dependencies[instance_id]:
+            graph.add_dependency(subgraphs[instance_id],
+                                 subgraphs[dependency])
+    for instance_id, previous in concurrency_lanes(order, max_concurrency):
+        graph.add_dependency(subgraphs[instance_id], subgraphs[previous])
+    return failed
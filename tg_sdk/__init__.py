@@ -1 +1,2 @@
 from .tg import Terragrunt  # noqa
+from .aio import AsyncTerragrunt  # noqa
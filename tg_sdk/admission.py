@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import uuid
+import tempfile
+from contextlib import contextmanager
+
+from cloudify.exceptions import NonRecoverableError
+
+from . import utils
+from .cache import file_lock
+
+LEDGER_FILE = 'ledger.json'
+LEDGER_LOCK = 'ledger.lock'
+POLL_INTERVAL = 0.5
+DEFAULT_SLOT_MEMORY = 512  # MiB
+
+# How many slots a command takes by default. Commands that are not listed
+# take one.
+COMMAND_WEIGHTS = {
+    'apply': 4,
+    'destroy': 4,
+    'plan': 3,
+    'init': 2,
+    'refresh': 2,
+    'validate': 2,
+}
+
+
+def process_start_time(pid):
+    """The start time of pid, which tells a live process from a new one
+    that reuses its pid, or None if it is not running."""
+    try:
+        with open('/proc/{}/stat'.format(pid)) as f:
+            return f.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return
+        except PermissionError:
+            pass
+        return ''
+
+
+def available_memory():
+    """MemAvailable in bytes, or None where /proc/meminfo is missing."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+
+
+class Grant(object):
+
+    def __init__(self, token, command, slots, wait_time):
+        self.token = token
+        self.command = command
+        self.slots = slots
+        self.wait_time = wait_time
+
+    def to_dict(self):
+        return {
+            'command': self.command,
+            'slots': self.slots,
+            'wait_time': round(self.wait_time, 3)
+        }
+
+
+class AdmissionController(object):
+    """Limit the Terragrunt commands that run at the same time on the
+    host, across every process.
+
+    Commands take weighted slots out of a shared pool. A ledger file,
+    updated under a lock, records who holds and who waits for slots, and
+    entries of processes that died are dropped. Waiting commands are
+    admitted first come first served. With a memory budget, the pool has
+    one slot per slot_memory of the budget, and commands also wait while
+    the host has less memory available than their slots need, unless
+    nothing else runs.
+    """
+
+    def __init__(self,
+                 directory,
+                 slots=None,
+                 weights=None,
+                 memory_budget=None,
+                 slot_memory=DEFAULT_SLOT_MEMORY,
+                 timeout=None,
+                 logger=None):
+        """
+        :param directory: str, where the ledger is kept.
+        :param slots: int, the size of the pool, defaults to the CPU count.
+        :param weights: dict of command to slots, on top of
+            COMMAND_WEIGHTS.
+        :param memory_budget: int, MiB for every command on the host, or
+            None for no budget.
+        :param slot_memory: int, the MiB that one slot is expected to use.
+        :param timeout: float, the seconds to wait for slots before giving
+            up, None to wait as long as it takes.
+        :param logger: logger
+        """
+        self.directory = directory
+        self.slot_memory = slot_memory or DEFAULT_SLOT_MEMORY
+        self.memory_budget = memory_budget
+        total = slots or os.cpu_count() or 1
+        if memory_budget:
+            total = min(total, max(1, memory_budget // self.slot_memory))
+        self.total_slots = total
+        self.weights = dict(COMMAND_WEIGHTS)
+        self.weights.update(weights or {})
+        self.timeout = timeout
+        self._logger = logger
+        self.grants = []
+
+    @property
+    def logger(self):
+        return self._logger or utils.get_logger('TerragruntLogger')
+
+    @property
+    def _ledger_path(self):
+        return os.path.join(self.directory, LEDGER_FILE)
+
+    def weight(self, command):
+        """The slots that command takes, never more than the pool."""
+        return max(1, min(int(self.weights.get(command, 1)),
+                          self.total_slots))
+
+    def _load(self):
+        try:
+            with open(self._ledger_path) as f:
+                ledger = json.load(f)
+        except (OSError, ValueError):
+            ledger = {}
+        live = {}
+        for token, entry in ledger.items():
+            if process_start_time(entry['pid']) == entry.get('start'):
+                live[token] = entry
+        return live
+
+    def _save(self, ledger):
+        with tempfile.NamedTemporaryFile(
+                mode='w', dir=self.directory, delete=False) as f:
+            json.dump(ledger, f)
+        os.replace(f.name, self._ledger_path)
+
+    @contextmanager
+    def _ledger(self):
+        with file_lock(os.path.join(self.directory, LEDGER_LOCK)):
+            ledger = self._load()
+            yield ledger
+            self._save(ledger)
+
+    def _try_admit(self, token, slots):
+        with self._ledger() as ledger:
+            entry = ledger.get(token)
+            if not entry:
+                return False
+            active = sum(e['slots'] for e in ledger.values()
+                         if e['state'] == 'active')
+            first = min((e['queued'], t) for t, e in ledger.items()
+                        if e['state'] == 'waiting')[1]
+            if first != token or active + slots > self.total_slots:
+                return False
+            if self.memory_budget and active:
+                available = available_memory()
+                if available is not None and \
+                        available < slots * self.slot_memory * 1024 * 1024:
+                    return False
+            entry['state'] = 'active'
+            entry['since'] = time.time()
+            return True
+
+    @contextmanager
+    def admit(self, command):
+        """Hold slots for command while the block runs.
+
+        :param command: str, the Terragrunt command, for example apply.
+        :return: Grant
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        token = uuid.uuid4().hex
+        slots = self.weight(command)
+        start = time.time()
+        with self._ledger() as ledger:
+            ledger[token] = {
+                'pid': os.getpid(),
+                'start': process_start_time(os.getpid()),
+                'command': command,
+                'slots': slots,
+                'state': 'waiting',
+                'queued': start
+            }
+        try:
+            while not self._try_admit(token, slots):
+                if self.timeout and time.time() - start > self.timeout:
+                    raise NonRecoverableError(
+                        'Waited more than {t} seconds for {s} of {n} '
+                        'Terragrunt slots to run {c}.'.format(
+                            t=self.timeout, s=slots,
+                            n=self.total_slots, c=command))
+                time.sleep(POLL_INTERVAL)
+            grant = Grant(token, command, slots, time.time() - start)
+            self.grants.append(grant)
+            if grant.wait_time >= POLL_INTERVAL:
+                self.logger.info(
+                    'Waited {w:.1f}s for {s} slots to run {c}.'.format(
+                        w=grant.wait_time, s=slots, c=command))
+            yield grant
+        finally:
+            with self._ledger() as ledger:
+                ledger.pop(token, None)
+
+    def metrics(self):
+        """Numbers for dashboards: the slots in use on the host, and the
+        time that the commands of this controller waited for them.
+
+        :return: dict
+        """
+        with self._ledger() as ledger:
+            entries = list(ledger.values())
+        waits = [g.wait_time for g in self.grants]
+        return {
+            'total_slots': self.total_slots,
+            'active_slots': sum(e['slots'] for e in entries
+                                if e['state'] == 'active'),
+            'active_commands': len([e for e in entries
+                                    if e['state'] == 'active']),
+            'waiting_commands': len([e for e in entries
+                                     if e['state'] == 'waiting']),
+            'admitted': len(waits),
+            'total_wait_time': round(sum(waits), 3),
+            'max_wait_time': round(max(waits), 3) if waits else 0.0
+        }
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import signal
+import asyncio
+from functools import partial
+from asyncio.subprocess import PIPE
+
+from cloudify.exceptions import NonRecoverableError
+
+from . import utils
+from .tg import Terragrunt
+from .plan import (
+    MAX_PENDING_SIZE,
+    JsonMessageDecoder,
+    new_plan,
+    fold_message
+)
+from .plan_model import PlanModel
+
+
+def kill_process_group(process, sig):
+    try:
+        os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+async def terminate(process, timeout=utils.TERMINATE_TIMEOUT):
+    """Stop a process started in its own session, and everything it
+    started, with SIGTERM and then SIGKILL."""
+    kill_process_group(process, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        kill_process_group(process, signal.SIGKILL)
+        await process.wait()
+
+
+class AsyncTerragrunt(Terragrunt):
+    """An asyncio counterpart of Terragrunt.
+
+    Commands are built exactly like the Terragrunt class builds them, and
+    run with asyncio.create_subprocess_exec in a new session. Cancelling a
+    call, or reaching its timeout, terminates the whole process group.
+    Output is read line by line and only the tail is kept for errors; plan
+    output is folded into the plan as it arrives.
+
+    run_all stacks are run with terragrunt run-all. The native scheduler,
+    incremental, saved and structured plan modes, and the locking of a
+    shared provider cache, are only available in Terragrunt.
+    """
+
+    def __init__(self,
+                 properties,
+                 logger=None,
+                 masked_env_vars=None,
+                 timeout=None,
+                 *args,
+                 **kwargs):
+        """
+        :param timeout: float, the default timeout of every call in
+            seconds, None for no timeout.
+        """
+        super(AsyncTerragrunt, self).__init__(
+            properties, logger, None, masked_env_vars, *args, **kwargs)
+        self.timeout = timeout
+        self.last_result = None
+
+    @property
+    def environment(self):
+        env = dict(os.environ)
+        env.update({k: str(v) for k, v in
+                    self.insecure_environment_variables.items()})
+        return env
+
+    async def _run(self, command, timeout=None, on_line=None, name=None):
+        """Run command to completion.
+
+        :param command: list
+        :param timeout: float, seconds, defaults to self.timeout.
+        :param on_line: callable(line) that consumes stdout. When it is
+            provided stdout is not kept.
+        :param name: str, the Terragrunt command, for telemetry.
+        :return: str, stdout, unless on_line is provided.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        result = utils.ExecutionResult(command)
+        result.start_time = time.time()
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            cwd=self.cwd,
+            env=self.environment,
+            stdout=PIPE,
+            stderr=PIPE,
+            start_new_session=True,
+            limit=MAX_PENDING_SIZE)
+        lines = []
+
+        async def read(stream, is_stdout):
+            while True:
+                raw = await stream.readline()
+                if not raw:
+                    break
+                line = raw.decode('utf-8', errors='replace').rstrip('\n')
+                result.add_line(line)
+                if not is_stdout:
+                    result.stderr_bytes += len(raw)
+                    continue
+                result.stdout_bytes += len(raw)
+                if on_line:
+                    on_line(line)
+                else:
+                    lines.append(line)
+
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(read(process.stdout, True),
+                               read(process.stderr, False),
+                               process.wait()),
+                timeout)
+        except asyncio.TimeoutError:
+            await terminate(process)
+            raise NonRecoverableError(
+                'Command {c} timed out after {t} seconds. '
+                'Last output:\n{o}'.format(
+                    c=command, t=timeout, o='\n'.join(result.tail)))
+        except BaseException:
+            # Cancelled, or the output could not be read, as when a line
+            # is longer than the limit: nothing is left to wait for it.
+            await terminate(process)
+            raise
+        finally:
+            result.returncode = process.returncode
+            result.end_time = time.time()
+            self.last_result = result
+            self.telemetry.add(result, name, self.secrets)
+        if result.returncode:
+            raise NonRecoverableError(
+                'Command {c} failed with exit code {r}. '
+                'Last output:\n{o}'.format(
+                    c=command, r=result.returncode,
+                    o='\n'.join(result.tail)))
+        if not on_line:
+            return '\n'.join(lines).strip()
+
+    async def check_terraform_binary(self):
+        """The Terraform binary version check of the terraform_binary_path
+        property, without blocking the event loop."""
+        if not self._terraform_binary_path:
+            self._terraform_binary_path = \
+                self.resource_config.get('terraform_binary_path')
+        path = self._terraform_binary_path
+        if not path or self._checked_terraform_binary_path == path:
+            return
+        output = self.probe_cache.get(path)
+        if output is None:
+            output = await self._run([path, '--version'])
+            self.probe_cache.set(path, output)
+        self._check_terraform_version(output)
+
+    async def execute_async(self, name, working_dir=None, extra_args=None,
+                            timeout=None, on_line=None):
+        """The counterpart of execute, which is inherited unchanged for
+        the methods of Terragrunt that run synchronously.
+
+        :return: str, stdout, unless on_line is provided.
+        """
+        await self.check_terraform_binary()
+        command = self.build_command(name, working_dir, extra_args)
+        return await self._run(command, timeout, on_line, name)
+
+    async def plan(self, timeout=None):
+        plan = PlanModel() if self.plan_model else new_plan()
+        fold = plan.fold if self.plan_model else partial(fold_message, plan)
+        decoder = JsonMessageDecoder(self.logger)
+
+        def on_line(line):
+            for message in decoder.feed(line):
+                if isinstance(message, dict):
+                    fold(message)
+
+        await self.execute_async('plan', timeout=timeout, on_line=on_line)
+        decoder.close()
+        self._terraform_plan = plan
+        return self.terraform_plan
+
+    async def apply(self, timeout=None):
+        return await self.execute_async('apply', timeout=timeout)
+
+    async def destroy(self, timeout=None):
+        return await self.execute_async('destroy', timeout=timeout)
+
+    async def output(self, timeout=None):
+        result = await self.execute_async('output', timeout=timeout)
+        self._terraform_output = json.loads(result)
+        return self.terraform_output
+
+    async def terragrunt_info(self, timeout=None):
+        return await self.execute_async('terragrunt-info', timeout=timeout)
+
+    async def validate_inputs(self, timeout=None):
+        return await self.execute_async('validate-inputs', timeout=timeout)
+
+    async def graph_dependencies(self, timeout=None):
+        return await self.execute_async('graph-dependencies', timeout=timeout)
+
+    async def render_json(self, timeout=None):
+        return await self.execute_async('render-json', timeout=timeout)
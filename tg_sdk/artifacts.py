@@ -0,0 +1,172 @@
+import os
+import gzip
+import json
+import hashlib
+import tempfile
+from collections.abc import Mapping
+
+ARTIFACTS_DIR = '.artifacts'
+ARTIFACT_SUFFIX = '.json.gz'
+DEFAULT_MAX_ADDRESSES = 100
+# The parts of a plan that the terraform_plan runtime property holds
+# without compact_properties. Planned changes and diagnostics stay out of
+# it, so it does not grow with every plan.
+PROPERTY_PLAN_KEYS = ('resource_drifts', 'outputs', 'change_summary')
+
+
+def payload_digest(payload):
+    """The sha256 of payload, which does not depend on the order of keys.
+
+    :param payload: anything that JSON can encode.
+    :return: str
+    """
+    return hashlib.sha256(json.dumps(
+        payload, sort_keys=True, separators=(',', ':')).encode(
+            'utf-8')).hexdigest()
+
+
+def property_plan(plan):
+    """What of a plan the terraform_plan runtime property holds without
+    compact_properties: the drifts, the outputs and the change summary.
+
+    :param plan: dict, as returned by Terragrunt.plan.
+    :return: dict
+    """
+    if not isinstance(plan, dict):
+        return plan
+    return {key: plan[key] for key in PROPERTY_PLAN_KEYS if key in plan}
+
+
+def compact_plan(plan, digest, max_addresses=DEFAULT_MAX_ADDRESSES):
+    """What of a plan is worth keeping in runtime properties: the change
+    summary and the drifted addresses.
+
+    :param plan: dict, as returned by Terragrunt.plan.
+    :param digest: str, the digest of the stored plan.
+    :param max_addresses: int, the most drifted addresses to keep.
+    :return: dict
+    """
+    addresses = [change.get('resource', {}).get('addr')
+                 for change in plan.get('resource_drifts', [])]
+    return {
+        'digest': digest,
+        'change_summary': plan.get('change_summary', {}),
+        'drifted': addresses[:max_addresses],
+        'drifted_count': len(addresses)
+    }
+
+
+def compact_output(output, digest):
+    """What of outputs is worth keeping in runtime properties: their
+    names.
+
+    :param output: dict, as returned by Terragrunt.output.
+    :param digest: str, the digest of the stored outputs.
+    :return: dict
+    """
+    return {
+        'digest': digest,
+        'outputs': sorted(output) if isinstance(output, dict) else []
+    }
+
+
+class ArtifactStore(object):
+    """Large payloads, for example plans, kept as gzipped JSON files.
+
+    Files are named after the digest of their payload, so a payload that
+    did not change is never written again.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, name, digest):
+        return os.path.join(self.directory, '{n}.{d}{s}'.format(
+            n=name, d=digest, s=ARTIFACT_SUFFIX))
+
+    def _paths(self, name):
+        if not os.path.isdir(self.directory):
+            return []
+        prefix = name + '.'
+        return [os.path.join(self.directory, f)
+                for f in os.listdir(self.directory)
+                if f.startswith(prefix) and f.endswith(ARTIFACT_SUFFIX) and
+                '.' not in f[len(prefix):-len(ARTIFACT_SUFFIX)]]
+
+    def save(self, name, payload, digest=None):
+        """Store payload as name, and remove older versions of it.
+
+        :param name: str
+        :param payload: anything that JSON can encode.
+        :param digest: str, payload_digest(payload) if it is known.
+        :return: str, the digest.
+        """
+        digest = digest or payload_digest(payload)
+        path = self.path(name, digest)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                    dir=self.directory, delete=False) as f:
+                with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+                    gz.write(json.dumps(
+                        payload, separators=(',', ':')).encode('utf-8'))
+            os.replace(f.name, path)
+        for old in self._paths(name):
+            if old != path:
+                os.remove(old)
+        return digest
+
+    def load(self, name, digest=None):
+        """The payload stored as name.
+
+        :param digest: str, the version to load, by default the latest.
+        :return: the payload, or None if it is not stored.
+        """
+        if digest:
+            path = self.path(name, digest)
+        else:
+            paths = sorted(self._paths(name), key=os.path.getmtime)
+            if not paths:
+                return
+            path = paths[-1]
+        try:
+            with gzip.open(path, 'rb') as f:
+                return json.loads(f.read().decode('utf-8'))
+        except (OSError, ValueError):
+            return
+
+    def lazy(self, name, digest=None):
+        return LazyArtifact(self, name, digest)
+
+
+class LazyArtifact(Mapping):
+    """A stored payload that is only read and decompressed when it is
+    first used.
+    """
+
+    def __init__(self, store, name, digest=None):
+        self.store = store
+        self.name = name
+        self.digest = digest
+        self._value = None
+        self._loaded = False
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    @property
+    def value(self):
+        if not self._loaded:
+            self._value = self.store.load(self.name, self.digest)
+            self._loaded = True
+        return self._value
+
+    def __getitem__(self, key):
+        return (self.value or {})[key]
+
+    def __iter__(self):
+        return iter(self.value or {})
+
+    def __len__(self):
+        return len(self.value or {})
@@ -0,0 +1,105 @@
+"""Compare the streaming plan parser with the original regex based one.
+
+Usage: python -m tg_sdk.benchmarks.bench_plan_parser [messages]
+
+The synthetic stream mimics `terragrunt run-all plan -json`: drift and
+planned change messages for every resource, diagnostics, and a change
+summary and outputs per module. Timing and memory are measured in separate
+runs, since tracemalloc slows allocation down considerably. The parsing
+overhead is the peak minus what the returned plan itself retains.
+"""
+import re
+import sys
+import json
+import time
+import tracemalloc
+
+from tg_sdk.plan import parse_plan
+
+MODULES = 60
+
+
+def synthetic_stream(count):
+    per_module = max(count // MODULES, 1)
+    for index in range(count):
+        module = index // per_module
+        address = 'module.m{m}.aws_instance.r{i}'.format(m=module, i=index)
+        if index % per_module == per_module - 1:
+            yield json.dumps({
+                'type': 'change_summary',
+                'changes': {'add': 1, 'change': 1, 'remove': 0}}) + '\n'
+        elif index % 10 == 0:
+            yield json.dumps({
+                'type': 'resource_drift',
+                'change': {'resource': {'addr': address},
+                           'action': 'update'}}) + '\n'
+        elif index % 10 == 1:
+            yield json.dumps({
+                'type': 'diagnostic',
+                'diagnostic': {'severity': 'warning',
+                               'summary': 'Value for undeclared variable'}})\
+                + '\n'
+        elif index % 10 == 2:
+            yield 'Releasing state lock. This may take a few moments...\n'
+        else:
+            yield json.dumps({
+                'type': 'planned_change',
+                '@message': '{a}: Plan to create'.format(a=address),
+                'change': {'resource': {'addr': address},
+                           'action': 'create'}}) + '\n'
+
+
+def legacy_parse_plan(result):
+    plan = {
+        'resource_drifts': [],
+        'outputs': [],
+        'change_summary': {}
+    }
+    new_result = re.sub(r'}\s*{', '}____TG_PLUGIN_PLAN____{', result)
+    for item in new_result.split('____TG_PLUGIN_PLAN____'):
+        try:
+            rendered = json.loads(item)
+            if 'type' not in rendered:
+                continue
+            elif rendered['type'] == 'outputs':
+                plan['outputs'] = rendered['outputs']
+            elif rendered['type'] == 'resource_drift':
+                plan['resource_drifts'].append(rendered['change'])
+            elif rendered['type'] == 'change_summary':
+                plan['change_summary'] = rendered['changes']
+        except json.decoder.JSONDecodeError:
+            pass
+    return plan
+
+
+class QuietLogger(object):
+
+    def info(self, *_):
+        pass
+
+
+def measure(name, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = func()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('{n:<28} {t:8.2f}s  peak {p:8.1f} MiB  '
+          'parsing overhead {o:8.1f} MiB  drifts={d}'.format(
+              n=name, t=elapsed, p=peak / 1024.0 / 1024.0,
+              o=(peak - retained) / 1024.0 / 1024.0,
+              d=len(result['resource_drifts'])))
+
+
+def main(count):
+    print('{c} messages'.format(c=count))
+    measure('legacy (buffered + regex)',
+            lambda: legacy_parse_plan(''.join(synthetic_stream(count))))
+    measure('streaming (line by line)',
+            lambda: parse_plan(synthetic_stream(count), QuietLogger()))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
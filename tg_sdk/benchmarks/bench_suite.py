@@ -0,0 +1,212 @@
+"""Benchmarks of the costs that the unit tests mock away: plan parsing,
+running commands, copying workspaces and fanning work out, against
+fake_terragrunt.py instead of real binaries, so they run offline.
+
+Usage: python -m tg_sdk.benchmarks.bench_suite [options] [benchmark ...]
+
+    --scale FACTOR     multiply the workload sizes, 1 by default.
+    --thresholds PATH  the regression thresholds, thresholds.json next to
+                       this file by default.
+    --json PATH        also write the metrics to PATH.
+
+Every metric is printed with its threshold. The exit code is 1 when a
+metric is worse than its threshold, so the suite can gate a build.
+Thresholds are deliberately loose, well below what a laptop reaches, to
+catch regressions of an order of magnitude rather than noise.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from collections import OrderedDict
+
+from tg_sdk import Terragrunt
+from tg_sdk.cache import link_tree, tree_digest
+from tg_sdk.plan import parse_plan
+from tg_sdk.utils import basic_executor, get_logger
+from tg_sdk.benchmarks.fake_terragrunt import make_stack
+from tg_sdk.benchmarks.bench_plan_parser import synthetic_stream
+
+FAKE_TERRAGRUNT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'fake_terragrunt.py')
+THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'thresholds.json')
+MIB = 1024.0 * 1024.0
+
+logger = get_logger('TerragruntBenchmark')
+logger.setLevel(logging.WARNING)
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def fake_terragrunt(stack, run_all=False, native_run_all=False,
+                    max_workers=None, **settings):
+    """A Terragrunt object that runs fake_terragrunt.py in stack."""
+    return Terragrunt(
+        {'resource_config': {
+            'source_path': stack,
+            'run_all': run_all,
+            'native_run_all': native_run_all,
+            'max_workers': max_workers,
+            'environment_variables': {
+                'FAKE_TG_' + k.upper(): str(v) for k, v in settings.items()},
+            'command_options': {'plan': ['-json'], 'output': ['-json']}}},
+        logger=logger,
+        executor=basic_executor,
+        binary_path=FAKE_TERRAGRUNT,
+        cwd=stack)
+
+
+@benchmark
+def plan_parsing(scale, _):
+    count = int(200000 * scale)
+    elapsed, plan = timed(
+        lambda: parse_plan(synthetic_stream(count), logger))
+    assert plan['resource_drifts']
+    return {'messages_per_second': count / elapsed}
+
+
+@benchmark
+def executor_overhead(scale, directory):
+    make_stack(directory, 1)
+    stack = os.path.join(directory, 'm000')
+    tg = fake_terragrunt(stack)
+    runs = max(int(20 * scale), 1)
+    elapsed, _ = timed(lambda: [tg._execute([FAKE_TERRAGRUNT, '--version'])
+                                for _ in range(runs)])
+    resources = int(20000 * scale)
+    tg = fake_terragrunt(stack, resources=resources, payload=200)
+    plan_time, plan = timed(tg.plan)
+    assert plan['change_summary']['add'] == resources
+    record = tg.telemetry.records[-1]
+    return {
+        'ms_per_command': elapsed / runs * 1000,
+        'plan_mib_per_second': record['stdout_bytes'] / MIB / plan_time
+    }
+
+
+@benchmark
+def workspace_copy(scale, directory):
+    source = os.path.join(directory, 'source')
+    make_stack(source, max(int(200 * scale), 1), files=5, file_size=16384)
+    digest_time, _ = timed(lambda: tree_digest(source))
+    size = sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(source) for name in files)
+    metrics = {'digest_mib_per_second': size / MIB / digest_time}
+    for mode in ['copy', 'hardlink']:
+        target = os.path.join(directory, mode)
+        elapsed, _ = timed(lambda: link_tree(source, target, mode))
+        metrics['{}_mib_per_second'.format(mode)] = size / MIB / elapsed
+    return metrics
+
+
+@benchmark
+def fan_out(scale, directory):
+    modules = max(int(32 * scale), 16)
+    make_stack(directory, modules, fanout=4, files=1)
+    tg = fake_terragrunt(directory, run_all=True, native_run_all=True,
+                         max_workers=8, latency=0.1, resources=1)
+    elapsed, result = timed(lambda: tg.run_modules('apply'))
+    assert result.ok
+    busy = sum(r.end_time - r.start_time for r in result)
+    metrics = {'module_speedup': busy / elapsed}
+    try:
+        metrics['workflow_ms_per_stack'] = workflow_graph(modules * 10)
+    except ImportError:
+        pass
+    return metrics
+
+
+def workflow_graph(stacks):
+    """The time the plan workflow takes to build its graph, per stack."""
+    from unittest.mock import Mock
+    from cloudify.workflows import tasks
+    from cloudify.workflows.tasks_graph import TaskDependencyGraph
+    from cloudify_tg import workflows
+
+    ctx = Mock()
+    instances = []
+    for index in range(stacks):
+        instance = Mock(id='stack_{}'.format(index))
+        instance.node.id = 'stack'
+        parents = [instances[(index - 1) // 4]] if index else []
+        instance.relationships = [
+            Mock(target_node_instance=parent,
+                 relationship=Mock(_relationship={workflows.HIERARCHY: []}))
+            for parent in parents]
+        instance.execute_operation.side_effect = \
+            lambda *_, **__: tasks.NOPLocalWorkflowTask(ctx)
+        instances.append(instance)
+    ctx.node_instances = instances
+    elapsed, _ = timed(lambda: workflows.execute_operation(
+        None, [i.id for i in instances], ctx, TaskDependencyGraph(ctx),
+        'terragrunt.terragrunt_plan', {}, max_concurrency=10))
+    return elapsed / stacks * 1000
+
+
+def check(value, threshold):
+    if not threshold:
+        return True
+    if 'min' in threshold and value < threshold['min']:
+        return False
+    if 'max' in threshold and value > threshold['max']:
+        return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('benchmarks', nargs='*',
+                        help='any of {}, all by default'.format(
+                            ', '.join(BENCHMARKS)))
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--thresholds', default=THRESHOLDS_FILE)
+    parser.add_argument('--json')
+    args = parser.parse_args(argv)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks {}'.format(sorted(unknown)))
+    with open(args.thresholds) as f:
+        thresholds = json.load(f)
+    metrics = OrderedDict()
+    passed = True
+    for name in args.benchmarks or list(BENCHMARKS):
+        directory = tempfile.mkdtemp()
+        try:
+            results = BENCHMARKS[name](args.scale, directory)
+        finally:
+            shutil.rmtree(directory)
+        for metric, value in sorted(results.items()):
+            key = '{b}.{m}'.format(b=name, m=metric)
+            metrics[key] = value
+            threshold = thresholds.get(key)
+            ok = check(value, threshold)
+            passed = passed and ok
+            print('{k:<42} {v:14.2f}  {t:<16} {s}'.format(
+                k=key, v=value,
+                t=' '.join('{}={}'.format(*i)
+                           for i in sorted((threshold or {}).items())),
+                s='ok' if ok else 'REGRESSION'))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(metrics, f, indent=2)
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
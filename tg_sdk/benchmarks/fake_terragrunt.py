@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+"""A stand-in for the terragrunt and terraform binaries, for benchmarks and
+tests that run real subprocesses without a cloud account.
+
+Usage: fake_terragrunt.py [run-all] <command> [options]
+
+Called through a link named terraform, or with FAKE_TG_MODE=terraform, it
+answers like Terraform. It handles --version, plan -json, plan -out=FILE,
+show -json FILE, apply, destroy, output -json, graph-dependencies,
+terragrunt-info, validate-inputs, render-json and init, in one module
+or, with run-all, in every module under the working directory. Modules are
+the directories that hold a terragrunt.hcl, and their dependency blocks
+make the dependency graph, see make_stack.
+
+The environment tunes it:
+    FAKE_TG_RESOURCES    resources per module, 10 by default.
+    FAKE_TG_DRIFT_EVERY  every nth resource drifted, 5 by default, 0 for
+                         none.
+    FAKE_TG_PAYLOAD      bytes of attribute values per change, 0 by
+                         default.
+    FAKE_TG_OUTPUTS      outputs per module, 3 by default.
+    FAKE_TG_LATENCY      seconds that each module takes, 0 by default.
+    FAKE_TG_FAIL         <command> or <command>:<module name>, fail there
+                         with exit code 1.
+"""
+import os
+import re
+import sys
+import json
+import time
+
+TERRAGRUNT_VERSION = 'v0.54.0'
+TERRAFORM_VERSION = '1.5.7'
+MODULE_FILE = 'terragrunt.hcl'
+SKIPPED_DIRECTORIES = {'.terragrunt-cache', '.terraform', '.git'}
+
+_config_path = re.compile(r'config_path\s*=\s*"([^"]+)"')
+
+
+def make_stack(root, modules, fanout=2, files=3, file_size=1024):
+    """Write a synthetic stack of modules m000, m001... where every module
+    but the first depends on one parent, fanout children per parent.
+
+    :param root: str, the stack directory, created if needed.
+    :param modules: int
+    :param fanout: int
+    :param files: int, .tf files per module.
+    :param file_size: int, bytes per .tf file.
+    :return: list of module directories.
+    """
+    paths = []
+    for index in range(modules):
+        name = 'm{:03d}'.format(index)
+        path = os.path.join(root, name)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, MODULE_FILE), 'w') as f:
+            if index:
+                f.write('dependency "parent" {{\n'
+                        '  config_path = "../m{:03d}"\n}}\n'.format(
+                            (index - 1) // fanout))
+        for number in range(files):
+            with open(os.path.join(path, 'main{}.tf'.format(number)),
+                      'w') as f:
+                f.write('# {}\n'.format(name).ljust(file_size, '#'))
+        paths.append(path)
+    return paths
+
+
+def find_modules(root):
+    modules = []
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d not in SKIPPED_DIRECTORIES)
+        if MODULE_FILE in files:
+            modules.append(directory)
+    return modules
+
+
+def module_dependencies(module):
+    with open(os.path.join(module, MODULE_FILE)) as f:
+        paths = _config_path.findall(f.read())
+    return [os.path.normpath(os.path.join(module, p)) for p in paths]
+
+
+def setting(name, default):
+    return type(default)(os.environ.get('FAKE_TG_' + name, default))
+
+
+def write(message):
+    sys.stdout.write(message + '\n')
+
+
+def fail_here(command, module):
+    fail = os.environ.get('FAKE_TG_FAIL', '')
+    if not fail:
+        return False
+    failed_command, _, failed_module = fail.partition(':')
+    return failed_command == command and \
+        (not failed_module or failed_module == os.path.basename(module))
+
+
+def run_module(command, module, json_output, plan_file=None):
+    time.sleep(setting('LATENCY', 0.0))
+    if fail_here(command, module):
+        sys.stderr.write('Error: {c} failed in {m}\n'.format(
+            c=command, m=module))
+        sys.exit(1)
+    name = os.path.basename(module)
+    resources = setting('RESOURCES', 10)
+    outputs = {'{n}_output_{i}'.format(n=name, i=i):
+               {'sensitive': False, 'type': 'string',
+                'value': '{n}-{i}'.format(n=name, i=i)}
+               for i in range(setting('OUTPUTS', 3))}
+    if command == 'plan':
+        if plan_file:
+            with open(os.path.join(module, plan_file), 'w') as f:
+                json.dump(show_document(name, resources, outputs), f)
+        plan(name, resources, outputs, json_output)
+    elif command == 'show':
+        with open(os.path.join(module, plan_file)) as f:
+            write(f.read())
+    elif command in ('apply', 'destroy'):
+        write('{n}: {c} complete! Resources: {r} {a}.'.format(
+            n=name, c=command.capitalize(), r=resources,
+            a='added' if command == 'apply' else 'destroyed'))
+    elif command == 'output':
+        write(json.dumps(outputs))
+    elif command == 'init':
+        write('Terraform has been successfully initialized!')
+    elif command == 'terragrunt-info':
+        write(json.dumps({'WorkingDir': module,
+                          'DownloadDir': os.path.join(
+                              module, '.terragrunt-cache')}))
+    elif command in ('validate-inputs', 'render-json'):
+        write('{n}: {c} succeeded.'.format(n=name, c=command))
+    else:
+        sys.stderr.write('Unknown command {}\n'.format(command))
+        sys.exit(1)
+
+
+def plan(name, resources, outputs, json_output):
+    if not json_output:
+        write('Plan: {r} to add, 0 to change, 0 to destroy.'.format(
+            r=resources))
+        return
+    payload = 'x' * setting('PAYLOAD', 0)
+    drift_every = setting('DRIFT_EVERY', 5)
+    write(json.dumps({'@level': 'info', 'type': 'version',
+                      '@message': 'Terraform {}'.format(TERRAFORM_VERSION),
+                      'terraform': TERRAFORM_VERSION}))
+    for index in range(resources):
+        address = 'null_resource.{n}_{i}'.format(n=name, i=index)
+        resource = {'addr': address, 'module': '',
+                    'resource_type': 'null_resource',
+                    'resource_name': '{n}_{i}'.format(n=name, i=index)}
+        if drift_every and index % drift_every == 0:
+            write(json.dumps({
+                'type': 'resource_drift',
+                '@message': '{}: Drift detected (update)'.format(address),
+                'change': {'resource': resource, 'action': 'update',
+                           'before': {'value': payload},
+                           'after': {'value': payload + '!'}}}))
+        write(json.dumps({
+            'type': 'planned_change',
+            '@message': '{}: Plan to create'.format(address),
+            'change': {'resource': resource, 'action': 'create',
+                       'after': {'value': payload}}}))
+    write(json.dumps({'type': 'change_summary',
+                      'changes': {'add': resources, 'change': 0,
+                                  'remove': 0, 'operation': 'plan'}}))
+    write(json.dumps({'type': 'outputs', 'outputs': outputs}))
+
+
+def show_document(name, resources, outputs):
+    """The `show -json` document of a plan file, with the same changes as
+    plan, a secret attribute in every resource and the state and
+    configuration that make real documents large."""
+    payload = 'x' * setting('PAYLOAD', 0)
+    drift_every = setting('DRIFT_EVERY', 5)
+    changes = []
+    drift = []
+    values = []
+    for index in range(resources):
+        resource = {'address': 'null_resource.{n}_{i}'.format(
+                        n=name, i=index),
+                    'mode': 'managed',
+                    'type': 'null_resource',
+                    'name': '{n}_{i}'.format(n=name, i=index),
+                    'provider_name': 'registry.terraform.io/hashicorp/null'}
+        after = {'value': payload, 'secret': '{}-secret'.format(name)}
+        if drift_every and index % drift_every == 0:
+            drift.append(dict(resource, change={
+                'actions': ['update'],
+                'before': {'value': payload},
+                'after': {'value': payload + '!'}}))
+        changes.append(dict(resource, change={
+            'actions': ['create'],
+            'before': None,
+            'after': after,
+            'after_unknown': {'id': True},
+            'before_sensitive': False,
+            'after_sensitive': {'secret': True}}))
+        values.append(dict(resource, values=after))
+    return {
+        'format_version': '1.2',
+        'terraform_version': TERRAFORM_VERSION,
+        'planned_values': {'root_module': {'resources': values}},
+        'resource_drift': drift,
+        'resource_changes': changes,
+        'output_changes': {
+            k: {'actions': ['create'], 'before': None, 'after': v['value'],
+                'after_unknown': False, 'before_sensitive': False,
+                'after_sensitive': v['sensitive']}
+            for k, v in outputs.items()},
+        'prior_state': {'values': {'root_module': {'resources': values}}},
+        'configuration': {'root_module': {'resources': values}},
+        'errored': False
+    }
+
+
+def graph_dependencies(modules):
+    write('digraph {')
+    for module in modules:
+        write('\t"{}" ;'.format(module))
+        for dependency in module_dependencies(module):
+            write('\t"{m}" -> "{d}";'.format(m=module, d=dependency))
+    write('}')
+
+
+def option(args, name):
+    if name in args[:-1]:
+        return args[args.index(name) + 1]
+
+
+def plan_file(command, args):
+    """The file that plan -out writes, or that show reads."""
+    if command == 'show':
+        return args[-1]
+    for arg in args:
+        if arg.startswith('-out='):
+            return arg[len('-out='):]
+
+
+def main(argv):
+    terraform = os.path.basename(argv[0]).startswith('terraform') or \
+        os.environ.get('FAKE_TG_MODE') == 'terraform'
+    args = list(argv[1:])
+    if '--version' in args or 'version' in args[:1]:
+        if terraform:
+            write('Terraform v{}\non linux_amd64'.format(TERRAFORM_VERSION))
+        else:
+            write('terragrunt version {}'.format(TERRAGRUNT_VERSION))
+        return
+    run_all = 'run-all' in args
+    commands = [a for a in args if a != 'run-all']
+    if not commands or commands[0].startswith('-'):
+        sys.stderr.write('No command.\n')
+        sys.exit(1)
+    command = commands[0]
+    working_dir = os.path.abspath(
+        option(args, '--terragrunt-working-dir') or os.getcwd())
+    if command == 'graph-dependencies':
+        graph_dependencies(find_modules(working_dir))
+        return
+    if run_all and not terraform:
+        modules = find_modules(working_dir)
+    else:
+        modules = [working_dir]
+    for module in modules:
+        run_module(command, module, '-json' in args,
+                   plan_file(command, args))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
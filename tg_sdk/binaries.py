@@ -0,0 +1,239 @@
+"""A manager wide store of the binaries that the install operation
+downloads, so every node instance links to one verified copy instead of
+downloading its own.
+
+The store is content addressed: <root>/<sha256>/<name> holds a binary and
+<root>/<sha256>/refs the paths that link to it, one file per path. An
+index maps each installation source URL to the digest it downloaded. A
+binary is removed once no path refers to it any more.
+
+The store must be private to the user that runs the operations: a binary
+in it is executed by every deployment that links to it. Its root must be
+a directory that this user owns and that no one else may write to, and a
+binary is hashed again before every link, so a binary that was changed in
+the store is downloaded again rather than installed.
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+from cloudify.exceptions import NonRecoverableError
+
+from . import utils
+from .cache import cache_key, file_lock, private_directory
+
+INDEX_DIR = 'urls'
+REFS_DIR = 'refs'
+LOCKS_DIR = '.locks'
+LINK_MODES = ['copy', 'hardlink', 'symlink']
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BinaryStore(object):
+
+    def __init__(self, root, logger=None):
+        """
+        :param root: str, the store directory.
+        :param logger: logger
+        """
+        self.root = root
+        self._logger = logger
+
+    @property
+    def logger(self):
+        return self._logger or utils.get_logger('TerragruntLogger')
+
+    def check_root(self):
+        """Create the root, private to this user, or check that it is.
+
+        :raises NonRecoverableError: if someone else could change it.
+        """
+        private_directory(self.root)
+
+    def _lock(self, name):
+        return file_lock(os.path.join(self.root, LOCKS_DIR, name + '.lock'))
+
+    def _index_path(self, url):
+        return os.path.join(self.root, INDEX_DIR, cache_key(url))
+
+    def _refs(self, digest):
+        return os.path.join(self.root, digest, REFS_DIR)
+
+    def path(self, digest, name):
+        return os.path.join(self.root, digest, name)
+
+    def lookup(self, url):
+        """The digest of the binary that url was downloaded to, if it is
+        still in the store."""
+        try:
+            with open(self._index_path(url)) as f:
+                digest = json.load(f)['sha256']
+        except (OSError, ValueError, KeyError):
+            return
+        if os.path.isdir(os.path.join(self.root, digest)):
+            return digest
+
+    def _fetch(self, url, name, download, sha256=None):
+        """Download url into the store, unless it is there already, and
+        verify it against sha256.
+
+        :return: str, the digest.
+        """
+        with self._lock(cache_key(url)):
+            digest = sha256 or self.lookup(url)
+            if digest and os.path.isfile(self.path(digest, name)):
+                return digest
+            staging = tempfile.mkdtemp(dir=self.root, prefix='.staging-')
+            try:
+                downloaded = os.path.join(staging, name)
+                self.logger.info('Downloading {u} to the binary store.'.format(
+                    u=url))
+                download(downloaded, url)
+                digest = file_sha256(downloaded)
+                if sha256 and digest != sha256.lower():
+                    raise NonRecoverableError(
+                        'The checksum of {u} is {d}, not {e}.'.format(
+                            u=url, d=digest, e=sha256))
+                os.chmod(downloaded, 0o755)
+                with self._lock('store'):
+                    entry = os.path.join(self.root, digest)
+                    if not os.path.isfile(self.path(digest, name)):
+                        os.makedirs(entry, exist_ok=True)
+                        os.rename(downloaded, self.path(digest, name))
+                    index_path = self._index_path(url)
+                    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+                    with open(index_path, 'w') as f:
+                        json.dump({'url': url, 'sha256': digest}, f)
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+            return digest
+
+    def install(self, url, target, download, sha256=None, mode='copy'):
+        """Make target a copy of, or a link to, the binary at url,
+        downloading it only if the store does not have it yet. Concurrent
+        installs of one url wait for the first download.
+
+        :param url: str, the installation source.
+        :param target: str, the executable path to create.
+        :param download: callable(path, url) that downloads url to path.
+        :param sha256: str, the expected checksum, verified on download.
+        :param mode: str, copy, hardlink, or symlink. hardlink falls back
+            to symlink across file systems.
+        :return: str, the digest.
+        """
+        if mode not in LINK_MODES:
+            raise ValueError('link mode {m} is not one of {l}'.format(
+                m=mode, l=LINK_MODES))
+        self.check_root()
+        name = os.path.basename(target)
+        target = os.path.abspath(target)
+        while True:
+            digest = self._fetch(url, name, download, sha256)
+            with self._lock('store'):
+                # Collected in between, fetch again.
+                if not os.path.isfile(self.path(digest, name)):
+                    continue
+                if file_sha256(self.path(digest, name)) != digest:
+                    self.logger.warning(
+                        'The binary {d} was changed in the store, '
+                        'downloading it again.'.format(d=digest))
+                    os.remove(self.path(digest, name))
+                    continue
+                os.makedirs(self._refs(digest), exist_ok=True)
+                with open(os.path.join(self._refs(digest),
+                                       cache_key(target)), 'w') as f:
+                    f.write(target)
+                if os.path.lexists(target):
+                    os.remove(target)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if mode == 'copy':
+                    fd, copied = tempfile.mkstemp(
+                        dir=os.path.dirname(target), prefix='.' + name)
+                    os.close(fd)
+                    shutil.copyfile(self.path(digest, name), copied)
+                    os.chmod(copied, 0o755)
+                    os.replace(copied, target)
+                    return digest
+                if mode == 'hardlink':
+                    try:
+                        os.link(self.path(digest, name), target)
+                        return digest
+                    except OSError:
+                        pass
+                os.symlink(self.path(digest, name), target)
+                return digest
+
+    def references(self, digest):
+        """The paths that link to the binary with digest."""
+        refs = self._refs(digest)
+        if not os.path.isdir(refs):
+            return []
+        paths = []
+        for ref in sorted(os.listdir(refs)):
+            try:
+                with open(os.path.join(refs, ref)) as f:
+                    paths.append(f.read())
+            except OSError:
+                continue
+        return paths
+
+    def release(self, target):
+        """Remove target and its reference, and collect the binaries that
+        nothing refers to any more.
+
+        :param target: str, a path that install created.
+        :return: bool, whether target was in the store.
+        """
+        target = os.path.abspath(target)
+        found = False
+        with self._lock('store'):
+            for digest in self.digests():
+                ref = os.path.join(self._refs(digest), cache_key(target))
+                if os.path.exists(ref):
+                    os.remove(ref)
+                    found = True
+            if found and os.path.lexists(target):
+                os.remove(target)
+        self.collect()
+        return found
+
+    def digests(self):
+        if not os.path.isdir(self.root):
+            return []
+        return [d for d in sorted(os.listdir(self.root))
+                if not d.startswith('.') and d != INDEX_DIR]
+
+    def collect(self):
+        """Forget the references of paths that no longer exist, and remove
+        the binaries without references.
+
+        :return: list of removed digests.
+        """
+        removed = []
+        with self._lock('store'):
+            for digest in self.digests():
+                refs = self._refs(digest)
+                for ref in os.listdir(refs) if os.path.isdir(refs) else []:
+                    try:
+                        with open(os.path.join(refs, ref)) as f:
+                            target = f.read()
+                    except OSError:
+                        continue
+                    if not os.path.lexists(target):
+                        os.remove(os.path.join(refs, ref))
+                if os.path.isdir(refs) and os.listdir(refs):
+                    continue
+                shutil.rmtree(os.path.join(self.root, digest))
+                removed.append(digest)
+        if removed:
+            self.logger.info('Removed unused binaries {}.'.format(removed))
+        return removed
@@ -0,0 +1,418 @@
+import os
+import stat
+import fcntl
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from subprocess import CalledProcessError, check_call
+
+from cloudify.exceptions import NonRecoverableError
+
+from . import utils
+
+LINK_MODES = ['hardlink', 'reflink', 'copy']
+LAST_USED_FILE = '.last_used'
+SIZE_FILE = '.size'
+CONTENT_DIR = 'content'
+# Created in the workspace by Terragrunt and Terraform, never by a source.
+PRESERVED_DIRECTORIES = {'.terragrunt-cache', '.terraform'}
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """Hold an flock on path, which is created if it does not exist.
+    Works across processes on the same host.
+
+    :param path: str, the lock file.
+    :param shared: bool, take a shared lock instead of an exclusive one.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield f
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def private_directory(path):
+    """Create path, private to this user, or check that it is. Caches
+    hold executables, sources and results that other operations use, so
+    no one else may be able to change them.
+
+    :param path: str
+    :raises NonRecoverableError: if someone else could change it.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise NonRecoverableError(
+            'The cache directory {p} is not a directory.'.format(p=path))
+    if info.st_uid != os.geteuid():
+        raise NonRecoverableError(
+            'The cache directory {p} is owned by uid {u}, not by this '
+            'user.'.format(p=path, u=info.st_uid))
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise NonRecoverableError(
+            'The cache directory {p} may be written by other users, mode '
+            '{m:o}.'.format(p=path, m=stat.S_IMODE(info.st_mode)))
+
+
+def cache_key(*parts):
+    return hashlib.sha256(
+        '\0'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def tree_digest(path):
+    """Digest the names and content of every file under path."""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            digest.update(os.path.relpath(file_path, path).encode('utf-8'))
+            digest.update(b'\0')
+            if os.path.islink(file_path):
+                digest.update(os.readlink(file_path).encode('utf-8'))
+            else:
+                with open(file_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        digest.update(chunk)
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def link_tree(src, dst, mode='reflink'):
+    """Populate dst with the content of src without downloading again.
+
+    hardlink shares the files with src, so they must never be modified in
+    place. reflink shares blocks copy-on-write where the filesystem
+    supports it and copies otherwise. copy always copies.
+
+    :param src: str, a directory.
+    :param dst: str, a directory, created if needed. Existing files are
+        replaced.
+    :param mode: str, one of LINK_MODES.
+    """
+    if mode not in LINK_MODES:
+        raise ValueError('link mode {m} is not one of {l}'.format(
+            m=mode, l=LINK_MODES))
+    os.makedirs(dst, exist_ok=True)
+    if mode == 'reflink':
+        try:
+            check_call(['cp', '-R', '--reflink=auto', '--preserve=mode',
+                        os.path.join(src, '.'), dst])
+            return
+        except (OSError, CalledProcessError):
+            mode = 'copy'
+    for root, dirs, files in os.walk(src):
+        target_root = os.path.join(dst, os.path.relpath(root, src))
+        for name in dirs:
+            source_dir = os.path.join(root, name)
+            if os.path.islink(source_dir):
+                os.symlink(os.readlink(source_dir),
+                           os.path.join(target_root, name))
+            else:
+                os.makedirs(os.path.join(target_root, name), exist_ok=True)
+        for name in files:
+            source_file = os.path.join(root, name)
+            target_file = os.path.join(target_root, name)
+            if os.path.lexists(target_file):
+                os.remove(target_file)
+            if mode == 'hardlink' and not os.path.islink(source_file):
+                try:
+                    os.link(source_file, target_file)
+                    continue
+                except OSError:
+                    pass
+            shutil.copy2(source_file, target_file, follow_symlinks=False)
+
+
+def file_digest(path):
+    """Digest the content of a file, or the target of a symlink."""
+    digest = hashlib.sha256()
+    if os.path.islink(path):
+        digest.update(b'link:' + os.readlink(path).encode('utf-8'))
+        return digest.hexdigest()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def sync_tree(src, dst, previous=None, mode='copy'):
+    """Make dst hold the files of src, writing only the ones that differ.
+
+    Unlike link_tree, unchanged files keep their inode and mtime, files
+    that the previous sync wrote and src no longer has are removed, and
+    PRESERVED_DIRECTORIES are never touched, so the caches that Terragrunt
+    and Terraform keep in dst stay warm. Other files in dst are left
+    alone.
+
+    :param src: str, a directory.
+    :param dst: str, a directory, created if needed.
+    :param previous: dict, the manifest that the previous sync returned.
+    :param mode: str, one of LINK_MODES. reflink copies file by file.
+    :return: (manifest, changed), the dict of relative path to digest of
+        every file of src, and the list of relative paths written.
+    """
+    if mode not in LINK_MODES:
+        raise ValueError('link mode {m} is not one of {l}'.format(
+            m=mode, l=LINK_MODES))
+    previous = previous or {}
+    manifest = {}
+    changed = []
+    os.makedirs(dst, exist_ok=True)
+    for root, dirs, files in os.walk(src):
+        dirs.sort()
+        names = sorted(files)
+        for name in list(dirs):
+            if name in PRESERVED_DIRECTORIES:
+                dirs.remove(name)
+            elif os.path.islink(os.path.join(root, name)):
+                names.append(name)
+        for name in names:
+            source_file = os.path.join(root, name)
+            relative_path = os.path.relpath(source_file, src)
+            target_file = os.path.join(dst, relative_path)
+            digest = file_digest(source_file)
+            manifest[relative_path] = digest
+            if os.path.lexists(target_file) and \
+                    not (os.path.isdir(target_file) and
+                         not os.path.islink(target_file)) and \
+                    (previous.get(relative_path) == digest or
+                     file_digest(target_file) == digest):
+                continue
+            _remove(target_file)
+            os.makedirs(os.path.dirname(target_file), exist_ok=True)
+            changed.append(relative_path)
+            if mode == 'hardlink' and not os.path.islink(source_file):
+                try:
+                    os.link(source_file, target_file)
+                    continue
+                except OSError:
+                    pass
+            if os.path.islink(source_file):
+                os.symlink(os.readlink(source_file), target_file)
+            else:
+                shutil.copy2(source_file, target_file)
+    for relative_path in sorted(set(previous) - set(manifest)):
+        if PRESERVED_DIRECTORIES.intersection(relative_path.split(os.sep)):
+            continue
+        _remove(os.path.join(dst, relative_path))
+        changed.append(relative_path)
+        directory = os.path.dirname(os.path.join(dst, relative_path))
+        while directory != os.path.normpath(dst) and \
+                os.path.isdir(directory) and not os.listdir(directory):
+            os.rmdir(directory)
+            directory = os.path.dirname(directory)
+    return manifest, changed
+
+
+class LRUCache(object):
+    """A directory of immutable entries addressed by key, shared by every
+    process on the host.
+
+    Each entry lives in <root>/<key>/content. Entries are created under a
+    per key lock, so concurrent workers wait for the first one instead of
+    fetching the same content again, and the least recently used entries
+    are removed once the total size is above max_size.
+    """
+
+    def __init__(self, root, max_size=None, logger=None):
+        """
+        :param root: str, the cache directory.
+        :param max_size: int, in bytes. None or 0 means unbounded.
+        :param logger: logger
+        """
+        self.root = root
+        self.max_size = max_size
+        self._logger = logger
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def logger(self):
+        return self._logger or utils.get_logger('TerragruntLogger')
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def _lock(self, key, shared=False):
+        return file_lock(os.path.join(self.root, '.locks', key + '.lock'),
+                         shared)
+
+    def path(self, key):
+        return os.path.join(self._entry(key), CONTENT_DIR)
+
+    def _touch(self, key):
+        last_used = os.path.join(self._entry(key), LAST_USED_FILE)
+        with open(last_used, 'a'):
+            os.utime(last_used, None)
+
+    def _complete(self, key):
+        return os.path.exists(os.path.join(self._entry(key), SIZE_FILE))
+
+    def get(self, key):
+        """Return the content path of key, or None if it is not cached."""
+        if not self._complete(key):
+            return
+        with self._lock(key):
+            if not self._complete(key):
+                return
+            self._touch(key)
+        self.hits += 1
+        return self.path(key)
+
+    def get_or_create(self, key, populate):
+        """Return the content path of key, creating it with populate on a
+        miss.
+
+        :param key: str
+        :param populate: callable(path) that must create path, a directory
+            or a file, with the content for key.
+        :return: str
+        """
+        path = self.get(key)
+        if path:
+            return path
+        with self._lock(key):
+            if self._complete(key):
+                self._touch(key)
+                self.hits += 1
+                return self.path(key)
+            self.misses += 1
+            entry = self._entry(key)
+            if os.path.exists(entry):
+                shutil.rmtree(entry)
+            os.makedirs(self.root, exist_ok=True)
+            staging = tempfile.mkdtemp(dir=self.root, prefix='.staging-')
+            try:
+                populate(os.path.join(staging, CONTENT_DIR))
+                size = directory_size(staging) \
+                    if os.path.isdir(os.path.join(staging, CONTENT_DIR)) \
+                    else os.path.getsize(os.path.join(staging, CONTENT_DIR))
+                with open(os.path.join(staging, SIZE_FILE), 'w') as f:
+                    f.write(str(size))
+                os.rename(staging, entry)
+            except Exception:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+            self._touch(key)
+        self.evict(keep=key)
+        return self.path(key)
+
+    def link(self, key, populate, target, mode='reflink'):
+        """Materialize the content of key in target, creating the entry
+        with populate on a miss. The entry can not be evicted while it is
+        being linked.
+
+        :param key: str
+        :param populate: callable(path), see get_or_create.
+        :param target: str, a directory.
+        :param mode: str, one of LINK_MODES.
+        :return: str, the content path in the cache.
+        """
+        while True:
+            path = self.get_or_create(key, populate)
+            with self._lock(key, shared=True):
+                if self._complete(key):
+                    link_tree(path, target, mode)
+                    return path
+
+    def sync(self, key, populate, target, previous=None, mode='reflink'):
+        """Like link, with sync_tree instead of link_tree, so only the
+        files that differ from the previous sync are written to target.
+
+        :param previous: dict, the manifest of the previous sync.
+        :return: (manifest, changed), see sync_tree.
+        """
+        while True:
+            path = self.get_or_create(key, populate)
+            with self._lock(key, shared=True):
+                if self._complete(key):
+                    return sync_tree(path, target, previous, mode)
+
+    def entries(self):
+        """Yield (key, size, last used time) for every complete entry."""
+        if not os.path.isdir(self.root):
+            return
+        for key in os.listdir(self.root):
+            if key.startswith('.'):
+                continue
+            entry = self._entry(key)
+            try:
+                with open(os.path.join(entry, SIZE_FILE)) as f:
+                    size = int(f.read() or 0)
+                last_used = os.path.getmtime(
+                    os.path.join(entry, LAST_USED_FILE))
+            except (OSError, ValueError):
+                continue
+            yield key, size, last_used
+
+    def remove(self, key):
+        with self._lock(key):
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the cache fits in
+        max_size.
+
+        :param keep: str, a key that must not be removed.
+        :return: list of removed keys.
+        """
+        if not self.max_size:
+            return []
+        removed = []
+        with file_lock(os.path.join(self.root, '.locks', '.evict.lock')):
+            entries = sorted(self.entries(), key=lambda e: e[2])
+            total = sum(e[1] for e in entries)
+            for key, size, _ in entries:
+                if total <= self.max_size:
+                    break
+                if key == keep:
+                    continue
+                self.remove(key)
+                removed.append(key)
+                total -= size
+        if removed:
+            self.logger.debug('Evicted {n} entries from {r}.'.format(
+                n=len(removed), r=self.root))
+        return removed
+
+    def usage(self):
+        """Numbers for dashboards.
+
+        :return: dict
+        """
+        entries = list(self.entries())
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(entries),
+            'size': sum(e[1] for e in entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / lookups if lookups else None
+        }
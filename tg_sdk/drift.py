@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import tempfile
+
+CLEAN = 'clean'
+DRIFTED = 'drifted'
+FAILED = 'failed'
+TIMED_OUT = 'timed_out'
+
+ROOT_MODULE = '.'
+
+# What applying a change does, in resources to add, change and destroy.
+ACTION_COUNTS = {
+    'create': (1, 0, 0),
+    'update': (0, 1, 0),
+    'delete': (0, 0, 1),
+    'replace': (1, 0, 1),
+    'read': (0, 0, 0),
+    'noop': (0, 0, 0),
+}
+
+
+def new_counts():
+    return {'add': 0, 'change': 0, 'destroy': 0, 'addresses': []}
+
+
+def summarize_drift(plan, module=None):
+    """Count the drifted resources of a refresh-only plan per module.
+
+    :param plan: dict, as returned by Terragrunt.plan.
+    :param module: str, the Terragrunt module the plan was made in. By
+        default resources are grouped by their Terraform module.
+    :return: dict of module to add, change and destroy counts and the
+        drifted addresses.
+    """
+    modules = {}
+    for change in (plan or {}).get('resource_drifts', []):
+        resource = change.get('resource', {})
+        name = module or resource.get('module') or ROOT_MODULE
+        add, update, destroy = ACTION_COUNTS.get(
+            change.get('action'), (0, 1, 0))
+        counts = modules.setdefault(name, new_counts())
+        counts['add'] += add
+        counts['change'] += update
+        counts['destroy'] += destroy
+        counts['addresses'].append(resource.get('addr'))
+    return modules
+
+
+def stack_drift(modules=None, error=None, timed_out=False):
+    """The compact drift entry of one stack.
+
+    :param modules: dict, as returned by summarize_drift.
+    :param error: str, why the stack could not be checked.
+    :param timed_out: bool, whether it was stopped by its timeout.
+    :return: dict
+    """
+    if error:
+        return {'status': TIMED_OUT if timed_out else FAILED,
+                'error': error}
+    if not modules:
+        return {'status': CLEAN}
+    return {'status': DRIFTED, 'modules': modules}
+
+
+class DriftReport(object):
+    """Drift entries of many stacks, aggregated into one document."""
+
+    def __init__(self):
+        self.stacks = {}
+
+    def add(self, stack_id, entry):
+        self.stacks[stack_id] = entry
+
+    def load(self, directory):
+        """Add the <stack id>.json entries written to directory."""
+        if not os.path.isdir(directory):
+            return self
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    self.add(name[:-len('.json')], json.load(f))
+            except (OSError, ValueError):
+                continue
+        return self
+
+    def to_dict(self):
+        totals = {'add': 0, 'change': 0, 'destroy': 0}
+        statuses = {CLEAN: 0, DRIFTED: 0, FAILED: 0, TIMED_OUT: 0}
+        for entry in self.stacks.values():
+            statuses[entry['status']] = statuses.get(entry['status'], 0) + 1
+            for counts in entry.get('modules', {}).values():
+                for key in totals:
+                    totals[key] += counts[key]
+        return {
+            'generated_at': time.time(),
+            'summary': dict(statuses, stacks=len(self.stacks), **totals),
+            'stacks': self.stacks
+        }
+
+    def write(self, path):
+        """Write the report as JSON, replacing path atomically.
+
+        :return: dict, the report that was written.
+        """
+        report = self.to_dict()
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                mode='w', dir=directory, delete=False) as f:
+            json.dump(report, f, sort_keys=True, separators=(',', ':'))
+        os.replace(f.name, path)
+        return report
@@ -0,0 +1,295 @@
+import os
+import re
+import json
+import hashlib
+import tempfile
+
+from . import utils
+
+FINGERPRINTS_FILE = '.tg_fingerprints.json'
+SAVED_PLAN_FILE = '.tg_saved_plan.json'
+INIT_FINGERPRINTS_FILE = '.tg_init_fingerprints.json'
+
+MODULE_FILE = 'terragrunt.hcl'
+DEPENDENCY_LOCK_FILE = '.terraform.lock.hcl'
+TERRAGRUNT_CACHE = '.terragrunt-cache'
+
+# Blocks that configure where state is kept.
+BACKEND_BLOCKS = ('remote_state', 'backend')
+
+_source_ref = re.compile(r'^\s*(source|version)\s*=\s*(.+?)\s*$', re.M)
+_local_backend = re.compile(r'\bbackend\s*=?\s*"local"')
+_get_env = re.compile(
+    r'get_env\(\s*"([^"]*)"\s*(?:,\s*"([^"]*)"\s*)?\)')
+_block_start = re.compile(r'^\s*(\w+)\b[^=\n{]*{', re.M)
+
+# Files that change what Terragrunt or Terraform would do in a module.
+SOURCE_SUFFIXES = ('.hcl', '.tf', '.tf.json', '.tfvars', '.tfvars.json')
+
+# Directories that hold downloaded or generated state, never sources.
+IGNORED_DIRECTORIES = {'.terragrunt-cache', '.terraform', '.git'}
+
+
+def hash_file(path, algorithm='sha256', chunk_size=1024 * 1024):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_values(*values):
+    """Digest JSON serializable values, independent of dict order."""
+    digest = hashlib.sha256()
+    for value in values:
+        digest.update(json.dumps(value, sort_keys=True, default=str)
+                      .encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def iter_source_files(directory, exclude=None):
+    """Yield the Terragrunt and Terraform files under directory.
+
+    :param directory: str
+    :param exclude: set of directories not to descend into, like nested
+        modules that are fingerprinted on their own.
+    :return: generator of absolute paths, in a stable order.
+    """
+    exclude = {os.path.abspath(e) for e in exclude or []}
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(
+            d for d in dirs if d not in IGNORED_DIRECTORIES and
+            os.path.abspath(os.path.join(root, d)) not in exclude)
+        for name in sorted(files):
+            if name.endswith(SOURCE_SUFFIXES):
+                yield os.path.join(root, name)
+
+
+def directory_fingerprint(directory, exclude=None):
+    files = {}
+    for path in iter_source_files(directory, exclude):
+        files[os.path.relpath(path, directory)] = hash_file(path)
+    return hash_values(files)
+
+
+def parent_files(directory, stack_dir):
+    """The *.hcl files in the directories between a module and the stack
+    root, which a module may include."""
+    directory = os.path.abspath(directory)
+    stack_dir = os.path.abspath(stack_dir)
+    found = []
+    while directory.startswith(stack_dir) and directory != stack_dir:
+        directory = os.path.dirname(directory)
+        found.extend(os.path.join(directory, f)
+                     for f in sorted(os.listdir(directory))
+                     if f.endswith('.hcl'))
+    return found
+
+
+def find_modules(directory):
+    """The directories under directory, itself included, that hold a
+    terragrunt.hcl.
+
+    :return: list of absolute paths, in a stable order.
+    """
+    modules = []
+    for root, dirs, files in os.walk(os.path.abspath(directory)):
+        dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRECTORIES)
+        if MODULE_FILE in files:
+            modules.append(root)
+    return modules
+
+
+def hcl_blocks(text, names):
+    """The text of the top level blocks of HCL text whose type is one of
+    names, for example remote_state { ... }.
+
+    :return: list of str
+    """
+    blocks = []
+    position = 0
+    while True:
+        start = _block_start.search(text, position)
+        if not start:
+            return blocks
+        depth = 0
+        end = start.end() - 1
+        for end in range(start.end() - 1, len(text)):
+            if text[end] == '{':
+                depth += 1
+            elif text[end] == '}':
+                depth -= 1
+                if not depth:
+                    break
+        if start.group(1) in names:
+            blocks.append(text[start.start():end + 1].strip())
+        position = end + 1
+
+
+def is_initialized(module):
+    """Whether init left a .terraform directory in module, or in the
+    copy of it that Terragrunt keeps in .terragrunt-cache."""
+    if os.path.isdir(os.path.join(module, '.terraform')):
+        return True
+    for _, dirs, _ in os.walk(os.path.join(module, TERRAGRUNT_CACHE)):
+        if '.terraform' in dirs:
+            return True
+    return False
+
+
+def init_fingerprint(module, stack_dir, *inputs):
+    """Fingerprint what init depends on in a module: the dependency lock
+    file, the module and provider source references, the backend
+    configuration, whether it was initialized at all, and inputs such as
+    the binaries.
+
+    :param module: str, the module directory.
+    :param stack_dir: str, the root of the stack, whose .hcl files the
+        module may include.
+    :return: str
+    """
+    files = list(iter_source_files(module, {
+        m for m in find_modules(module) if m != os.path.abspath(module)}))
+    files.extend(parent_files(module, stack_dir))
+    sources = set()
+    backends = []
+    for path in files:
+        with open(path, errors='replace') as f:
+            text = f.read()
+        sources.update(m.group(0).strip() for m in _source_ref.finditer(text))
+        backends.extend(hcl_blocks(text, BACKEND_BLOCKS))
+    lock_file = os.path.join(module, DEPENDENCY_LOCK_FILE)
+    return hash_values(
+        sorted(sources),
+        sorted(backends),
+        hash_file(lock_file) if os.path.isfile(lock_file) else None,
+        is_initialized(module),
+        *inputs)
+
+
+def resolve_backend(block, module, stack_dir, environment):
+    """Resolve the Terragrunt functions that decide where a backend block
+    keeps state: get_env, get_terragrunt_dir and path_relative_to_include.
+
+    :param block: str, as returned by hcl_blocks.
+    :param module: str, the module directory.
+    :param stack_dir: str, the root of the stack.
+    :param environment: dict, the environment of the command.
+    :return: str
+    """
+    block = _get_env.sub(
+        lambda m: environment.get(m.group(1), m.group(2) or ''), block)
+    return block.replace(
+        'get_terragrunt_dir()', os.path.realpath(module)).replace(
+        'path_relative_to_include()', os.path.relpath(module, stack_dir))
+
+
+def state_identity(module, stack_dir, environment):
+    """Identify the state that commands in a module read: the resolved
+    backend configuration, with the real module directory if the state is
+    local, which it is when there is no backend configuration.
+
+    :param module: str, the module directory.
+    :param stack_dir: str, the root of the stack, whose .hcl files the
+        module may include.
+    :param environment: dict, the environment of the command.
+    :return: dict
+    """
+    files = list(iter_source_files(module, {
+        m for m in find_modules(module) if m != os.path.abspath(module)}))
+    files.extend(parent_files(module, stack_dir))
+    backends = []
+    for path in files:
+        with open(path, errors='replace') as f:
+            text = f.read()
+        backends.extend(resolve_backend(b, module, stack_dir, environment)
+                        for b in hcl_blocks(text, BACKEND_BLOCKS))
+    local = not backends or any(_local_backend.search(b) for b in backends)
+    return {
+        'backends': sorted(backends),
+        'local': os.path.realpath(module) if local else None
+    }
+
+
+def module_fingerprints(graph, stack_dir, *inputs):
+    """Fingerprint every module of a dependency graph.
+
+    :param graph: dict of module to the modules it depends on.
+    :param stack_dir: str, the root of the stack.
+    :param inputs: more values that affect every module, like variables
+        and environment variables.
+    :return: dict of module to digest.
+    """
+    modules = set(graph)
+    fingerprints = {}
+    for module in graph:
+        if not os.path.isdir(module):
+            fingerprints[module] = hash_values(module, *inputs)
+            continue
+        parents = {os.path.relpath(p, stack_dir): hash_file(p)
+                   for p in parent_files(module, stack_dir)}
+        fingerprints[module] = hash_values(
+            directory_fingerprint(module, modules - {module}),
+            parents,
+            *inputs)
+    return fingerprints
+
+
+def dependents_closure(graph, modules):
+    """Add every module that directly or indirectly depends on modules.
+
+    :param graph: dict of module to the modules it depends on.
+    :param modules: iterable
+    :return: set
+    """
+    selected = set(modules)
+    changed = True
+    while changed:
+        changed = False
+        for module, dependencies in graph.items():
+            if module not in selected and dependencies & selected:
+                selected.add(module)
+                changed = True
+    return selected
+
+
+def changed_modules(graph, current, previous):
+    """The modules whose fingerprint differs from the previous one, and
+    everything downstream of them.
+
+    :return: set
+    """
+    previous = previous or {}
+    changed = {m for m in graph if current.get(m) != previous.get(m)}
+    return dependents_closure(graph, changed)
+
+
+class FingerprintIndex(object):
+    """A JSON file of name to fingerprint, kept in the node instance
+    directory."""
+
+    def __init__(self, path, logger=None):
+        self.path = path
+        self.logger = logger or utils.get_logger('TerragruntLogger')
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.debug('Ignoring fingerprints in {p}: {e}'.format(
+                p=self.path, e=e))
+            return {}
+
+    def save(self, fingerprints):
+        if not self.path:
+            return
+        with tempfile.NamedTemporaryFile(
+                mode='w',
+                dir=os.path.dirname(self.path) or '.',
+                delete=False) as f:
+            json.dump(fingerprints, f, sort_keys=True)
+        os.replace(f.name, self.path)
@@ -0,0 +1,169 @@
+import json
+
+from . import utils
+
+# A single JSON message that does not end on the line where it started is
+# buffered until it is complete. Past this size we give up on it, so that a
+# runaway fragment can never make the parser hold the whole output.
+MAX_PENDING_SIZE = 16 * 1024 * 1024
+
+_decoder = json.JSONDecoder()
+
+
+def iter_lines(output):
+    """Yield lines from either a string or an iterable of lines/chunks.
+
+    :param output: str, bytes or an iterable of str/bytes.
+    :return: generator of str
+    """
+    if isinstance(output, bytes):
+        output = output.decode('utf-8', errors='replace')
+    if isinstance(output, str):
+        start = 0
+        length = len(output)
+        while start < length:
+            end = output.find('\n', start)
+            if end == -1:
+                end = length
+            yield output[start:end]
+            start = end + 1
+        return
+    for line in output or []:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        yield line.rstrip('\n')
+
+
+def _decode_all(text):
+    """Decode every JSON object that is concatenated in text.
+
+    :return: (objects, remainder) where remainder is the undecodable tail.
+    """
+    objects = []
+    index = text.find('{')
+    while index != -1:
+        try:
+            obj, end = _decoder.raw_decode(text, index)
+        except json.decoder.JSONDecodeError:
+            return objects, text[index:]
+        objects.append(obj)
+        index = text.find('{', end)
+    return objects, ''
+
+
+class JsonMessageDecoder(object):
+    """Incrementally decode the JSON messages in Terraform's machine
+    readable output, one line at a time.
+
+    A line may hold several concatenated messages, and a message that
+    starts at the beginning of a line may continue on the following lines.
+    Anything else that is not JSON, like state lock messages, is logged and
+    skipped.
+    """
+
+    def __init__(self, logger=None, max_pending=MAX_PENDING_SIZE):
+        """
+        :param logger: logger for skipped text.
+        :param max_pending: the largest incomplete message to buffer.
+        """
+        self.logger = logger or utils.get_logger()
+        self.max_pending = max_pending
+        self.pending = ''
+
+    def _skip(self, text):
+        self.logger.info('JSONDecodeError in line: {}'.format(text))
+
+    def feed(self, line):
+        """Decode one line.
+
+        :param line: str, without the line break.
+        :return: list of the messages that were completed by line.
+        """
+        pending = self.pending
+        if pending and line.startswith('{'):
+            self._skip(pending)
+            pending = self.pending = ''
+        if not pending and line.startswith('{'):
+            try:
+                return [json.loads(line)]
+            except json.decoder.JSONDecodeError:
+                pass
+        text = pending + '\n' + line if pending else line
+        objects, remainder = _decode_all(text)
+        if not remainder:
+            self.pending = ''
+        elif (pending or line.startswith('{')) and \
+                len(remainder) < self.max_pending:
+            self.pending = remainder
+        else:
+            self._skip(remainder)
+            self.pending = ''
+        return objects
+
+    def close(self):
+        """Report an incomplete message that never ended."""
+        if self.pending:
+            self._skip(self.pending)
+            self.pending = ''
+
+
+def iter_json_messages(output, logger=None, max_pending=MAX_PENDING_SIZE):
+    """Incrementally decode the JSON messages in Terraform's machine
+    readable output. See JsonMessageDecoder.
+
+    :param output: str or an iterable of lines.
+    :param logger: logger for skipped text.
+    :param max_pending: the largest incomplete message to buffer.
+    :return: generator of dict
+    """
+    decoder = JsonMessageDecoder(logger, max_pending)
+    for line in iter_lines(output):
+        for message in decoder.feed(line):
+            yield message
+    decoder.close()
+
+
+def new_plan():
+    return {
+        'resource_drifts': [],
+        'planned_changes': [],
+        'diagnostics': [],
+        'outputs': [],
+        'change_summary': {}
+    }
+
+
+def fold_message(plan, message):
+    """Merge a single Terraform JSON UI message into a plan dict.
+
+    :param plan: dict, as returned by new_plan.
+    :param message: dict, one decoded message.
+    :return: the plan.
+    """
+    message_type = message.get('type')
+    if message_type == 'outputs':
+        plan['outputs'] = message['outputs']
+    elif message_type == 'resource_drift':
+        plan['resource_drifts'].append(message['change'])
+    elif message_type == 'planned_change':
+        plan['planned_changes'].append(message['change'])
+    elif message_type == 'change_summary':
+        plan['change_summary'] = message['changes']
+    elif message_type == 'diagnostic':
+        plan['diagnostics'].append(message['diagnostic'])
+    return plan
+
+
+def parse_plan(output, logger=None):
+    """Build a plan dict from `plan -json` output without holding more
+    than one message of raw text at a time.
+
+    :param output: str or an iterable of lines.
+    :param logger: logger for skipped text.
+    :return: dict
+    """
+    plan = new_plan()
+    for message in iter_json_messages(output, logger):
+        if isinstance(message, dict):
+            fold_message(plan, message)
+    return plan
@@ -0,0 +1,142 @@
+"""What changed in a plan since the previous plan of the same stack.
+
+A plan index is the address and action of every drift and planned change
+of a plan, which is all a delta needs, kept in the node instance
+directory in place of the previous plan. plan_delta compares two indexes:
+the drifts that appeared, were resolved or changed their action, and the
+same for planned changes. Scans that find nothing new produce an empty
+delta, which is cheap to store and to alert on.
+
+The Terragrunt modules of a run-all stack may have resources with the
+same address, so a change is identified by its module directory and its
+address. The module is '' for a plan that was not told apart by module.
+"""
+from .fingerprint import hash_values
+from .plan_model import DRIFT, PLANNED, KINDS, PlanModel
+
+PLAN_INDEX_FILE = '.tg_plan_index.json'
+
+DRIFTS = 'drifts'
+CHANGES = 'changes'
+# The part of an index that holds the changes of each kind.
+INDEX_KEYS = {DRIFT: DRIFTS, PLANNED: CHANGES}
+# The lists of a delta, for each part of an index.
+DELTA_KEYS = {
+    DRIFTS: ('new_drifts', 'resolved_drifts', 'changed_drifts'),
+    CHANGES: ('new_changes', 'resolved_changes', 'changed_actions')
+}
+
+
+def _actions(plan, kind):
+    if isinstance(plan, PlanModel):
+        return {c.address: c.action for c in plan.query(kind=kind)}
+    return {(c.get('resource') or {}).get('addr') or '': c.get('action')
+            for c in plan.get(KINDS[kind]) or []}
+
+
+def plan_index(plan, modules=None):
+    """Index a plan for plan_delta.
+
+    :param plan: dict or PlanModel, as returned by Terragrunt.plan.
+    :param modules: dict of module directory to the plan of the module,
+        to tell the changes of every module apart. plan is not indexed
+        when it is given.
+    :return: dict
+    """
+    if modules is None:
+        modules = {'': plan}
+    index = {}
+    for kind, name in INDEX_KEYS.items():
+        actions = {m: _actions(p, kind) for m, p in modules.items()}
+        index[name] = {m: a for m, a in actions.items() if a}
+    index['digest'] = hash_values(index[DRIFTS], index[CHANGES])
+    return index
+
+
+def _entries(actions):
+    """The (module, address) of every change of a part of an index, with
+    its action."""
+    return {(module, address): action
+            for module, changes in (actions or {}).items()
+            for address, action in changes.items()}
+
+
+def _entry(key, **values):
+    module, address = key
+    entry = {'address': address}
+    if module:
+        entry['module'] = module
+    entry.update(values)
+    return entry
+
+
+def plan_delta(previous, current):
+    """Compare two plan indexes.
+
+    :param previous: dict, the index of the previous plan, empty if there
+        was none.
+    :param current: dict, the index of the new plan.
+    :return: dict, the lists of new, resolved and changed addresses of
+        drifts and planned changes, with their module when the plan was
+        told apart by module, and a summary of their counts.
+    """
+    delta = {
+        'digest': current['digest'],
+        'previous_digest': previous.get('digest'),
+        'summary': {
+            'baseline': not previous,
+            'changed': previous.get('digest') != current['digest'],
+            'drifted': len(_entries(current[DRIFTS])),
+            'planned': len(_entries(current[CHANGES]))
+        }
+    }
+    for name, (new, resolved, changed) in sorted(DELTA_KEYS.items()):
+        before = _entries(previous.get(name))
+        after = _entries(current[name])
+        delta[new] = [_entry(k, action=after[k])
+                      for k in sorted(after) if k not in before]
+        delta[resolved] = [_entry(k, action=before[k])
+                           for k in sorted(before) if k not in after]
+        delta[changed] = [
+            _entry(k, before=before[k], after=after[k])
+            for k in sorted(after) if k in before and before[k] != after[k]]
+        for key in (new, resolved, changed):
+            delta['summary'][key] = len(delta[key])
+    return delta
+
+
+def compact_delta(delta, max_addresses):
+    """Keep at most max_addresses entries in every list of a delta, the
+    summary keeps the full counts.
+
+    :param delta: dict, as returned by plan_delta.
+    :param max_addresses: int
+    :return: dict
+    """
+    compact = dict(delta)
+    for keys in DELTA_KEYS.values():
+        for key in keys:
+            compact[key] = delta[key][:max_addresses]
+    return compact
+
+
+def format_delta(delta):
+    """One line for the log about a delta.
+
+    :param delta: dict, as returned by plan_delta.
+    :return: str
+    """
+    summary = delta['summary']
+    if summary['baseline']:
+        return 'First plan of the stack: {d} drifted, {p} planned ' \
+               'changes.'.format(d=summary['drifted'], p=summary['planned'])
+    if not summary['changed']:
+        return 'The plan did not change since the last plan.'
+    return 'Since the last plan: {n} new, {r} resolved and {c} changed ' \
+           'drifts; {nc} new, {rc} resolved and {ca} changed planned ' \
+           'changes.'.format(n=summary['new_drifts'],
+                             r=summary['resolved_drifts'],
+                             c=summary['changed_drifts'],
+                             nc=summary['new_changes'],
+                             rc=summary['resolved_changes'],
+                             ca=summary['changed_actions'])
@@ -0,0 +1,325 @@
+"""A compact, indexed model of a plan, for plans with tens of thousands of
+resources.
+
+parse_plan builds nested dicts and lists, several objects per change.
+PlanModel keeps one PlanChange per change instead: a __slots__ record of
+the fields that queries use, with interned module paths, resource types,
+actions and kinds, and the rest of the change as compact JSON text that is
+only decoded when it is read. Indexes by address, module, resource type,
+action and kind answer questions like "which aws_instance changes in
+module.app" without scanning the plan.
+
+PlanModel is also a read-only mapping with the keys of the dict that
+parse_plan returns, so code written for that dict works with it, at the
+cost of decoding the changes it reads.
+"""
+import json
+from sys import intern
+from array import array
+from collections.abc import Mapping
+
+from .plan import iter_json_messages
+
+DRIFT = 'resource_drift'
+PLANNED = 'planned_change'
+KINDS = {DRIFT: 'resource_drifts', PLANNED: 'planned_changes'}
+INDEXES = ('address', 'module', 'resource_type', 'action', 'kind')
+
+_encoder = json.JSONEncoder(separators=(',', ':'))
+
+# The fields of a change's resource that PlanChange keeps as attributes,
+# and so leaves out of its JSON text.
+_RESOURCE_FIELDS = (('addr', 'address'),
+                    ('module', 'module'),
+                    ('resource_type', 'resource_type'),
+                    ('resource_name', 'resource_name'),
+                    ('resource', None))
+
+
+def split_address(address):
+    """Split a resource address into its module path, resource type and
+    name, for example module.app.aws_instance.web[0] into module.app,
+    aws_instance and web[0]. Dots inside brackets are not separators.
+
+    :param address: str
+    :return: (module, resource_type, resource_name)
+    """
+    parts = []
+    start = depth = 0
+    quoted = False
+    for index, char in enumerate(address):
+        if char == '"':
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+        elif char == '.' and not depth:
+            parts.append(address[start:index])
+            start = index + 1
+    parts.append(address[start:])
+    module = []
+    while len(parts) > 2 and parts[0] == 'module':
+        module.extend(parts[:2])
+        parts = parts[2:]
+    if parts[0] == 'data' and len(parts) > 2:
+        parts = parts[1:]
+    return ('.'.join(module),
+            parts[0] if len(parts) > 1 else '',
+            '.'.join(parts[1:]) if len(parts) > 1 else parts[0])
+
+
+class PlanChange(object):
+    """One resource drift or planned change."""
+
+    __slots__ = ('kind', 'address', 'module', 'resource_type',
+                 'resource_name', 'action', '_raw', '_fields')
+
+    def __init__(self, kind, change):
+        """
+        :param kind: str, DRIFT or PLANNED.
+        :param change: dict, the change of a resource_drift or
+            planned_change message.
+        """
+        resource = change.get('resource') or {}
+        self.kind = intern(kind)
+        self.address = resource.get('addr') or ''
+        module, resource_type, resource_name = split_address(self.address)
+        self.module = intern(resource.get('module') or module)
+        self.resource_type = intern(
+            resource.get('resource_type') or resource_type)
+        self.resource_name = resource.get('resource_name') or resource_name
+        self.action = intern(change.get('action') or '')
+        # What the attributes do not already hold.
+        rest = dict(change)
+        self._fields = 0
+        if isinstance(change.get('resource'), dict):
+            rest['resource'] = dict(resource)
+            for bit, (field, attribute) in enumerate(_RESOURCE_FIELDS):
+                if field in resource and \
+                        resource[field] == self._resource_field(attribute):
+                    del rest['resource'][field]
+                    self._fields |= 1 << bit
+        if 'action' in change and change['action'] == self.action:
+            del rest['action']
+            self._fields |= 1 << len(_RESOURCE_FIELDS)
+        self._raw = _encoder.encode(rest)
+
+    def __repr__(self):
+        return '<PlanChange {k} {a} {c}>'.format(
+            k=self.kind, a=self.action, c=self.address)
+
+    def _resource_field(self, attribute):
+        if attribute:
+            return getattr(self, attribute)
+        return '{t}.{n}'.format(t=self.resource_type, n=self.resource_name)
+
+    @property
+    def change(self):
+        """The change as Terraform reported it, decoded on every read.
+
+        :return: dict
+        """
+        change = json.loads(self._raw)
+        for bit, (field, attribute) in enumerate(_RESOURCE_FIELDS):
+            if self._fields & 1 << bit:
+                change['resource'][field] = self._resource_field(attribute)
+        if self._fields & 1 << len(_RESOURCE_FIELDS):
+            change['action'] = self.action
+        return change
+
+    @property
+    def before(self):
+        return self.change.get('before')
+
+    @property
+    def after(self):
+        return self.change.get('after')
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'address': self.address,
+            'module': self.module,
+            'resource_type': self.resource_type,
+            'resource_name': self.resource_name,
+            'action': self.action
+        }
+
+
+class PlanModel(Mapping):
+
+    def __init__(self):
+        self.changes = []
+        self.diagnostics = []
+        self.outputs = []
+        self.change_summary = {}
+        self._indexes = {name: {} for name in INDEXES}
+
+    def add(self, kind, change):
+        """Add a change and index it.
+
+        :param kind: str, DRIFT or PLANNED.
+        :param change: dict
+        :return: PlanChange
+        """
+        record = PlanChange(kind, change)
+        position = len(self.changes)
+        self.changes.append(record)
+        for name in INDEXES:
+            index = self._indexes[name]
+            key = getattr(record, name)
+            if key not in index:
+                index[key] = array('L')
+            index[key].append(position)
+        return record
+
+    def fold(self, message):
+        """Merge a single Terraform JSON UI message, like fold_message.
+
+        :param message: dict
+        :return: the plan.
+        """
+        message_type = message.get('type')
+        if message_type == 'outputs':
+            self.outputs = message['outputs']
+        elif message_type in KINDS:
+            self.add(message_type, message['change'])
+        elif message_type == 'change_summary':
+            self.change_summary = message['changes']
+        elif message_type == 'diagnostic':
+            self.diagnostics.append(message['diagnostic'])
+        return self
+
+    def query(self, kind=None, module=None, resource_type=None,
+              action=None, address=None):
+        """The changes that match every filter that is given, in plan
+        order.
+
+        :param kind: str, DRIFT or PLANNED.
+        :param module: str, the module path, '' for the root module.
+        :param resource_type: str, for example aws_instance.
+        :param action: str, for example update.
+        :param address: str
+        :return: list of PlanChange
+        """
+        filters = [(n, v) for n, v in [('kind', kind),
+                                       ('module', module),
+                                       ('resource_type', resource_type),
+                                       ('action', action),
+                                       ('address', address)]
+                   if v is not None]
+        if not filters:
+            return list(self.changes)
+        positions = sorted((self._indexes[n].get(v, ()) for n, v in filters),
+                           key=len)
+        matches = set(positions[0])
+        for other in positions[1:]:
+            matches.intersection_update(other)
+            if not matches:
+                break
+        return [self.changes[p] for p in sorted(matches)]
+
+    def count(self, **filters):
+        """The number of changes that match filters, see query."""
+        if len(filters) == 1:
+            name, value = next(iter(filters.items()))
+            return len(self._indexes[name].get(value, ()))
+        return len(self.query(**filters))
+
+    def get_change(self, address, kind=PLANNED):
+        """The change of address, None if it does not change."""
+        changes = self.query(kind=kind, address=address)
+        return changes[0] if changes else None
+
+    def values(self, index):
+        """The distinct values of an index, for example every module that
+        has changes.
+
+        :param index: str, one of INDEXES.
+        :return: list
+        """
+        return sorted(self._indexes[index])
+
+    def __getitem__(self, key):
+        for kind, name in KINDS.items():
+            if key == name:
+                return [c.change for c in self.query(kind=kind)]
+        if key == 'diagnostics':
+            return self.diagnostics
+        if key == 'outputs':
+            return self.outputs
+        if key == 'change_summary':
+            return self.change_summary
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(['resource_drifts', 'planned_changes', 'diagnostics',
+                     'outputs', 'change_summary'])
+
+    def __len__(self):
+        return 5
+
+    def to_dict(self):
+        """The plan as parse_plan returns it.
+
+        :return: dict
+        """
+        return dict(self.items())
+
+    def to_json(self, fp=None):
+        """Export the plan as parse_plan's JSON, one change at a time.
+
+        :param fp: a file to write to, or None to return a str.
+        :return: str, when fp is None.
+        """
+        chunks = self._iter_json()
+        if fp is None:
+            return ''.join(chunks)
+        for chunk in chunks:
+            fp.write(chunk)
+
+    def _iter_json(self):
+        yield '{'
+        for kind, name in sorted(KINDS.items(), key=lambda k: k[1]):
+            yield _encoder.encode(name) + ':['
+            for number, change in enumerate(self.query(kind=kind)):
+                yield (',' if number else '') + _encoder.encode(
+                    change.change)
+            yield '],'
+        yield '"diagnostics":' + _encoder.encode(self.diagnostics) + ','
+        yield '"outputs":' + _encoder.encode(self.outputs) + ','
+        yield '"change_summary":' + _encoder.encode(self.change_summary)
+        yield '}'
+
+    @classmethod
+    def from_dict(cls, plan):
+        """Build a model from a plan dict, such as a stored plan.
+
+        :param plan: dict, as returned by parse_plan.
+        :return: PlanModel
+        """
+        model = cls()
+        for kind, name in KINDS.items():
+            for change in plan.get(name) or []:
+                model.add(kind, change)
+        model.diagnostics = list(plan.get('diagnostics') or [])
+        model.outputs = plan.get('outputs') or []
+        model.change_summary = plan.get('change_summary') or {}
+        return model
+
+
+def parse_plan_model(output, logger=None):
+    """Build a PlanModel from `plan -json` output, like parse_plan.
+
+    :param output: str or an iterable of lines.
+    :param logger: logger for skipped text.
+    :return: PlanModel
+    """
+    model = PlanModel()
+    for message in iter_json_messages(output, logger):
+        if isinstance(message, dict):
+            model.fold(message)
+    return model
@@ -0,0 +1,165 @@
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import (
+    FIRST_EXCEPTION,
+    ThreadPoolExecutor,
+    wait
+)
+
+from . import utils
+from .scheduler import SUCCEEDED, FAILED
+
+CANCELLED = 'cancelled'
+
+
+class StageResult(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.status = None
+        self.value = None
+        self.error = None
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def duration(self):
+        if self.start_time is None or self.end_time is None:
+            return 0.0
+        return self.end_time - self.start_time
+
+    def to_dict(self):
+        return {
+            'status': self.status,
+            'duration': round(self.duration, 3),
+            'error': str(self.error) if self.error else None
+        }
+
+
+class Preflight(object):
+    """Run independent stages at the same time and fail fast.
+
+    Every stage starts right away, except the stages that must wait for
+    others, which change something that they use, such as the workspace.
+    They start once those succeeded, and are cancelled if one did not.
+    When a stage fails, the stages that did not start yet are cancelled
+    and on_cancel is called to stop the ones that are running. The first
+    error is raised once every running stage returned, since not every
+    executor can stop a command, and a stage that is still running could
+    go on changing the workspace after the operation failed.
+    """
+
+    def __init__(self,
+                 stages,
+                 max_workers=None,
+                 logger=None,
+                 wrapper=None,
+                 on_cancel=None,
+                 after=None):
+        """
+        :param stages: list of (name, callable) tuples.
+        :param max_workers: int, the pool size, defaults to one thread
+            per stage.
+        :param logger: logger
+        :param wrapper: callable(func) that returns the callable to run in
+            the worker thread, for example to set a thread local context.
+        :param on_cancel: callable() that stops the running stages.
+        :param after: dict of stage name to the names of the stages that
+            it starts after. They must come before it in stages.
+        """
+        self.stages = list(stages)
+        self.after = after or {}
+        names = [name for name, _ in self.stages]
+        for name, previous in self.after.items():
+            for other in previous:
+                if names.index(other) >= names.index(name):
+                    raise ValueError(
+                        'The stage {n} starts after {o}, which must come '
+                        'before it.'.format(n=name, o=other))
+        self.max_workers = max_workers or len(self.stages) or 1
+        self.logger = logger or utils.get_logger('TerragruntLogger')
+        self.wrapper = wrapper
+        self.on_cancel = on_cancel
+        self.results = OrderedDict(
+            (name, StageResult(name)) for name, _ in self.stages)
+        self._done = {name: threading.Event() for name in names}
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _run_stage(self, name, func):
+        result = self.results[name]
+        try:
+            for other in self.after.get(name, []):
+                # Submitted earlier, so it has a worker of its own.
+                self._done[other].wait()
+            if self.cancelled or any(
+                    self.results[o].status != SUCCEEDED
+                    for o in self.after.get(name, [])):
+                result.status = CANCELLED
+                return
+            result.start_time = time.time()
+            try:
+                result.value = func()
+            except Exception as e:
+                result.status = CANCELLED if self.cancelled else FAILED
+                result.error = e
+                raise
+            else:
+                result.status = SUCCEEDED
+            finally:
+                result.end_time = time.time()
+            return result.value
+        finally:
+            self._done[name].set()
+
+    def cancel(self):
+        if self.cancelled:
+            return
+        self._cancelled.set()
+        if self.on_cancel:
+            try:
+                self.on_cancel()
+            except Exception as e:
+                self.logger.debug(
+                    'Unable to cancel the preflight: {}'.format(e))
+
+    def timings(self):
+        return OrderedDict(
+            (name, result.to_dict()) for name, result in self.results.items())
+
+    def report(self):
+        self.logger.info('Preflight: {}.'.format(', '.join(
+            '{n} {s} after {d:.1f}s'.format(
+                n=r.name, s=r.status, d=r.duration)
+            for r in self.results.values())))
+
+    def run(self):
+        """Run every stage.
+
+        :return: dict of stage name to what it returned.
+        """
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = []
+        for name, func in self.stages:
+            if self.wrapper:
+                func = self.wrapper(func)
+            futures.append(pool.submit(self._run_stage, name, func))
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        failed = [r for r in self.results.values() if r.status == FAILED]
+        if failed:
+            self.cancel()
+            for future in pending:
+                future.cancel()
+        pool.shutdown(wait=True)
+        for result in self.results.values():
+            if result.status is None:
+                result.status = CANCELLED
+        self.report()
+        if failed:
+            raise min(failed, key=lambda r: r.end_time).error
+        return OrderedDict(
+            (name, result.value) for name, result in self.results.items())
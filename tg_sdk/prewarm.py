@@ -0,0 +1,188 @@
+"""Initialize a workspace in the background, before the first command
+needs it.
+
+Prewarm.start runs `python -m tg_sdk.prewarm` in a new session, so
+it outlives the operation that started it. The child inherits an exclusive
+lock on the workspace's prewarm lock file, holds it while init runs, and
+records the outcome in the status file. Waiting for the lock therefore
+waits for init. What to run is passed on stdin, which keeps secrets in
+the environment out of the process list.
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import tempfile
+from subprocess import PIPE, STDOUT, Popen, call
+
+from . import utils
+from .cache import file_lock
+
+PREWARM_LOCK = '.prewarm.lock'
+PREWARM_STATUS = '.prewarm.json'
+PREWARM_LOG = '.prewarm.log'
+NO_AUTO_INIT = '--terragrunt-no-auto-init'
+
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+def write_status(path, status):
+    directory = os.path.dirname(path) or '.'
+    with tempfile.NamedTemporaryFile(
+            mode='w', dir=directory, delete=False) as f:
+        json.dump(status, f)
+    os.replace(f.name, path)
+
+
+class Prewarm(object):
+
+    def __init__(self, directory, logger=None):
+        """
+        :param directory: str, the node instance directory, where the lock,
+            status and log files are kept.
+        :param logger: logger
+        """
+        self.directory = directory
+        self._logger = logger
+
+    @property
+    def logger(self):
+        return self._logger or utils.get_logger('TerragruntLogger')
+
+    @property
+    def lock_path(self):
+        return os.path.join(self.directory, PREWARM_LOCK)
+
+    @property
+    def status_path(self):
+        return os.path.join(self.directory, PREWARM_STATUS)
+
+    def status(self):
+        try:
+            with open(self.status_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def start(self, command, cwd, env=None, fingerprint=None,
+              provider_cache=None):
+        """Run command in the background, unless a prewarm of this
+        workspace already runs.
+
+        :param command: list, for example terragrunt run-all init.
+        :param cwd: str
+        :param env: dict, added to the environment.
+        :param fingerprint: str, identifies the sources that are warmed.
+        :param provider_cache: ProviderCache, whose session init runs in.
+        :return: bool, whether it started.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        lock = open(self.lock_path, 'a')
+        try:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self.logger.debug('The workspace is already being warmed.')
+                return False
+            spec = {
+                'command': command,
+                'cwd': cwd,
+                'env': env or {},
+                'lock_fd': lock.fileno(),
+                'status_path': self.status_path,
+                'fingerprint': fingerprint,
+                'provider_cache': provider_cache and {
+                    'root': provider_cache.root,
+                    'max_size': provider_cache.max_size,
+                    'mirror': provider_cache.mirror
+                }
+            }
+            write_status(self.status_path, {
+                'status': RUNNING,
+                'fingerprint': fingerprint,
+                'start_time': time.time()
+            })
+            package_dir = os.path.dirname(os.path.dirname(
+                os.path.abspath(__file__)))
+            child_env = dict(os.environ)
+            child_env['PYTHONPATH'] = os.pathsep.join(
+                [package_dir] + [p for p in [child_env.get('PYTHONPATH')]
+                                 if p])
+            with open(os.path.join(self.directory, PREWARM_LOG), 'w') as log:
+                process = Popen(
+                    [sys.executable, '-m', 'tg_sdk.prewarm'],
+                    cwd=cwd,
+                    env=child_env,
+                    stdin=PIPE,
+                    stdout=log,
+                    stderr=STDOUT,
+                    pass_fds=(lock.fileno(),),
+                    start_new_session=True)
+            process.stdin.write(json.dumps(spec).encode('utf-8'))
+            process.stdin.close()
+            self.logger.info('Warming the workspace in the background, '
+                             'pid {}.'.format(process.pid))
+            return True
+        finally:
+            # The child holds the lock from here on.
+            lock.close()
+
+    def wait(self):
+        """Wait for a prewarm that runs to end.
+
+        :return: dict, the status of the last prewarm, empty if there was
+            none.
+        """
+        if not os.path.exists(self.lock_path):
+            return {}
+        start = time.time()
+        with file_lock(self.lock_path, shared=True):
+            status = self.status()
+        waited = time.time() - start
+        if waited >= 1:
+            self.logger.info('Waited {:.1f}s for the workspace to be '
+                             'warmed.'.format(waited))
+        return status
+
+
+def is_warm(status, fingerprint):
+    """Whether a prewarm status is a successful init of the sources with
+    fingerprint."""
+    return status.get('status') == SUCCEEDED and \
+        status.get('fingerprint') == fingerprint
+
+
+def run(spec):
+    """The background process: run init while holding the lock that
+    start handed down, then record the outcome."""
+    status = {
+        'status': FAILED,
+        'fingerprint': spec['fingerprint'],
+        'start_time': time.time()
+    }
+    env = dict(os.environ)
+    env.update({k: str(v) for k, v in spec['env'].items()})
+    try:
+        if spec['provider_cache']:
+            from .providers import ProviderCache
+            cache = ProviderCache(**spec['provider_cache'])
+            with cache.session(spec['cwd']), cache.install(spec['cwd']):
+                returncode = call(spec['command'], cwd=spec['cwd'], env=env)
+        else:
+            returncode = call(spec['command'], cwd=spec['cwd'], env=env)
+        status['returncode'] = returncode
+        if returncode == 0:
+            status['status'] = SUCCEEDED
+    except Exception as e:
+        status['error'] = str(e)
+    status['end_time'] = time.time()
+    write_status(spec['status_path'], status)
+    os.close(spec['lock_fd'])
+    return 0 if status['status'] == SUCCEEDED else 1
+
+
+if __name__ == '__main__':
+    sys.exit(run(json.load(sys.stdin)))
@@ -0,0 +1,163 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+
+from . import utils
+
+PROBE_CACHE_FILE = '.tg_binary_probes.json'
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def binary_key(path):
+    """Identify a binary by its location and the state of the file.
+
+    A replaced or upgraded binary gets a new inode, mtime or size, so a
+    stale probe result is never returned for it.
+
+    :param path: str, absolute path or a name to look up in PATH.
+    :return: str or None if the binary can not be found.
+    """
+    if not path:
+        return
+    if os.path.sep not in path:
+        path = shutil.which(path) or path
+    try:
+        real_path = os.path.realpath(path)
+        stat = os.stat(real_path)
+    except OSError:
+        return
+    return '{p}|{i}|{m}|{s}'.format(
+        p=real_path, i=stat.st_ino, m=stat.st_mtime_ns, s=stat.st_size)
+
+
+class BinaryProbeCache(object):
+    """Remember the output of `<binary> --version` style probes.
+
+    Results are kept in memory and, when cache_file is provided, in a JSON
+    file, so that later operations on the same node instance do not have
+    to fork the binary again.
+    """
+
+    def __init__(self, cache_file=None, logger=None):
+        self.cache_file = cache_file
+        self._logger = logger
+        self._entries = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def logger(self):
+        return self._logger or utils.get_logger('TerragruntLogger')
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = self._load()
+        return self._entries
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def _load(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _save(self):
+        if not self.cache_file:
+            return
+        directory = os.path.dirname(self.cache_file) or '.'
+        try:
+            with tempfile.NamedTemporaryFile(mode='w',
+                                             dir=directory,
+                                             delete=False) as f:
+                json.dump(self._entries, f)
+            os.replace(f.name, self.cache_file)
+        except OSError as e:
+            self.logger.debug(
+                'Unable to store binary probes in {f}: {e}'.format(
+                    f=self.cache_file, e=e))
+
+    def _key(self, path, args):
+        key = binary_key(path)
+        if key:
+            return ' '.join([key] + list(args or ['--version']))
+
+    def get(self, path, args=None):
+        """The cached output of probing path with args, or None.
+
+        :param path: str, the binary.
+        :param args: list, defaults to ['--version'].
+        :return: str
+        """
+        key = self._key(path, args)
+        with self._lock:
+            if key and key in self.entries:
+                self.hits += 1
+                self.logger.debug(
+                    'Binary probe cache hit for {p}: {s}'.format(
+                        p=path, s=self.stats))
+                return self.entries[key]
+
+    def set(self, path, output, args=None):
+        """Record the output of probing path with args.
+
+        :param path: str, the binary.
+        :param output: str
+        :param args: list, defaults to ['--version'].
+        """
+        key = self._key(path, args)
+        with self._lock:
+            self.misses += 1
+            self.logger.debug('Binary probe cache miss for {p}: {s}'.format(
+                p=path, s=self.stats))
+            if key and output:
+                self.entries[key] = output
+                self._save()
+
+    def probe(self, path, runner, args=None):
+        """Return the output of running path with args, from the cache if
+        the binary did not change since it was last probed.
+
+        :param path: str, the binary.
+        :param runner: callable that receives the command list and returns
+            its output.
+        :param args: list, defaults to ['--version'].
+        :return: str
+        """
+        args = args or ['--version']
+        output = self.get(path, args)
+        if output is None:
+            output = runner([path] + list(args))
+            self.set(path, output, args)
+        return output
+
+
+def get_probe_cache(directory=None, logger=None):
+    """Return the probe cache shared by everyone in this process that
+    persists to the same directory.
+
+    :param directory: str, where to store the cache file, or None for an
+        in memory cache.
+    :param logger: logger
+    :return: BinaryProbeCache
+    """
+    cache_file = os.path.join(directory, PROBE_CACHE_FILE) \
+        if directory else None
+    with _caches_lock:
+        if cache_file not in _caches:
+            _caches[cache_file] = BinaryProbeCache(cache_file, logger)
+        elif logger:
+            _caches[cache_file]._logger = logger
+        return _caches[cache_file]
@@ -0,0 +1,316 @@
+import os
+import re
+import json
+import fcntl
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from . import utils
+from .cache import file_lock, directory_size
+
+PLUGIN_CACHE_ENV = 'TF_PLUGIN_CACHE_DIR'
+CLI_CONFIG_ENV = 'TF_CLI_CONFIG_FILE'
+DEPENDENCY_LOCK_FILE = '.terraform.lock.hcl'
+CLI_CONFIG_FILE = '.terraformrc'
+STATS_FILE = '.stats.json'
+LOCKS_DIR = '.locks'
+
+# Directories that never hold a module's dependency lock file.
+SKIPPED_DIRECTORIES = {'.git', '.terraform'}
+
+_provider_block = re.compile(r'^provider\s+"([^"]+)"\s*\{')
+_provider_version = re.compile(r'^\s*version\s*=\s*"([^"]+)"')
+
+
+def locked_providers(directory):
+    """The providers that the dependency lock files under directory
+    select, including the ones of modules downloaded to
+    .terragrunt-cache.
+
+    :param directory: str
+    :return: set of (address, version), for example
+        ('registry.terraform.io/hashicorp/aws', '5.31.0').
+    """
+    providers = set()
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if d not in SKIPPED_DIRECTORIES]
+        if DEPENDENCY_LOCK_FILE not in files:
+            continue
+        address = None
+        with open(os.path.join(root, DEPENDENCY_LOCK_FILE)) as f:
+            for line in f:
+                block = _provider_block.match(line)
+                if block:
+                    address = block.group(1)
+                    continue
+                version = _provider_version.match(line)
+                if version and address:
+                    providers.add((address, version.group(1)))
+                    address = None
+    return providers
+
+
+def terraform_directories(directory):
+    """Yield the .terraform directories of the modules under directory."""
+    for root, dirs, _ in os.walk(directory):
+        if '.terraform' in dirs:
+            yield os.path.join(root, '.terraform')
+        dirs[:] = [d for d in dirs if d not in SKIPPED_DIRECTORIES]
+
+
+def has_broken_providers(terraform_dir):
+    """Whether a .terraform directory links to providers that are no longer
+    in the plugin cache."""
+    for root, dirs, files in os.walk(
+            os.path.join(terraform_dir, 'providers')):
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            if os.path.islink(path) and not os.path.exists(path):
+                return True
+    return False
+
+
+class ProviderCache(object):
+    """A Terraform plugin cache directory shared by every deployment on the
+    host, with an optional filesystem mirror in front of the registries.
+
+    Terraform does not make concurrent installs into the plugin cache
+    safe, so init holds the install lock exclusively, and only while it
+    runs: plan and apply, which only read the providers, run without it.
+    Every command holds the cache shared, which keeps the least recently
+    used provider versions from being removed while it runs; they are
+    removed once the cache is larger than max_size and no command uses it.
+    Workspaces that link to a removed provider are initialized again.
+    """
+
+    def __init__(self, root, max_size=None, mirror=None, logger=None):
+        """
+        :param root: str, the plugin cache directory.
+        :param max_size: int, in bytes. None or 0 means unbounded.
+        :param mirror: str, a directory laid out like
+            `terraform providers mirror` creates it, tried before the
+            registries.
+        :param logger: logger
+        """
+        self.root = root
+        self.max_size = max_size
+        self.mirror = mirror
+        self._logger = logger
+
+    @property
+    def logger(self):
+        return self._logger or utils.get_logger('TerragruntLogger')
+
+    @property
+    def _lock_path(self):
+        return os.path.join(self.root, LOCKS_DIR, 'cache.lock')
+
+    @property
+    def _install_lock_path(self):
+        return os.path.join(self.root, LOCKS_DIR, 'install.lock')
+
+    def environment(self):
+        """The environment variables that point Terraform to the cache.
+
+        :return: dict
+        """
+        os.makedirs(self.root, exist_ok=True)
+        env = {PLUGIN_CACHE_ENV: self.root}
+        if self.mirror:
+            env[CLI_CONFIG_ENV] = self.cli_config()
+        return env
+
+    def cli_config(self):
+        """Write the Terraform CLI configuration that installs from the
+        mirror first, and from the registries otherwise.
+
+        :return: str, the path of the file.
+        """
+        path = os.path.join(self.root, LOCKS_DIR, CLI_CONFIG_FILE)
+        content = (
+            'plugin_cache_dir = {root}\n'
+            'provider_installation {{\n'
+            '  filesystem_mirror {{\n'
+            '    path = {mirror}\n'
+            '  }}\n'
+            '  direct {{}}\n'
+            '}}\n').format(root=json.dumps(self.root),
+                           mirror=json.dumps(self.mirror))
+        if os.path.exists(path):
+            with open(path) as f:
+                if f.read() == content:
+                    return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                mode='w', dir=os.path.dirname(path), delete=False) as f:
+            f.write(content)
+        os.replace(f.name, path)
+        return path
+
+    def version_path(self, address, version):
+        return os.path.join(self.root, address, version)
+
+    def versions(self):
+        """Yield (address, version) for every provider version in the
+        cache."""
+        if not os.path.isdir(self.root):
+            return
+        for root, dirs, _ in os.walk(self.root):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            depth = os.path.relpath(root, self.root).count(os.path.sep)
+            if depth == 2 and root != self.root:
+                for version in dirs:
+                    yield os.path.relpath(root, self.root), version
+                dirs[:] = []
+
+    def prepare(self, workspace):
+        """Remove the .terraform directories that link to evicted
+        providers, so that Terragrunt initializes them again.
+
+        :return: bool, whether the workspace was initialized before.
+        """
+        initialized = False
+        for terraform_dir in terraform_directories(workspace):
+            if has_broken_providers(terraform_dir):
+                self.logger.info(
+                    'Providers of {d} were removed from the plugin cache, '
+                    'initializing it again.'.format(d=terraform_dir))
+                shutil.rmtree(terraform_dir, ignore_errors=True)
+            else:
+                initialized = True
+        return initialized
+
+    @contextmanager
+    def session(self, workspace):
+        """Use the cache while a command runs in workspace, and then
+        record the providers it uses and evict what does not fit.
+
+        :param workspace: str, the stack directory.
+        """
+        workspace = workspace or os.getcwd()
+        with file_lock(self._lock_path, shared=True):
+            try:
+                yield
+            finally:
+                self._record(workspace, None)
+        self.evict()
+
+    @contextmanager
+    def install(self, workspace):
+        """Hold the cache exclusively while init installs the providers of
+        workspace, within a session.
+
+        :param workspace: str, the stack directory.
+        """
+        workspace = workspace or os.getcwd()
+        self.prepare(workspace)
+        with file_lock(self._install_lock_path):
+            cached = set(self.versions())
+            try:
+                yield
+            finally:
+                self._record(workspace, cached)
+
+    def _record(self, workspace, cached):
+        """Mark the providers of workspace as used, and count the ones that
+        an initialization found in the cache as hits."""
+        try:
+            used = locked_providers(workspace)
+            for address, version in used:
+                path = self.version_path(address, version)
+                if os.path.isdir(path):
+                    os.utime(path, None)
+            if cached is not None and used:
+                self._update_stats(hits=len(used & cached),
+                                   misses=len(used - cached))
+        except OSError as e:
+            self.logger.debug(
+                'Unable to record the provider cache usage: {}'.format(e))
+
+    def _stats_path(self):
+        return os.path.join(self.root, LOCKS_DIR, STATS_FILE)
+
+    def stats(self):
+        try:
+            with open(self._stats_path()) as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            stats = {}
+        return {'hits': stats.get('hits', 0),
+                'misses': stats.get('misses', 0)}
+
+    def _update_stats(self, hits, misses):
+        # Only called while the install lock is held.
+        stats = self.stats()
+        stats['hits'] += hits
+        stats['misses'] += misses
+        with tempfile.NamedTemporaryFile(
+                mode='w',
+                dir=os.path.dirname(self._stats_path()),
+                delete=False) as f:
+            json.dump(stats, f)
+        os.replace(f.name, self._stats_path())
+
+    def entries(self):
+        """Yield (address/version, size, last used time) for every provider
+        version in the cache."""
+        for address, version in self.versions():
+            path = self.version_path(address, version)
+            try:
+                yield (os.path.join(address, version),
+                       directory_size(path),
+                       os.path.getmtime(path))
+            except OSError:
+                continue
+
+    def evict(self):
+        """Remove least recently used provider versions until the cache
+        fits in max_size. Skipped while any command uses the cache.
+
+        :return: list of removed address/version entries.
+        """
+        if not self.max_size:
+            return []
+        removed = []
+        os.makedirs(os.path.dirname(self._lock_path), exist_ok=True)
+        with open(self._lock_path, 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return removed
+            try:
+                entries = sorted(self.entries(), key=lambda e: e[2])
+                total = sum(e[1] for e in entries)
+                for key, size, _ in entries:
+                    if total <= self.max_size:
+                        break
+                    shutil.rmtree(os.path.join(self.root, key),
+                                  ignore_errors=True)
+                    removed.append(key)
+                    total -= size
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        if removed:
+            self.logger.info('Evicted {r} from the plugin cache {d}.'.format(
+                r=removed, d=self.root))
+        return removed
+
+    def usage(self):
+        """Numbers for dashboards, across every process that uses the
+        cache.
+
+        :return: dict
+        """
+        entries = list(self.entries())
+        stats = self.stats()
+        lookups = stats['hits'] + stats['misses']
+        return {
+            'entries': len(entries),
+            'size': sum(e[1] for e in entries),
+            'max_size': self.max_size,
+            'hits': stats['hits'],
+            'misses': stats['misses'],
+            'hit_rate':
+                float(stats['hits']) / lookups if lookups else None
+        }
@@ -0,0 +1,173 @@
+"""Shallow, sparse checkouts of git sources, through bare repositories
+shared by every deployment on the host.
+
+A stack often lives in one directory of a large monorepo. Instead of
+cloning the whole history and tree per node instance, GitCache fetches the
+pinned commit at depth 1 into one bare repository per URL, once per host,
+and exports only the directories a stack needs with `git archive`, which
+does not write to the repository and so can run concurrently.
+"""
+import os
+import tarfile
+from subprocess import PIPE, CalledProcessError, Popen, check_output
+
+from . import utils
+from .cache import cache_key, file_lock
+from .sources import git_environment, git_url_and_ref, redact_url
+
+GIT_TIMEOUT = 600
+# The files that a module may include from the directories above it.
+INCLUDE_SUFFIX = '.hcl'
+
+
+def parent_directories(path):
+    """The directories from the repository root down to path, path
+    excluded, for example ['', 'live', 'live/prod'] for live/prod/app."""
+    parts = [p for p in path.strip('/').split('/') if p]
+    return ['/'.join(parts[:i]) for i in range(len(parts))]
+
+
+class GitCache(object):
+
+    def __init__(self, root, logger=None):
+        """
+        :param root: str, the directory of the bare repositories.
+        :param logger: logger
+        """
+        self.root = root
+        self._logger = logger
+
+    @property
+    def logger(self):
+        return self._logger or utils.get_logger('TerragruntLogger')
+
+    def repository(self, location):
+        """The bare repository of a location, keyed without the ref and
+        credentials, so every ref of a repository shares its objects."""
+        url, _ = git_url_and_ref(location)
+        return os.path.join(self.root, cache_key(url) + '.git')
+
+    def _git(self, repository, *args, env=None):
+        """Run a git command in repository.
+
+        :param env: dict, the environment, see git_environment.
+        :return: str, the output.
+        """
+        command = ['git', '--git-dir', repository] + list(args)
+        try:
+            return check_output(
+                command,
+                env=env or dict(os.environ, GIT_TERMINAL_PROMPT='0'),
+                stderr=PIPE,
+                timeout=GIT_TIMEOUT).decode('utf-8')
+        except CalledProcessError as e:
+            # The location of a source may hold credentials.
+            raise CalledProcessError(
+                e.returncode, redact_url(command),
+                stderr=redact_url(
+                    (e.stderr or b'').decode('utf-8', 'replace')))
+
+    def _has_commit(self, repository, revision):
+        try:
+            self._git(repository, 'cat-file', '-e',
+                      '{}^{{commit}}'.format(revision))
+            return True
+        except CalledProcessError:
+            return False
+
+    def fetch(self, location, username=None, password=None, revision=None):
+        """Fetch the ref of location at depth 1, unless the repository
+        already has revision.
+
+        :param revision: str, the commit that the ref resolves to, if known.
+        :return: str, the commit.
+        """
+        repository = self.repository(location)
+        url, ref = git_url_and_ref(location)
+        with file_lock(repository + '.lock'):
+            if not os.path.isdir(repository):
+                os.makedirs(repository)
+                self._git(repository, 'init', '--bare', '--quiet')
+            if revision and self._has_commit(repository, revision):
+                self.logger.debug('{r} is already in {p}.'.format(
+                    r=revision, p=repository))
+                return revision
+            self.logger.info('Fetching {r} of {l} at depth 1.'.format(
+                r=ref or 'HEAD', l=redact_url(url)))
+            # The URL is passed on the command line only, so it is not
+            # stored in the repository's config, and the credentials only
+            # in the environment of git.
+            with git_environment(username, password) as env:
+                self._git(repository, 'fetch', '--quiet', '--depth', '1',
+                          '--no-tags', url, ref or 'HEAD', env=env)
+            commit = self._git(
+                repository, 'rev-parse', 'FETCH_HEAD^{commit}').strip()
+            # Keep the commit from being garbage collected.
+            self._git(repository, 'update-ref',
+                      'refs/cache/{}'.format(commit), commit)
+            return commit
+
+    def include_files(self, repository, revision, path):
+        """The .hcl files in the directories above path, which its
+        terragrunt.hcl may include with find_in_parent_folders."""
+        files = []
+        for directory in parent_directories(path):
+            args = ['ls-tree', revision]
+            if directory:
+                args.extend(['--', directory + '/'])
+            for line in self._git(repository, *args).splitlines():
+                info, _, name = line.partition('\t')
+                if info.split()[1] == 'blob' and \
+                        name.endswith(INCLUDE_SUFFIX):
+                    files.append(name)
+        return files
+
+    def export(self, location, revision, target, path=None,
+               extra_paths=None):
+        """Write the tree of revision to target, restricted to path, the
+        .hcl files above it and extra_paths when path is given.
+
+        :param location: str
+        :param revision: str, a commit that fetch returned.
+        :param target: str, a directory.
+        :param path: str, relative to the repository root.
+        :param extra_paths: list, more paths to export, like the shared
+            configuration that modules include by relative path.
+        :return: list of the exported paths, empty for the whole tree.
+        """
+        repository = self.repository(location)
+        paths = []
+        with file_lock(repository + '.lock', shared=True):
+            path = (path or '').strip('/')
+            if path:
+                paths = sorted(set(
+                    [path] + self.include_files(repository, revision, path) +
+                    [p.strip('/') for p in extra_paths or [] if p]))
+            os.makedirs(target, exist_ok=True)
+            process = Popen(
+                ['git', '--git-dir', repository, 'archive', '--format=tar',
+                 revision, '--'] + paths,
+                stdout=PIPE,
+                stderr=PIPE)
+            tar_error = None
+            try:
+                with tarfile.open(fileobj=process.stdout, mode='r|') as tar:
+                    if hasattr(tarfile, 'data_filter'):
+                        tar.extractall(target, filter='data')
+                    else:
+                        tar.extractall(target)
+            except tarfile.TarError as e:
+                tar_error = e
+            finally:
+                process.stdout.close()
+                error = process.stderr.read().decode('utf-8', 'replace')
+                process.stderr.close()
+                returncode = process.wait()
+            if returncode:
+                raise CalledProcessError(returncode, 'git archive',
+                                         stderr=error)
+            if tar_error:
+                raise tar_error
+        self.logger.debug('Exported {p} of {r} to {t}.'.format(
+            p=paths or 'everything', r=revision, t=target))
+        return paths
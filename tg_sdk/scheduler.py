@@ -0,0 +1,228 @@
+import os
+import re
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    wait
+)
+
+from cloudify.exceptions import NonRecoverableError
+
+from . import utils
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+# Commands that tear a stack down run dependents before their dependencies.
+REVERSE_ORDER_COMMANDS = ['destroy']
+
+_dot_node = re.compile(r'^\s*"([^"]+)"\s*;?\s*$')
+_dot_edge = re.compile(r'^\s*"([^"]+)"\s*->\s*"([^"]+)"\s*;?\s*$')
+
+
+def parse_dependency_graph(dot):
+    """Parse `terragrunt graph-dependencies` output.
+
+    An edge "a" -> "b" means that module a depends on module b.
+
+    :param dot: str, the DOT digraph.
+    :return: dict of module path to a set of the modules it depends on.
+    """
+    graph = {}
+    for line in (dot or '').splitlines():
+        edge = _dot_edge.match(line)
+        if edge:
+            module, dependency = edge.groups()
+            graph.setdefault(module, set()).add(dependency)
+            graph.setdefault(dependency, set())
+            continue
+        node = _dot_node.match(line)
+        if node:
+            graph.setdefault(node.group(1), set())
+    return graph
+
+
+def reverse_graph(graph):
+    """Swap the direction of every edge.
+
+    :param graph: dict of module to the modules it depends on.
+    :return: dict of module to the modules that depend on it.
+    """
+    reversed_graph = {module: set() for module in graph}
+    for module, dependencies in graph.items():
+        for dependency in dependencies:
+            reversed_graph.setdefault(dependency, set()).add(module)
+    return reversed_graph
+
+
+def topological_order(graph):
+    """Order modules so that every module comes after its dependencies.
+
+    :param graph: dict of module to the modules it depends on.
+    :return: list
+    """
+    remaining = {module: set(deps) for module, deps in graph.items()}
+    order = []
+    while remaining:
+        ready = sorted(m for m, deps in remaining.items() if not deps)
+        if not ready:
+            raise NonRecoverableError(
+                'The dependency graph has a cycle between these modules: '
+                '{}'.format(sorted(remaining)))
+        for module in ready:
+            del remaining[module]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+        order.extend(ready)
+    return order
+
+
+class ModuleResult(object):
+
+    def __init__(self, module, command):
+        self.module = module
+        self.command = command
+        self.status = None
+        self.output = None
+        self.error = None
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def duration(self):
+        if self.start_time is None or self.end_time is None:
+            return
+        return self.end_time - self.start_time
+
+    def to_dict(self):
+        return {
+            'module': self.module,
+            'command': self.command,
+            'status': self.status,
+            'error': self.error,
+            'duration': self.duration
+        }
+
+
+class StackResult(object):
+    """Per module results of a command run across a stack, in the order
+    the modules were scheduled."""
+
+    def __init__(self, command, order):
+        self.command = command
+        self.order = order
+        self.results = {m: ModuleResult(m, command) for m in order}
+
+    def __getitem__(self, module):
+        return self.results[module]
+
+    def __iter__(self):
+        for module in self.order:
+            yield self.results[module]
+
+    def _with_status(self, status):
+        return [r.module for r in self if r.status == status]
+
+    @property
+    def succeeded(self):
+        return self._with_status(SUCCEEDED)
+
+    @property
+    def failed(self):
+        return self._with_status(FAILED)
+
+    @property
+    def skipped(self):
+        return self._with_status(SKIPPED)
+
+    @property
+    def ok(self):
+        return not self.failed and not self.skipped
+
+    def to_dict(self):
+        return {
+            'command': self.command,
+            'modules': [r.to_dict() for r in self]
+        }
+
+
+class DagScheduler(object):
+    """Run a Terragrunt command module by module across a worker pool.
+
+    A module starts as soon as everything it depends on succeeded. When a
+    module fails, the modules that depend on it are skipped, and unrelated
+    modules carry on.
+    """
+
+    def __init__(self, graph, runner, max_workers=None, logger=None):
+        """
+        :param graph: dict of module to the modules it depends on.
+        :param runner: callable(command, module) that returns the output.
+        :param max_workers: int, the pool size, defaults to the CPU count.
+        :param logger: logger
+        """
+        self.graph = graph
+        self.runner = runner
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.logger = logger or utils.get_logger('TerragruntLogger')
+
+    def _run_module(self, result):
+        result.start_time = time.time()
+        try:
+            result.output = self.runner(result.command, result.module)
+        except Exception as e:
+            result.status = FAILED
+            result.error = str(e)
+        else:
+            result.status = SUCCEEDED
+        result.end_time = time.time()
+        return result
+
+    def run(self, command):
+        """Run command in every module of the graph.
+
+        :param command: str, for example plan, apply or destroy.
+        :return: StackResult
+        """
+        graph = self.graph
+        if command in REVERSE_ORDER_COMMANDS:
+            graph = reverse_graph(graph)
+        stack_result = StackResult(command, topological_order(graph))
+        waiting = {module: set(deps) for module, deps in graph.items()}
+        dependents = reverse_graph(graph)
+
+        def skip_dependents(module):
+            for dependent in dependents[module]:
+                if dependent in waiting:
+                    del waiting[dependent]
+                    stack_result[dependent].status = SKIPPED
+                    stack_result[dependent].error = \
+                        'Dependency {} did not succeed.'.format(module)
+                    skip_dependents(dependent)
+
+        running = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while waiting or running:
+                for module in [m for m in stack_result.order
+                               if m in waiting and not waiting[m]]:
+                    del waiting[module]
+                    self.logger.debug('Running {c} in {m}.'.format(
+                        c=command, m=module))
+                    running.add(
+                        pool.submit(self._run_module, stack_result[module]))
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    self.logger.info('{c} {s} in {m} after {d:.1f}s.'.format(
+                        c=command, s=result.status, m=result.module,
+                        d=result.duration))
+                    if result.status == SUCCEEDED:
+                        for deps in waiting.values():
+                            deps.discard(result.module)
+                    else:
+                        skip_dependents(result.module)
+        return stack_result
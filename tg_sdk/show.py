@@ -0,0 +1,384 @@
+"""Read the plans that `show -json` renders from saved plan files.
+
+The JSON plan representation has what the `plan -json` UI stream leaves
+out, such as the attribute values before and after every change. It is
+also a single document, which for a large stack runs to hundreds of
+megabytes, mostly in prior_state, planned_values and configuration.
+
+ShowDecoder is an event based decoder for it: it is fed the output in
+chunks and returns an event for every item of resource_changes and
+resource_drift as soon as the item is complete, and for the small top
+level values that are kept. Every other value is scanned past without
+being decoded, so memory is bounded by the largest single change rather
+than by the document. Several documents in a row, as terragrunt run-all
+show prints them, are decoded one after the other.
+
+iter_show_messages converts the events to the messages of the UI stream,
+so that plans and PlanModels are built from them unchanged.
+"""
+import re
+import json
+
+from cloudify.exceptions import NonRecoverableError
+
+from . import utils
+
+# Top level arrays that are returned item by item.
+STREAMED_KEYS = ('resource_changes', 'resource_drift')
+# Top level values that are returned whole.
+DECODED_KEYS = ('format_version', 'terraform_version', 'output_changes',
+                'errored')
+# What a value that Terraform marks as sensitive is replaced with.
+SENSITIVE_VALUE = '(sensitive value)'
+
+# A JSON UI action for every list of actions in the plan representation.
+ACTIONS = {
+    ('no-op',): 'noop',
+    ('create',): 'create',
+    ('read',): 'read',
+    ('update',): 'update',
+    ('delete',): 'delete',
+    ('delete', 'create'): 'replace',
+    ('create', 'delete'): 'replace',
+    ('forget',): 'remove'
+}
+
+_decoder = json.JSONDecoder()
+_string = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+# Everything up to the next bracket, strings included.
+_inside = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.S)
+_scalar = re.compile(r'[-+.0-9a-zA-Z]+')
+_space = re.compile(r'\s*')
+
+# Decoder states.
+_OUTSIDE = 'outside'
+_KEY = 'key'
+_COLON = 'colon'
+_VALUE = 'value'
+_ITEMS = 'items'
+_ITEM = 'item'
+
+
+class ShowDecoder(object):
+    """Incrementally decode `show -json` output, see the module docstring.
+
+    feed returns a list of events, (key, value) pairs:
+        (STREAMED_KEYS item, the item), once per item.
+        (DECODED_KEYS item, the value).
+        ('end', None) at the end of every document.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger or utils.get_logger()
+        self.buffer = ''
+        self.pos = 0
+        self.state = _OUTSIDE
+        self.key = None
+        # The start of the value that is being scanned, the position the
+        # scan reached and its nesting depth.
+        self.start = None
+        self.scan = 0
+        self.depth = 0
+        self.closed = False
+
+    def feed(self, chunk):
+        """Decode the next chunk of output.
+
+        :param chunk: str
+        :return: list of events.
+        """
+        if self.start is None:
+            keep = self.pos
+        elif self.state == _VALUE and self.depth and \
+                self.key not in DECODED_KEYS:
+            # A skipped value is only scanned, never decoded.
+            keep = self.scan
+        else:
+            keep = self.start
+        self.buffer = self.buffer[keep:] + chunk
+        self.pos = max(self.pos - keep, 0)
+        self.scan = max(self.scan - keep, 0)
+        if self.start is not None:
+            self.start = max(self.start - keep, 0)
+        events = []
+        while self._step(events):
+            pass
+        return events
+
+    def close(self):
+        """Decode what is left and check that no document was cut off.
+
+        :return: list of events.
+        """
+        self.closed = True
+        events = self.feed('')
+        if self.state != _OUTSIDE:
+            raise NonRecoverableError(
+                'The show -json output ended in the middle of a document, '
+                'after {}.'.format(self.key))
+        return events
+
+    def _skip_space(self):
+        self.pos = _space.match(self.buffer, self.pos).end()
+        return self.pos < len(self.buffer)
+
+    def _scan_value(self):
+        """Find the end of the value that starts at self.start.
+
+        :return: the end, or None if it is not complete yet.
+        """
+        buffer = self.buffer
+        if not self.depth:
+            self.scan = self.start
+            char = buffer[self.start]
+            if char == '"':
+                match = _string.match(buffer, self.start)
+                return match.end() if match else None
+            if char not in '{[':
+                match = _scalar.match(buffer, self.start)
+                if not match:
+                    raise NonRecoverableError(
+                        'Unexpected {!r} in the show -json output.'.format(
+                            buffer[self.start:self.start + 20]))
+                if match.end() == len(buffer) and not self.closed:
+                    # The literal may go on in the next chunk.
+                    return
+                return match.end()
+        pos = self.scan
+        length = len(buffer)
+        while True:
+            pos = _inside.match(buffer, pos).end()
+            if pos == length or buffer[pos] == '"':
+                # The end of the output, or a string that goes on.
+                self.scan = pos
+                return
+            self.depth += 1 if buffer[pos] in '{[' else -1
+            pos += 1
+            if not self.depth:
+                self.scan = pos
+                return pos
+
+    def _step(self, events):
+        """Take one step of the state machine.
+
+        :return: bool, False when it needs more output.
+        """
+        buffer = self.buffer
+        if self.state == _OUTSIDE:
+            start = buffer.find('{', self.pos)
+            text = buffer[self.pos:len(buffer) if start == -1 else start]
+            if text.strip():
+                self.logger.info('Skipping text in show output: {}'.format(
+                    text.strip()))
+            if start == -1:
+                self.pos = len(buffer)
+                return False
+            self.pos = start + 1
+            self.state = _KEY
+            return True
+        if self.start is not None:
+            return self._end_value(events)
+        if not self._skip_space():
+            return False
+        char = buffer[self.pos]
+        if self.state == _KEY:
+            if char == ',':
+                self.pos += 1
+                return True
+            if char == '}':
+                self.pos += 1
+                self.state = _OUTSIDE
+                events.append(('end', None))
+                return True
+            match = _string.match(buffer, self.pos)
+            if not match:
+                return False
+            self.key = json.loads(match.group())
+            self.pos = match.end()
+            self.state = _COLON
+            return True
+        if self.state == _COLON:
+            self.pos += 1
+            self.state = _VALUE
+            return True
+        if self.state == _VALUE:
+            if self.key in STREAMED_KEYS and char == '[':
+                self.pos += 1
+                self.state = _ITEMS
+                return True
+            self.start = self.pos
+            return True
+        if self.state == _ITEMS:
+            if char == ',':
+                self.pos += 1
+                return True
+            if char == ']':
+                self.pos += 1
+                self.state = _KEY
+                return True
+            self.start = self.pos
+            self.state = _ITEM
+        return True
+
+    def _end_value(self, events):
+        """Decode or skip the value that starts at self.start, once it is
+        complete.
+
+        :return: bool, False when it needs more output.
+        """
+        decode = self.state == _ITEM or self.key in DECODED_KEYS
+        end = None
+        if decode and not self.depth and self.buffer[self.start] in '{["':
+            # Most values are complete by the time they are reached, and
+            # decoding them is faster than scanning them first. A value
+            # that is not is scanned to its end instead, so that it is not
+            # decoded again with every chunk.
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.start)
+            except ValueError:
+                pass
+        if end is None:
+            end = self._scan_value()
+            if end is None:
+                return False
+            if decode:
+                value = json.loads(self.buffer[self.start:end])
+        if decode:
+            events.append((self.key, value))
+        self.pos = end
+        self.start = None
+        self.state = _ITEMS if self.state == _ITEM else _KEY
+        return True
+
+
+def iter_show_events(output, logger=None):
+    """Decode `show -json` output with ShowDecoder.
+
+    :param output: str, or an iterable of str chunks.
+    :param logger: logger for skipped text.
+    :return: generator of events.
+    """
+    decoder = ShowDecoder(logger)
+    if isinstance(output, str):
+        output = [output]
+    for chunk in output:
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('utf-8', errors='replace')
+        for event in decoder.feed(chunk):
+            yield event
+    for event in decoder.close():
+        yield event
+
+
+def redact(value, sensitive):
+    """Replace the parts of value that sensitive marks.
+
+    :param value: a before or after value.
+    :param sensitive: its before_sensitive or after_sensitive mask.
+    :return: the value without sensitive values.
+    """
+    if sensitive is True:
+        return SENSITIVE_VALUE
+    if isinstance(sensitive, dict) and isinstance(value, dict):
+        return {k: redact(v, sensitive.get(k)) for k, v in value.items()}
+    if isinstance(sensitive, list) and isinstance(value, list):
+        return [redact(v, sensitive[i] if i < len(sensitive) else None)
+                for i, v in enumerate(value)]
+    return value
+
+
+def get_action(change):
+    """The JSON UI action of a change in the plan representation.
+
+    :param change: dict, the change of a resource change.
+    :return: str
+    """
+    actions = tuple(change.get('actions') or ())
+    action = ACTIONS.get(actions, '-'.join(actions))
+    if action == 'noop' and change.get('importing'):
+        return 'import'
+    return action
+
+
+def convert_resource_change(resource_change):
+    """Convert an item of resource_changes or resource_drift to the change
+    of a planned_change or resource_drift UI message, with the attribute
+    values.
+
+    :param resource_change: dict
+    :return: dict, None for a change that does nothing.
+    """
+    change = resource_change.get('change') or {}
+    action = get_action(change)
+    previous = resource_change.get('previous_address')
+    if action == 'noop':
+        if not previous:
+            return
+        action = 'move'
+    address = resource_change.get('address') or ''
+    module = resource_change.get('module_address') or ''
+    resource = {
+        'addr': address,
+        'module': module,
+        'resource': address[len(module) + 1:] if module else address,
+        'implied_provider': (resource_change.get('provider_name') or '')
+        .rsplit('/', 1)[-1],
+        'resource_type': resource_change.get('type'),
+        'resource_name': resource_change.get('name')
+    }
+    if resource_change.get('index') is not None:
+        resource['resource_key'] = resource_change['index']
+    converted = {
+        'resource': resource,
+        'action': action,
+        'before': redact(change.get('before'),
+                         change.get('before_sensitive')),
+        'after': redact(change.get('after'), change.get('after_sensitive')),
+        'after_unknown': change.get('after_unknown')
+    }
+    if previous:
+        converted['previous_resource'] = {'addr': previous}
+    if resource_change.get('action_reason'):
+        converted['reason'] = resource_change['action_reason']
+    if change.get('replace_paths'):
+        converted['replace_paths'] = change['replace_paths']
+    return converted
+
+
+def iter_show_messages(output, logger=None):
+    """Convert `show -json` output to `plan -json` UI messages:
+    resource_drift and planned_change messages as the changes are
+    decoded, then one outputs and one change_summary message for every
+    document together.
+
+    :param output: str, or an iterable of str chunks.
+    :param logger: logger for skipped text.
+    :return: generator of dict
+    """
+    summary = {'add': 0, 'change': 0, 'import': 0, 'remove': 0,
+               'operation': 'plan'}
+    outputs = {}
+    for key, value in iter_show_events(output, logger):
+        if key in STREAMED_KEYS:
+            change = convert_resource_change(value)
+            if not change:
+                continue
+            if key == 'resource_drift':
+                yield {'type': 'resource_drift', 'change': change}
+                continue
+            action = change['action']
+            summary['add'] += action in ('create', 'replace')
+            summary['change'] += action == 'update'
+            summary['remove'] += action in ('delete', 'replace')
+            summary['import'] += bool(
+                (value.get('change') or {}).get('importing'))
+            yield {'type': 'planned_change', 'change': change}
+        elif key == 'output_changes':
+            for name, change in (value or {}).items():
+                action = get_action(change)
+                if action != 'noop':
+                    outputs[name] = {
+                        'sensitive': bool(change.get('after_sensitive')),
+                        'action': action}
+    yield {'type': 'outputs', 'outputs': outputs}
+    yield {'type': 'change_summary', 'changes': summary}
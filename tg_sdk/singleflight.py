@@ -0,0 +1,97 @@
+"""Share one execution between identical read-only commands that run at
+the same time on a host.
+
+Callers with the same request key serialize on a lock file per key. The
+first one runs the command and writes its output to a result file; the
+ones that waited for it find a result that ended after they arrived and
+return it instead of running the command again. A result that ended
+before a caller arrived was not in flight for it and is never reused, so
+this deduplicates concurrent work without becoming a cache. Failures are
+not shared: the next caller runs the command itself.
+"""
+import os
+import json
+import time
+import tempfile
+
+from . import utils
+from .cache import file_lock
+
+LOCK_SUFFIX = '.lock'
+RESULT_SUFFIX = '.json'
+# Results this old are removed, by the next caller of any key.
+RESULT_TTL = 3600
+
+
+class SingleFlight(object):
+
+    def __init__(self, root, logger=None):
+        """
+        :param root: str, the directory of the lock and result files.
+        :param logger: logger
+        """
+        self.root = root
+        self._logger = logger
+        self.shared = 0
+
+    @property
+    def logger(self):
+        return self._logger or utils.get_logger('TerragruntLogger')
+
+    def _result_path(self, key):
+        return os.path.join(self.root, key + RESULT_SUFFIX)
+
+    def load(self, key):
+        try:
+            with open(self._result_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return
+
+    def _save(self, key, result):
+        # Outputs may be sensitive.
+        with tempfile.NamedTemporaryFile(
+                mode='w', dir=self.root, delete=False) as f:
+            os.chmod(f.name, 0o600)
+            json.dump(result, f)
+        os.replace(f.name, self._result_path(key))
+
+    def run(self, key, func):
+        """Return the output of func, or of an identical call that was in
+        flight when this one started.
+
+        :param key: str, identifies what func computes.
+        :param func: callable that returns the output, a str.
+        :return: str
+        """
+        arrival = time.time()
+        os.makedirs(self.root, mode=0o700, exist_ok=True)
+        with file_lock(os.path.join(self.root, key + LOCK_SUFFIX)):
+            result = self.load(key)
+            if result and result['end_time'] >= arrival:
+                self.shared += 1
+                self.logger.info(
+                    'Sharing the output of an identical command that was '
+                    'in flight, started {:.1f}s before this one.'.format(
+                        arrival - result['start_time']))
+                return result['output']
+            start_time = time.time()
+            output = func()
+            if isinstance(output, str):
+                self._save(key, {'start_time': start_time,
+                                 'end_time': time.time(),
+                                 'output': output})
+        self.prune()
+        return output
+
+    def prune(self):
+        """Remove the results older than RESULT_TTL."""
+        expired = time.time() - RESULT_TTL
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if name.endswith(RESULT_SUFFIX) and \
+                        os.path.getmtime(path) < expired:
+                    os.remove(path)
+            except OSError:
+                continue
@@ -0,0 +1,171 @@
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from subprocess import CalledProcessError, TimeoutExpired, check_output
+
+import requests
+
+from . import utils
+
+GIT_SOURCE_PREFIX = 'git::'
+# In the workspace, what the source was last synced from, see
+# cloudify_tg.utils.download_terragrunt_source.
+SOURCE_MANIFEST_FILE = '.tg_source.json'
+REVISION_TIMEOUT = 30
+
+_sha = re.compile(r'^[0-9a-f]{40}$')
+_url_credentials = re.compile(r'(\w+://)[^/@\s]+@')
+
+# Answers the prompts of git for a username and a password from the
+# environment that git_environment sets.
+ASKPASS_SCRIPT = '''#!/bin/sh
+case "$1" in
+  Username*) printf '%s\\n' "$TG_GIT_USERNAME" ;;
+  *) printf '%s\\n' "$TG_GIT_PASSWORD" ;;
+esac
+'''
+
+
+def source_location(source):
+    """Split a cloudify.types.terragrunt.SourceSpecification.
+
+    :param source: str or dict with location, username and password.
+    :return: (location, username, password)
+    """
+    if isinstance(source, dict):
+        return (source.get('location', ''),
+                source.get('username'),
+                source.get('password'))
+    return source or '', None, None
+
+
+def is_git_source(location):
+    return location.startswith(GIT_SOURCE_PREFIX) or \
+        'git@' in location or \
+        location.split('?')[0].endswith('.git')
+
+
+def git_url_and_ref(location):
+    """The repository URL and the requested ref, or None for the default
+    branch. Credentials are never added to the URL, see git_environment.
+    """
+    if location.startswith(GIT_SOURCE_PREFIX):
+        location = location[len(GIT_SOURCE_PREFIX):]
+    ref = None
+    if '?ref=' in location:
+        location, ref = location.split('?ref=', 1)
+    return location, ref
+
+
+def redact_url(text):
+    """Remove the credentials from the URLs in text, for log and error
+    messages.
+
+    :param text: str, or a list of str, such as a command.
+    :return: str or list
+    """
+    if isinstance(text, (list, tuple)):
+        return [redact_url(t) for t in text]
+    return _url_credentials.sub(r'\1****@', str(text))
+
+
+@contextmanager
+def git_environment(username=None, password=None):
+    """The environment of git commands, which never prompt on a terminal.
+    With a username, git asks GIT_ASKPASS for the credentials, which only
+    the environment of git holds, rather than its command line, where
+    every user of the host can read them, and the URLs that end up in
+    errors.
+
+    :return: dict
+    """
+    env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+    if not username:
+        yield env
+        return
+    directory = tempfile.mkdtemp()
+    try:
+        askpass = os.path.join(directory, 'askpass')
+        with open(askpass, 'w') as f:
+            f.write(ASKPASS_SCRIPT)
+        os.chmod(askpass, 0o700)
+        env.update(GIT_ASKPASS=askpass,
+                   TG_GIT_USERNAME=username,
+                   TG_GIT_PASSWORD=password or '')
+        yield env
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def git_revision(location, username=None, password=None, logger=None):
+    """Resolve a git source to a commit with `git ls-remote`, without
+    cloning it.
+
+    :return: str, the commit sha, or None if it can not be resolved.
+    """
+    logger = logger or utils.get_logger()
+    url, ref = git_url_and_ref(location)
+    if ref and _sha.match(ref):
+        return ref
+    try:
+        with git_environment(username, password) as env:
+            output = check_output(
+                ['git', 'ls-remote', url, ref or 'HEAD'],
+                env=env,
+                timeout=REVISION_TIMEOUT).decode('utf-8')
+    except (OSError, CalledProcessError, TimeoutExpired) as e:
+        logger.debug('Unable to resolve {r} of {l}: {e}'.format(
+            r=ref or 'HEAD', l=redact_url(location), e=redact_url(e)))
+        return
+    refs = dict(reversed(line.split('\t', 1)) for line in
+                output.splitlines() if '\t' in line)
+    if ref:
+        for name in ['refs/tags/{}^{{}}'.format(ref),
+                     'refs/tags/{}'.format(ref),
+                     'refs/heads/{}'.format(ref),
+                     ref]:
+            if name in refs:
+                return refs[name]
+    return next(iter(refs.values()), None)
+
+
+def http_revision(location, username=None, password=None, logger=None):
+    """Identify the current content of an HTTP source from its ETag or
+    Last-Modified header, without downloading it.
+
+    :return: str, or None if the server sends neither header.
+    """
+    logger = logger or utils.get_logger()
+    auth = (username, password) if username else None
+    try:
+        response = requests.head(location,
+                                 allow_redirects=True,
+                                 auth=auth,
+                                 timeout=REVISION_TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logger.debug('Unable to check {l}: {e}'.format(
+            l=redact_url(location), e=redact_url(e)))
+        return
+    etag = response.headers.get('ETag')
+    if etag:
+        return 'etag:{}'.format(etag)
+    last_modified = response.headers.get('Last-Modified')
+    if last_modified:
+        return 'last-modified:{m}:{s}'.format(
+            m=last_modified, s=response.headers.get('Content-Length'))
+
+
+def source_revision(source, logger=None):
+    """Identify the current content of a source without downloading it.
+
+    :param source: str or dict, a SourceSpecification.
+    :return: str, or None if the revision can not be determined.
+    """
+    location, username, password = source_location(source)
+    if is_git_source(location):
+        return git_revision(location, username, password, logger)
+    if location.split('://')[0] in ['http', 'https']:
+        return http_revision(location, username, password, logger)
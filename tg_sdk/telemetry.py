@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import resource
+import threading
+from collections import OrderedDict
+
+from .utils import ExecutionResult
+
+MASK = '****'
+TELEMETRY_FILE = 'telemetry.jsonl'
+
+# Options whose values may hold secrets, such as -var=password=...
+MASKED_OPTIONS = ('-var', '-backend-config')
+
+
+def mask_value(option, value):
+    name, separator, _ = value.partition('=')
+    if separator:
+        return '{o}={n}={m}'.format(o=option, n=name, m=MASK)
+    return '{o}={m}'.format(o=option, m=MASK)
+
+
+def mask_command(command, secrets=None):
+    """A copy of command that can be logged: the values of MASKED_OPTIONS
+    and every secret are replaced with MASK.
+
+    :param command: list
+    :param secrets: list of str, values to hide wherever they appear.
+    :return: list
+    """
+    secrets = sorted((s for s in secrets or [] if s), key=len, reverse=True)
+    masked = []
+    previous = None
+    for arg in command:
+        arg = str(arg)
+        for secret in secrets:
+            arg = arg.replace(secret, MASK)
+        option, separator, value = arg.partition('=')
+        if separator and option in MASKED_OPTIONS:
+            arg = mask_value(option, value)
+        elif previous in MASKED_OPTIONS:
+            arg = mask_value(previous, arg)[len(previous) + 1:]
+        masked.append(arg)
+        previous = arg
+    return masked
+
+
+class Measurement(object):
+    """Measure a command run by an executor that does not report on it.
+
+    CPU time comes from the usage of every child of this process, so it is
+    only kept when no other measured command ran at the same time. Peak
+    memory is not known.
+    """
+
+    def __init__(self, command):
+        self.result = ExecutionResult(command)
+        self.result.start_time = time.time()
+        self.exclusive = True
+        self._usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    def finish(self, output=None, returncode=0):
+        """
+        :param output: str, the stdout of the command.
+        :param returncode: int, None if it is not known.
+        :return: ExecutionResult
+        """
+        self.result.end_time = time.time()
+        self.result.returncode = returncode
+        if isinstance(output, str):
+            self.result.stdout_bytes = len(output.encode('utf-8'))
+        if self.exclusive:
+            usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            self.result.cpu_user_time = usage.ru_utime - self._usage.ru_utime
+            self.result.cpu_system_time = \
+                usage.ru_stime - self._usage.ru_stime
+        return self.result
+
+
+class Telemetry(object):
+    """Execution records of the commands that a Terragrunt object ran.
+
+    Records are kept in memory and, with a log path, appended to it as
+    JSON lines, so the history of a node instance survives its operations.
+    """
+
+    def __init__(self, log_path=None, logger=None):
+        """
+        :param log_path: str, the JSON lines file to append records to.
+        :param logger: logger
+        """
+        self.log_path = log_path
+        self.logger = logger
+        self.records = []
+        self._measurements = []
+        self._lock = threading.Lock()
+
+    def start(self, command):
+        """Start measuring a command whose executor does not report on
+        it, see Measurement.
+
+        :param command: list
+        :return: Measurement
+        """
+        measurement = Measurement(command)
+        with self._lock:
+            if self._measurements:
+                measurement.exclusive = False
+                for other in self._measurements:
+                    other.exclusive = False
+            self._measurements.append(measurement)
+        return measurement
+
+    def finish(self, measurement, output=None, returncode=0, name=None,
+               secrets=None, result=None):
+        """Record a command started with start.
+
+        :param result: ExecutionResult, what the executor reported, which
+            replaces the measurement.
+        :return: dict, the record.
+        """
+        with self._lock:
+            self._measurements.remove(measurement)
+        return self.add(result or measurement.finish(output, returncode),
+                        name, secrets)
+
+    def add(self, result, name=None, secrets=None):
+        """Record a command that completed.
+
+        :param result: ExecutionResult
+        :param name: str, the Terragrunt command, for example plan.
+        :param secrets: list of str, to mask in the command.
+        :return: dict, the record.
+        """
+        record = OrderedDict(name=name)
+        record['command'] = mask_command(result.command, secrets)
+        record['start_time'] = result.start_time
+        record['end_time'] = result.end_time
+        record.update(result.to_dict())
+        with self._lock:
+            self.records.append(record)
+            if self.log_path:
+                self._append(record)
+        return record
+
+    def _append(self, record):
+        try:
+            directory = os.path.dirname(self.log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+        except OSError as e:
+            if self.logger:
+                self.logger.debug('Not logging telemetry: {}'.format(e))
+
+    def summary(self):
+        """Totals of the records, in all and per command, for runtime
+        properties.
+
+        :return: dict
+        """
+        with self._lock:
+            records = list(self.records)
+        commands = OrderedDict()
+        total = new_totals()
+        for record in records:
+            add_record(total, record)
+            add_record(commands.setdefault(
+                record['name'] or 'other', new_totals()), record)
+        return dict(total, commands=commands)
+
+
+def new_totals():
+    return OrderedDict([
+        ('count', 0),
+        ('failed', 0),
+        ('wall_time', 0.0),
+        ('cpu_time', 0.0),
+        ('max_rss', 0),
+        ('stdout_bytes', 0),
+        ('stderr_bytes', 0),
+    ])
+
+
+def add_record(totals, record):
+    totals['count'] += 1
+    if record['returncode'] != 0:
+        totals['failed'] += 1
+    totals['wall_time'] = round(
+        totals['wall_time'] + (record['wall_time'] or 0), 3)
+    totals['cpu_time'] = round(
+        totals['cpu_time'] + (record['cpu_user_time'] or 0) +
+        (record['cpu_system_time'] or 0), 3)
+    totals['max_rss'] = max(totals['max_rss'], record['max_rss'] or 0)
+    totals['stdout_bytes'] += record['stdout_bytes'] or 0
+    totals['stderr_bytes'] += record['stderr_bytes'] or 0
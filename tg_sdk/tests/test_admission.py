@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+
+from mock import Mock
+from cloudify.exceptions import NonRecoverableError
+
+from .. import admission
+from ..tg import Terragrunt
+
+
+def test_admission_slots():
+    controller = admission.AdmissionController(
+        '/tmp', slots=8, memory_budget=2048, slot_memory=512,
+        weights={'output': 2})
+    assert controller.total_slots == 4
+    assert controller.weight('apply') == 4
+    assert controller.weight('plan') == 3
+    assert controller.weight('output') == 2
+    assert controller.weight('terragrunt-info') == 1
+    controller = admission.AdmissionController('/tmp', slots=2)
+    assert controller.weight('apply') == 2
+
+
+def test_admission_waits_for_slots():
+    directory = tempfile.mkdtemp()
+    try:
+        first = admission.AdmissionController(directory, slots=4)
+        second = admission.AdmissionController(directory, slots=4)
+        admitted = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with first.admit('apply'):
+                admitted.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        assert admitted.wait(5)
+        metrics = first.metrics()
+        assert metrics['active_slots'] == 4
+        assert metrics['active_commands'] == 1
+        threading.Timer(1, release.set).start()
+        with second.admit('output') as grant:
+            assert grant.slots == 1
+            assert grant.wait_time >= 0.5
+        holder.join()
+        metrics = second.metrics()
+        assert metrics['active_slots'] == 0
+        assert metrics['admitted'] == 1
+        assert metrics['max_wait_time'] >= 0.5
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_admission_timeout_and_dead_processes():
+    directory = tempfile.mkdtemp()
+    try:
+        controller = admission.AdmissionController(
+            directory, slots=1, timeout=1)
+        # A process that died while it held the only slot.
+        with open(os.path.join(directory, admission.LEDGER_FILE), 'w') as f:
+            json.dump({'dead': {'pid': 2 ** 22 + 1, 'start': '1',
+                                'command': 'apply', 'slots': 1,
+                                'state': 'active', 'queued': 0}}, f)
+        with controller.admit('apply'):
+            try:
+                with controller.admit('plan'):
+                    pass
+            except NonRecoverableError as e:
+                assert 'Waited more than 1 seconds' in str(e)
+            else:
+                raise RuntimeError('Admission did not time out.')
+        assert controller.metrics()['waiting_commands'] == 0
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_terragrunt_parallelism():
+    directory = tempfile.mkdtemp()
+    try:
+        executor = Mock(return_value='output')
+        tg = Terragrunt(
+            {'resource_config': {'source_path': directory,
+                                 'run_all': True}},
+            executor=executor,
+            binary_path='terragrunt',
+            admission_controller=admission.AdmissionController(
+                directory, slots=8))
+        start = time.time()
+        tg.execute('plan')
+        assert time.time() - start < admission.POLL_INTERVAL
+        command = executor.call_args[0][0]
+        assert command[:3] == ['terragrunt', 'run-all', 'plan']
+        assert command[-2:] == ['--terragrunt-parallelism', '3']
+    finally:
+        shutil.rmtree(directory)
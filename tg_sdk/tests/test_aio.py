@@ -0,0 +1,166 @@
+import os
+import time
+import shutil
+import asyncio
+import tempfile
+from mock import patch
+
+from cloudify.exceptions import NonRecoverableError
+from cloudify_common_sdk.utils import CommonSDKSecret
+
+from .. import AsyncTerragrunt
+
+TERRAGRUNT = '''#!/bin/sh
+case "$1" in
+  plan)
+    echo '{"type": "resource_drift", "change": {"action": "update"}}'
+    echo 'Releasing state lock.'
+    echo '{"type": "change_summary", "changes": {"add": 1}}'
+    echo "debug on stderr" >&2
+    ;;
+  output) echo '{"foo": {"value": "bar"}}' ;;
+  apply) echo "$TG_TEST_VALUE" ;;
+  destroy) echo "destroy failed" >&2; exit 2 ;;
+  render-json) sh -c 'sleep 30' & echo $! > "$PWD/child.pid"; sleep 30 ;;
+  validate-inputs)
+    sh -c 'sleep 30' & echo $! > "$PWD/child.pid"
+    head -c 17000000 /dev/zero | tr '\\0' a; sleep 30 ;;
+  graph-dependencies) echo '"a" -> "b";' ;;
+  terragrunt-info) echo "$TG_TEST_SECRET" ;;
+esac
+'''
+
+TERRAFORM = '''#!/bin/sh
+echo "Terraform v1.5.7"
+'''
+
+
+def _binary(directory, name, content):
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write(content)
+    os.chmod(path, 0o755)
+    return path
+
+
+def _run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _terragrunt(directory, **kwargs):
+    return AsyncTerragrunt(
+        {
+            'resource_config': {
+                'binary_path': _binary(directory, 'terragrunt', TERRAGRUNT),
+                'terraform_binary_path': _binary(
+                    directory, 'terraform', TERRAFORM),
+                'environment_variables': {'TG_TEST_VALUE': 'applied'},
+                'command_options': {}
+            }
+        },
+        cwd=directory,
+        **kwargs)
+
+
+def test_async_commands():
+    directory = tempfile.mkdtemp()
+    try:
+        tg = _terragrunt(directory)
+        plan = _run(tg.plan())
+        assert plan['resource_drifts'] == [{'action': 'update'}]
+        assert plan['change_summary'] == {'add': 1}
+        assert tg.last_result.stderr_bytes == len('debug on stderr\n')
+        assert _run(tg.output()) == {'foo': {'value': 'bar'}}
+        assert _run(tg.apply()) == 'applied'
+        try:
+            _run(tg.destroy())
+        except NonRecoverableError as e:
+            assert 'exit code 2' in str(e)
+            assert 'destroy failed' in str(e)
+        else:
+            raise RuntimeError('A failed command did not raise.')
+    finally:
+        shutil.rmtree(directory)
+
+
+def _assert_process_group_killed(directory):
+    with open(os.path.join(directory, 'child.pid')) as f:
+        pid = int(f.read())
+    for _ in range(50):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return
+        time.sleep(0.1)
+    raise RuntimeError('The child process {} is still running.'.format(pid))
+
+
+def test_async_timeout():
+    directory = tempfile.mkdtemp()
+    try:
+        tg = _terragrunt(directory)
+        try:
+            _run(tg.render_json(timeout=1))
+        except NonRecoverableError as e:
+            assert 'timed out' in str(e)
+        else:
+            raise RuntimeError('The command did not time out.')
+        _assert_process_group_killed(directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_async_cancel():
+    directory = tempfile.mkdtemp()
+    try:
+        tg = _terragrunt(directory)
+
+        async def cancel():
+            task = asyncio.ensure_future(tg.render_json())
+            await asyncio.sleep(1)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                return True
+
+        assert _run(cancel())
+        _assert_process_group_killed(directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_async_line_too_long():
+    directory = tempfile.mkdtemp()
+    try:
+        tg = _terragrunt(directory)
+        try:
+            _run(tg.validate_inputs(timeout=20))
+        except (ValueError, asyncio.LimitOverrunError):
+            pass
+        else:
+            raise RuntimeError('The line did not overrun the limit.')
+        _assert_process_group_killed(directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_async_inherited_and_secrets():
+    directory = tempfile.mkdtemp()
+    try:
+        tg = _terragrunt(directory)
+        with patch('cloudify_common_sdk.utils.get_secret',
+                   return_value='rotated'):
+            tg.environment_variables['TG_TEST_SECRET'] = \
+                CommonSDKSecret('token', None)
+        assert tg.environment['TG_TEST_SECRET'] == 'rotated'
+        assert _run(tg.terragrunt_info()) == 'rotated'
+        # The synchronous methods of Terragrunt still work.
+        tg.resource_config['source_path'] = directory
+        assert tg.dependency_graph() == {'a': {'b'}, 'b': set()}
+    finally:
+        shutil.rmtree(directory)
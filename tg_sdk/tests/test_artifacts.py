@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+
+from .. import artifacts
+
+
+def test_payload_digest():
+    assert artifacts.payload_digest({'a': 1, 'b': [2]}) == \
+        artifacts.payload_digest({'b': [2], 'a': 1})
+    assert artifacts.payload_digest({'a': 1}) != \
+        artifacts.payload_digest({'a': 2})
+
+
+def test_compact_plan():
+    plan = {'change_summary': {'add': 2},
+            'resource_drifts': [{'resource': {'addr': 'a'}},
+                                {'resource': {'addr': 'b'}}]}
+    assert artifacts.compact_plan(plan, 'digest', max_addresses=1) == {
+        'digest': 'digest',
+        'change_summary': {'add': 2},
+        'drifted': ['a'],
+        'drifted_count': 2
+    }
+    assert artifacts.compact_output('', 'digest') == {
+        'digest': 'digest', 'outputs': []}
+
+
+def test_artifact_store():
+    directory = tempfile.mkdtemp()
+    try:
+        store = artifacts.ArtifactStore(os.path.join(directory, 'store'))
+        assert store.load('terraform_plan') is None
+        first = store.save('terraform_plan', {'version': 1})
+        path = store.path('terraform_plan', first)
+        os.utime(path, (0, 0))
+        assert store.save('terraform_plan', {'version': 1}) == first
+        assert os.path.getmtime(path) == 0
+        second = store.save('terraform_plan', {'version': 2})
+        assert not os.path.exists(path)
+        assert store.load('terraform_plan') == {'version': 2}
+        assert store.load('terraform_plan', first) is None
+        store.save('terraform_plan_old', {'other': True})
+        assert store.load('terraform_plan', second) == {'version': 2}
+        assert len(os.listdir(store.directory)) == 2
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_lazy_artifact():
+    directory = tempfile.mkdtemp()
+    try:
+        store = artifacts.ArtifactStore(directory)
+        digest = store.save('terraform_output', {'vpc_id': {'value': 'x'}})
+        lazy = store.lazy('terraform_output', digest)
+        assert not lazy.loaded
+        assert lazy['vpc_id'] == {'value': 'x'}
+        assert lazy.loaded
+        assert list(lazy) == ['vpc_id']
+        assert len(store.lazy('missing')) == 0
+    finally:
+        shutil.rmtree(directory)
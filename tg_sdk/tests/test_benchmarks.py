@@ -0,0 +1,84 @@
+import os
+import json
+import shutil
+import tempfile
+
+from cloudify.exceptions import NonRecoverableError
+
+from ..benchmarks import bench_suite
+from ..benchmarks.fake_terragrunt import make_stack
+
+
+def test_fake_terragrunt_run_all():
+    directory = tempfile.mkdtemp()
+    try:
+        make_stack(directory, 5)
+        tg = bench_suite.fake_terragrunt(directory, run_all=True,
+                                         native_run_all=True, resources=4)
+        assert tg.dependency_graph() == {
+            os.path.join(directory, 'm000'): set(),
+            os.path.join(directory, 'm001'): {
+                os.path.join(directory, 'm000')},
+            os.path.join(directory, 'm002'): {
+                os.path.join(directory, 'm000')},
+            os.path.join(directory, 'm003'): {
+                os.path.join(directory, 'm001')},
+            os.path.join(directory, 'm004'): {
+                os.path.join(directory, 'm001')},
+        }
+        plan = tg.plan()
+        modules = [r.module for r in tg.stack_result]
+        assert modules[0] == os.path.join(directory, 'm000')
+        assert len(modules) == 5
+        assert plan['change_summary']['add'] == 4
+        tg = bench_suite.fake_terragrunt(os.path.join(directory, 'm002'),
+                                         resources=4)
+        plan = tg.plan()
+        assert plan['change_summary']['add'] == 4
+        assert len(plan['resource_drifts']) == 1
+        assert list(tg.output()) == ['m002_output_{}'.format(i)
+                                     for i in range(3)]
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_fake_terragrunt_failure():
+    directory = tempfile.mkdtemp()
+    try:
+        make_stack(directory, 3)
+        tg = bench_suite.fake_terragrunt(directory, run_all=True,
+                                         native_run_all=True,
+                                         fail='apply:m001')
+        result = tg.run_modules('apply')
+        assert {os.path.basename(r.module): r.status for r in result} == {
+            'm000': 'succeeded', 'm001': 'failed', 'm002': 'succeeded'}
+        tg = bench_suite.fake_terragrunt(directory, run_all=True,
+                                         fail='apply')
+        try:
+            tg.apply()
+        except NonRecoverableError as e:
+            assert 'Error: apply failed' in str(e)
+        else:
+            raise RuntimeError('The injected failure was not raised.')
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_bench_suite_thresholds():
+    directory = tempfile.mkdtemp()
+    try:
+        thresholds = os.path.join(directory, 'thresholds.json')
+        with open(thresholds, 'w') as f:
+            json.dump({'plan_parsing.messages_per_second': {'min': 1}}, f)
+        metrics = os.path.join(directory, 'metrics.json')
+        assert bench_suite.main(['plan_parsing', '--scale', '0.01',
+                                 '--thresholds', thresholds,
+                                 '--json', metrics]) == 0
+        with open(thresholds, 'w') as f:
+            json.dump({'plan_parsing.messages_per_second': {'max': 1}}, f)
+        assert bench_suite.main(['plan_parsing', '--scale', '0.01',
+                                 '--thresholds', thresholds]) == 1
+        with open(metrics) as f:
+            assert list(json.load(f)) == ['plan_parsing.messages_per_second']
+    finally:
+        shutil.rmtree(directory)
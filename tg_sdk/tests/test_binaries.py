@@ -0,0 +1,123 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from mock import Mock
+from cloudify.exceptions import NonRecoverableError
+
+from .. import binaries
+
+CONTENT = b'#!/bin/sh\necho terragrunt\n'
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+def _download(path, url):
+    with open(path, 'wb') as f:
+        f.write(CONTENT)
+
+
+def test_binary_store():
+    directory = tempfile.mkdtemp()
+    try:
+        store = binaries.BinaryStore(os.path.join(directory, 'store'))
+        download = Mock(side_effect=_download)
+        targets = [os.path.join(directory, 'i{}'.format(i), 'terragrunt')
+                   for i in range(8)]
+        threads = [threading.Thread(
+            target=store.install, args=('https://host/tg', t, download))
+            for t in targets[:6]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert store.install('https://host/tg', targets[6], download,
+                             sha256=SHA256, mode='hardlink') == SHA256
+        store.install('https://host/tg', targets[7], download,
+                      mode='symlink')
+        download.assert_called_once()
+        assert store.lookup('https://host/tg') == SHA256
+        assert sorted(store.references(SHA256)) == sorted(targets)
+        stored = store.path(SHA256, 'terragrunt')
+        assert os.stat(targets[0]).st_ino != os.stat(stored).st_ino
+        with open(targets[0], 'rb') as f:
+            assert f.read() == CONTENT
+        assert os.stat(targets[6]).st_ino == os.stat(stored).st_ino
+        assert os.readlink(targets[7]) == stored
+        assert os.access(targets[0], os.X_OK)
+
+        for target in targets[:7]:
+            assert store.release(target)
+            assert not os.path.exists(target)
+        assert store.digests() == [SHA256]
+        # A node instance directory that was deleted without uninstall.
+        shutil.rmtree(os.path.dirname(targets[7]))
+        assert store.collect() == [SHA256]
+        assert store.lookup('https://host/tg') is None
+        assert not store.release(targets[0])
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_binary_store_checksum():
+    directory = tempfile.mkdtemp()
+    try:
+        store = binaries.BinaryStore(os.path.join(directory, 'store'))
+        target = os.path.join(directory, 'terragrunt')
+        try:
+            store.install('https://host/tg', target, _download,
+                          sha256='0' * 64)
+            assert False
+        except NonRecoverableError as e:
+            assert SHA256 in str(e)
+        assert not os.path.exists(target)
+        assert store.digests() == []
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_binary_store_changed():
+    directory = tempfile.mkdtemp()
+    try:
+        store = binaries.BinaryStore(os.path.join(directory, 'store'))
+        download = Mock(side_effect=_download)
+        targets = [os.path.join(directory, 'i{}'.format(i), 'terragrunt')
+                   for i in range(2)]
+        store.install('https://host/tg', targets[0], download)
+        with open(store.path(SHA256, 'terragrunt'), 'wb') as f:
+            f.write(b'#!/bin/sh\necho changed\n')
+        store.install('https://host/tg', targets[1], download)
+        assert download.call_count == 2
+        with open(targets[1], 'rb') as f:
+            assert f.read() == CONTENT
+        with open(store.path(SHA256, 'terragrunt'), 'rb') as f:
+            assert f.read() == CONTENT
+        assert sorted(store.references(SHA256)) == targets
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_binary_store_root():
+    directory = tempfile.mkdtemp()
+    try:
+        root = os.path.join(directory, 'store')
+        store = binaries.BinaryStore(root)
+        store.check_root()
+        assert os.stat(root).st_mode & 0o777 == 0o700
+        os.chmod(root, 0o777)
+        try:
+            store.install('https://host/tg',
+                          os.path.join(directory, 'terragrunt'), _download)
+            assert False
+        except NonRecoverableError as e:
+            assert 'written by other users' in str(e)
+        os.rmdir(root)
+        os.symlink(directory, root)
+        try:
+            store.check_root()
+            assert False
+        except NonRecoverableError as e:
+            assert 'not a directory' in str(e)
+    finally:
+        shutil.rmtree(directory)
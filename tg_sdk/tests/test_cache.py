@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+
+from .. import cache
+
+
+def _populate(content):
+    def populate(path):
+        os.makedirs(path)
+        with open(os.path.join(path, 'main.tf'), 'w') as f:
+            f.write(content)
+    return populate
+
+
+def test_file_lock():
+    directory = tempfile.mkdtemp()
+    try:
+        lock = os.path.join(directory, 'locks', 'a.lock')
+        with cache.file_lock(lock):
+            assert os.path.exists(lock)
+        with cache.file_lock(lock, shared=True):
+            with cache.file_lock(lock, shared=True):
+                pass
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_link_tree():
+    src = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(src, 'module'))
+        with open(os.path.join(src, 'module', 'main.tf'), 'w') as f:
+            f.write('data')
+        for mode in cache.LINK_MODES:
+            dst = tempfile.mkdtemp()
+            try:
+                cache.link_tree(src, dst, mode)
+                with open(os.path.join(dst, 'module', 'main.tf')) as f:
+                    assert f.read() == 'data'
+                assert cache.tree_digest(src) == cache.tree_digest(dst)
+                inode = os.stat(os.path.join(src, 'module', 'main.tf'))
+                linked = os.stat(os.path.join(dst, 'module', 'main.tf'))
+                assert (inode.st_ino == linked.st_ino) == (mode == 'hardlink')
+            finally:
+                shutil.rmtree(dst)
+    finally:
+        shutil.rmtree(src)
+
+
+def test_sync_tree():
+    src = tempfile.mkdtemp()
+    dst = tempfile.mkdtemp()
+    try:
+        for name, content in [('keep.tf', 'a'), ('change.tf', 'b'),
+                              (os.path.join('old', 'gone.tf'), 'c')]:
+            os.makedirs(os.path.dirname(os.path.join(src, name)),
+                        exist_ok=True)
+            with open(os.path.join(src, name), 'w') as f:
+                f.write(content)
+        manifest, changed = cache.sync_tree(src, dst)
+        assert len(changed) == 3
+        for directory in ['.terraform', '.terragrunt-cache']:
+            os.makedirs(os.path.join(dst, directory))
+        with open(os.path.join(dst, 'telemetry.jsonl'), 'w') as f:
+            f.write('{}')
+        keep = os.stat(os.path.join(dst, 'keep.tf'))
+
+        with open(os.path.join(src, 'change.tf'), 'w') as f:
+            f.write('changed')
+        shutil.rmtree(os.path.join(src, 'old'))
+        os.makedirs(os.path.join(src, '.terraform'))
+        manifest, changed = cache.sync_tree(src, dst, manifest, 'hardlink')
+        assert sorted(changed) == ['change.tf', os.path.join('old', 'gone.tf')]
+        assert sorted(manifest) == ['change.tf', 'keep.tf']
+        assert os.stat(os.path.join(dst, 'keep.tf')).st_ino == keep.st_ino
+        with open(os.path.join(dst, 'change.tf')) as f:
+            assert f.read() == 'changed'
+        assert not os.path.exists(os.path.join(dst, 'old'))
+        assert sorted(os.listdir(dst)) == [
+            '.terraform', '.terragrunt-cache', 'change.tf', 'keep.tf',
+            'telemetry.jsonl']
+        # Without a manifest, identical files are not written either.
+        assert cache.sync_tree(src, dst)[1] == []
+    finally:
+        shutil.rmtree(src)
+        shutil.rmtree(dst)
+
+
+def test_lru_cache():
+    root = tempfile.mkdtemp()
+    try:
+        lru = cache.LRUCache(root)
+        assert lru.get('a') is None
+        path = lru.get_or_create('a', _populate('a'))
+        assert lru.get_or_create('a', _populate('other')) == path
+        with open(os.path.join(path, 'main.tf')) as f:
+            assert f.read() == 'a'
+        assert lru.usage()['entries'] == 1
+        assert lru.usage()['hits'] == 1
+        assert lru.usage()['misses'] == 1
+
+        target = tempfile.mkdtemp()
+        try:
+            lru.link('a', _populate('a'), target, 'hardlink')
+            assert os.path.exists(os.path.join(target, 'main.tf'))
+        finally:
+            shutil.rmtree(target)
+    finally:
+        shutil.rmtree(root)
+
+
+def test_lru_cache_evict():
+    root = tempfile.mkdtemp()
+    try:
+        lru = cache.LRUCache(root, max_size=2)
+        lru.get_or_create('a', _populate('a'))
+        os.utime(os.path.join(root, 'a', cache.LAST_USED_FILE), (1, 1))
+        lru.get_or_create('b', _populate('b'))
+        os.utime(os.path.join(root, 'b', cache.LAST_USED_FILE), (2, 2))
+        lru.get_or_create('c', _populate('c'))
+        assert sorted(e[0] for e in lru.entries()) == ['b', 'c']
+        assert lru.get('a') is None
+    finally:
+        shutil.rmtree(root)
+
+
+def test_populate_failure():
+    root = tempfile.mkdtemp()
+    try:
+        lru = cache.LRUCache(root)
+
+        def populate(_):
+            raise RuntimeError('download failed')
+
+        try:
+            lru.get_or_create('a', populate)
+        except RuntimeError:
+            pass
+        assert lru.get('a') is None
+        assert [e for e in os.listdir(root) if e != '.locks'] == []
+    finally:
+        shutil.rmtree(root)
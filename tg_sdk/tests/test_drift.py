@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+
+from mock import Mock
+from cloudify.exceptions import NonRecoverableError
+
+from .. import drift
+from ..tg import Terragrunt
+from ..utils import TERMINATE_TIMEOUT
+from ..benchmarks.bench_suite import fake_terragrunt
+from ..benchmarks.fake_terragrunt import make_stack
+
+PLAN_OUTPUT = [
+    '{"type": "resource_drift", "change": {"resource": '
+    '{"addr": "aws_vpc.main", "module": ""}, "action": "update"}}',
+    '{"type": "resource_drift", "change": {"resource": '
+    '{"addr": "module.db.aws_db_instance.db", "module": "module.db"}, '
+    '"action": "delete"}}',
+    '{"type": "change_summary", "changes": {"add": 0}}',
+]
+
+
+def test_summarize_drift():
+    plan = {'resource_drifts': [
+        {'resource': {'addr': 'aws_vpc.main'}, 'action': 'update'},
+        {'resource': {'addr': 'module.db.aws_db_instance.db',
+                      'module': 'module.db'}, 'action': 'replace'},
+        {'resource': {'addr': 'module.db.aws_subnet.a',
+                      'module': 'module.db'}, 'action': 'delete'},
+    ]}
+    assert drift.summarize_drift(plan) == {
+        '.': {'add': 0, 'change': 1, 'destroy': 0,
+              'addresses': ['aws_vpc.main']},
+        'module.db': {'add': 1, 'change': 0, 'destroy': 2,
+                      'addresses': ['module.db.aws_db_instance.db',
+                                    'module.db.aws_subnet.a']}
+    }
+    assert list(drift.summarize_drift(plan, 'vpc')) == ['vpc']
+    assert drift.summarize_drift(None) == {}
+
+
+def test_stack_drift():
+    assert drift.stack_drift({}) == {'status': drift.CLEAN}
+    assert drift.stack_drift({'.': {}})['status'] == drift.DRIFTED
+    assert drift.stack_drift(error='boom') == {
+        'status': drift.FAILED, 'error': 'boom'}
+    assert drift.stack_drift(error='killed', timed_out=True)['status'] == \
+        drift.TIMED_OUT
+
+
+def test_drift_report():
+    directory = tempfile.mkdtemp()
+    try:
+        entries = os.path.join(directory, 'entries')
+        os.makedirs(entries)
+        modules = drift.summarize_drift({'resource_drifts': [
+            {'resource': {'addr': 'aws_vpc.main'}, 'action': 'create'}]})
+        for stack_id, entry in [('vpc_1', drift.stack_drift(modules)),
+                                ('db_1', drift.stack_drift({})),
+                                ('app_1', drift.stack_drift(error='x'))]:
+            with open(os.path.join(entries, stack_id + '.json'), 'w') as f:
+                json.dump(entry, f)
+        with open(os.path.join(entries, 'broken.json'), 'w') as f:
+            f.write('{')
+        path = os.path.join(directory, 'report', 'drift.json')
+        report = drift.DriftReport().load(entries).write(path)
+        assert set(report['stacks']) == {'vpc_1', 'db_1', 'app_1'}
+        summary = report['summary']
+        assert summary['stacks'] == 3
+        assert summary[drift.CLEAN] == 1
+        assert summary[drift.DRIFTED] == 1
+        assert summary[drift.FAILED] == 1
+        assert summary[drift.TIMED_OUT] == 0
+        assert (summary['add'], summary['change'], summary['destroy']) == \
+            (1, 0, 0)
+        with open(path) as f:
+            assert json.load(f) == report
+        assert drift.DriftReport().load(
+            os.path.join(directory, 'missing')).stacks == {}
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_terragrunt_drift():
+    directory = tempfile.mkdtemp()
+    try:
+        calls = []
+
+        def executor(command, **kwargs):
+            calls.append(command)
+            return iter(PLAN_OUTPUT)
+
+        executor.supports_streaming = True
+        tg = Terragrunt({'resource_config': {'source_path': directory}},
+                        executor=executor,
+                        binary_path='terragrunt',
+                        command_timeout=60)
+        modules = tg.drift()
+        assert modules['.']['addresses'] == ['aws_vpc.main']
+        assert modules['module.db']['destroy'] == 1
+        assert tg.terraform_plan is None
+        command = calls[-1]
+        assert command[:4] == ['timeout',
+                               '--kill-after={}'.format(TERMINATE_TIMEOUT),
+                               '60',
+                               'terragrunt']
+        assert 'plan' in command
+        assert '-refresh-only' in command
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_terragrunt_drift_native_run_all():
+    directory = tempfile.mkdtemp()
+    try:
+        tg = Terragrunt({'resource_config': {'source_path': directory,
+                                             'run_all': True,
+                                             'native_run_all': True}},
+                        executor=Mock(),
+                        binary_path='terragrunt')
+        tg._plan = Mock(return_value={})
+        tg.stack_result = [
+            Mock(module='vpc', output=PLAN_OUTPUT[0]),
+            Mock(module='db', output=''),
+        ]
+        assert list(tg.drift()) == ['vpc']
+        tg._plan.assert_called_once_with(['-refresh-only'],
+                                         incremental=False,
+                                         per_module=True)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_terragrunt_drift_run_all():
+    directory = tempfile.mkdtemp()
+    try:
+        make_stack(directory, 2)
+        tg = fake_terragrunt(directory, run_all=True, resources=10)
+        modules = tg.drift()
+        # The modules have the same root resource addresses.
+        assert sorted(modules) == [os.path.join(directory, m)
+                                   for m in ['m000', 'm001']]
+        assert all(len(m['addresses']) == 2 for m in modules.values())
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_terragrunt_drift_deadline():
+    directory = tempfile.mkdtemp()
+    try:
+        calls = []
+
+        def executor(command, **kwargs):
+            calls.append(command)
+            return iter(PLAN_OUTPUT)
+
+        executor.supports_streaming = True
+        tg = Terragrunt({'resource_config': {'source_path': directory}},
+                        executor=executor,
+                        binary_path='terragrunt',
+                        command_timeout=600)
+        tg.deadline = time.time() + 60
+        tg.drift()
+        assert 55 <= int(calls[-1][2]) <= 60
+        tg.deadline = time.time() - 1
+        try:
+            tg.drift()
+        except NonRecoverableError as e:
+            assert 'timed out' in str(e)
+        else:
+            raise RuntimeError('A command started after the deadline.')
+        assert len(calls) == 1
+    finally:
+        shutil.rmtree(directory)
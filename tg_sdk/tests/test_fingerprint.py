@@ -0,0 +1,196 @@
+import os
+import shutil
+import tempfile
+
+from mock import Mock, patch
+from cloudify_common_sdk.utils import CommonSDKSecret
+
+from .. import fingerprint
+from ..tg import Terragrunt
+from ..prewarm import NO_AUTO_INIT
+from ..benchmarks.bench_suite import FAKE_TERRAGRUNT, fake_terragrunt
+from ..benchmarks.fake_terragrunt import make_stack
+
+
+def _write(path, content):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def test_hash_values():
+    assert fingerprint.hash_values({'a': 1, 'b': 2}) == \
+        fingerprint.hash_values({'b': 2, 'a': 1})
+    assert fingerprint.hash_values({'a': 1}) != \
+        fingerprint.hash_values({'a': 2})
+
+
+def test_module_fingerprints():
+    stack = tempfile.mkdtemp()
+    try:
+        vpc = os.path.join(stack, 'vpc')
+        app = os.path.join(stack, 'app')
+        _write(os.path.join(stack, 'terragrunt.hcl'), 'root')
+        _write(os.path.join(vpc, 'terragrunt.hcl'), 'vpc')
+        _write(os.path.join(vpc, '.terragrunt-cache', 'x', 'main.tf'), 'x')
+        _write(os.path.join(app, 'terragrunt.hcl'), 'app')
+        _write(os.path.join(app, 'README.md'), 'ignored')
+        graph = {vpc: set(), app: {vpc}}
+
+        before = fingerprint.module_fingerprints(graph, stack, {'v': 1})
+        assert fingerprint.changed_modules(graph, before, before) == set()
+        assert fingerprint.changed_modules(graph, before, {}) == {vpc, app}
+
+        _write(os.path.join(app, 'README.md'), 'still ignored')
+        _write(os.path.join(vpc, '.terragrunt-cache', 'x', 'main.tf'), 'y')
+        assert fingerprint.module_fingerprints(
+            graph, stack, {'v': 1}) == before
+
+        _write(os.path.join(vpc, 'main.tf'), 'changed')
+        after = fingerprint.module_fingerprints(graph, stack, {'v': 1})
+        assert after[app] == before[app]
+        assert fingerprint.changed_modules(graph, after, before) == \
+            {vpc, app}
+
+        _write(os.path.join(stack, 'terragrunt.hcl'), 'root changed')
+        assert fingerprint.module_fingerprints(
+            graph, stack, {'v': 1})[app] != after[app]
+        assert fingerprint.module_fingerprints(
+            graph, stack, {'v': 2})[vpc] != after[vpc]
+    finally:
+        shutil.rmtree(stack)
+
+
+def test_dependents_closure():
+    graph = {'a': set(), 'b': {'a'}, 'c': {'b'}, 'd': set()}
+    assert fingerprint.dependents_closure(graph, ['a']) == {'a', 'b', 'c'}
+    assert fingerprint.dependents_closure(graph, ['d']) == {'d'}
+
+
+def test_fingerprint_index():
+    directory = tempfile.mkdtemp()
+    try:
+        index = fingerprint.FingerprintIndex(
+            os.path.join(directory, fingerprint.FINGERPRINTS_FILE))
+        assert index.load() == {}
+        index.save({'a': '1'})
+        assert index.load() == {'a': '1'}
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_init_fingerprint():
+    stack = tempfile.mkdtemp()
+    try:
+        module = os.path.join(stack, 'app')
+        _write(os.path.join(stack, 'root.hcl'),
+               'remote_state {\n  backend = "s3"\n'
+               '  config = {\n    bucket = "a"\n  }\n}\n')
+        _write(os.path.join(module, 'terragrunt.hcl'),
+               'terraform {\n  source = "git::x//app?ref=v1"\n}\n')
+        _write(os.path.join(module, 'main.tf'), 'resource "a" "b" {}\n')
+        first = fingerprint.init_fingerprint(module, stack, 'tf 1.5.7')
+        assert fingerprint.init_fingerprint(
+            module, stack, 'tf 1.5.7') == first
+        # Resources and inputs do not matter to init.
+        _write(os.path.join(module, 'main.tf'), 'resource "a" "c" {}\n')
+        assert fingerprint.init_fingerprint(
+            module, stack, 'tf 1.5.7') == first
+        assert fingerprint.init_fingerprint(
+            module, stack, 'tf 1.6.0') != first
+        _write(os.path.join(module, 'terragrunt.hcl'),
+               'terraform {\n  source = "git::x//app?ref=v2"\n}\n')
+        second = fingerprint.init_fingerprint(module, stack, 'tf 1.5.7')
+        assert second != first
+        _write(os.path.join(stack, 'root.hcl'),
+               'remote_state {\n  backend = "s3"\n'
+               '  config = {\n    bucket = "b"\n  }\n}\n')
+        third = fingerprint.init_fingerprint(module, stack, 'tf 1.5.7')
+        assert third != second
+        _write(os.path.join(module, fingerprint.DEPENDENCY_LOCK_FILE), 'p')
+        fourth = fingerprint.init_fingerprint(module, stack, 'tf 1.5.7')
+        assert fourth != third
+        _write(os.path.join(module, '.terragrunt-cache', 'x', '.terraform',
+                            'modules.json'), '{}')
+        assert fingerprint.is_initialized(module)
+        assert fingerprint.init_fingerprint(
+            module, stack, 'tf 1.5.7') != fourth
+    finally:
+        shutil.rmtree(stack)
+
+
+def test_reuse_init():
+    stack = tempfile.mkdtemp()
+    try:
+        first, second = make_stack(stack, 2)
+        executor = Mock(return_value='{}')
+        tg = Terragrunt({'resource_config': {'source_path': stack,
+                                             'run_all': True,
+                                             'reuse_init': True}},
+                        executor=executor,
+                        binary_path=FAKE_TERRAGRUNT,
+                        cwd=stack)
+        # Auto-init the first time.
+        tg.execute('output')
+        assert NO_AUTO_INIT not in executor.call_args[0][0]
+        tg.execute('output')
+        assert executor.call_args[0][0][:4] == [
+            FAKE_TERRAGRUNT, 'run-all', 'output', NO_AUTO_INIT]
+        assert executor.call_count == 2
+
+        _write(os.path.join(second, fingerprint.DEPENDENCY_LOCK_FILE), 'p')
+        tg.execute('plan')
+        init, plan = [c[0][0] for c in executor.call_args_list[2:]]
+        assert init[:2] == [FAKE_TERRAGRUNT, 'init']
+        assert init[-2:] == ['--terragrunt-working-dir', second]
+        assert NO_AUTO_INIT in plan
+
+        executor.side_effect = RuntimeError('failed')
+        try:
+            tg.execute('apply')
+        except RuntimeError:
+            pass
+        assert not tg.init_fingerprint_index.load()
+        executor.side_effect = None
+        tg.execute('apply')
+        assert NO_AUTO_INIT not in executor.call_args[0][0]
+        # Init-free commands neither wait for nor record init.
+        tg.execute('graph-dependencies')
+        assert set(tg.init_fingerprint_index.load()) == {first, second}
+    finally:
+        shutil.rmtree(stack)
+
+
+def test_reuse_init_real_commands():
+    stack = tempfile.mkdtemp()
+    try:
+        make_stack(stack, 3)
+        tg = fake_terragrunt(stack, run_all=True, native_run_all=True)
+        tg.resource_config['reuse_init'] = True
+        assert tg.run_modules('output').ok
+        assert tg.run_modules('output').ok
+        assert [r['command'][2] for r in tg.telemetry.records
+                if r['name'] == 'output'][-3:] == [NO_AUTO_INIT] * 3
+    finally:
+        shutil.rmtree(stack)
+
+
+def test_fingerprints_follow_rotated_secrets():
+    stack = tempfile.mkdtemp()
+    try:
+        make_stack(stack, 1)
+        digests = []
+        for value in ['one', 'two']:
+            with patch('cloudify_common_sdk.utils.get_secret',
+                       return_value=value):
+                secret = CommonSDKSecret('token', None)
+            tg = Terragrunt({'resource_config': {
+                'source_path': stack,
+                'environment_variables': {'TOKEN': secret}}}, cwd=stack)
+            digests.append((tg.workspace_fingerprint(),
+                            tg.module_fingerprints({stack: set()})))
+        assert digests[0][0] != digests[1][0]
+        assert digests[0][1] != digests[1][1]
+    finally:
+        shutil.rmtree(stack)
@@ -0,0 +1,48 @@
+import json
+
+from .. import plan
+
+
+def test_iter_lines():
+    assert list(plan.iter_lines('a\nb\n')) == ['a', 'b']
+    assert list(plan.iter_lines(b'a\nb')) == ['a', 'b']
+    assert list(plan.iter_lines(iter([b'a\n', 'b\n']))) == ['a', 'b']
+
+
+def test_iter_json_messages():
+    output = '{"a": 1}{"b": 2}\n' \
+             'Releasing state lock. This may take a few moments...\n' \
+             '{"c": "} {"}\n' \
+             '{"d":\n' \
+             '  {"e": 3}\n' \
+             '}\n' \
+             '{"broken": \n' \
+             '{"f": 4}\n'
+    messages = list(plan.iter_json_messages(output))
+    assert messages == [{'a': 1}, {'b': 2}, {'c': '} {'}, {'d': {'e': 3}},
+                        {'f': 4}]
+
+
+def test_iter_json_messages_max_pending():
+    lines = ['{"a": ['] + ['1,'] * 100 + ['2]}']
+    assert list(plan.iter_json_messages(lines, max_pending=64)) == []
+    assert list(plan.iter_json_messages(lines)) == [{'a': [1] * 100 + [2]}]
+
+
+def test_parse_plan():
+    messages = [
+        {'type': 'version', 'terraform': '1.5.0'},
+        {'type': 'resource_drift', 'change': {'action': 'update'}},
+        {'type': 'planned_change', 'change': {'action': 'create'}},
+        {'type': 'diagnostic', 'diagnostic': {'severity': 'warning'}},
+        {'type': 'change_summary', 'changes': {'add': 1}},
+        {'type': 'outputs', 'outputs': {'foo': {'sensitive': False}}},
+    ]
+    output = (json.dumps(m) + '\n' for m in messages)
+    assert plan.parse_plan(output) == {
+        'resource_drifts': [{'action': 'update'}],
+        'planned_changes': [{'action': 'create'}],
+        'diagnostics': [{'severity': 'warning'}],
+        'outputs': {'foo': {'sensitive': False}},
+        'change_summary': {'add': 1}
+    }
@@ -0,0 +1,113 @@
+import shutil
+import tempfile
+
+from .. import plan_delta
+from ..plan_model import PlanModel
+from ..benchmarks.bench_suite import fake_terragrunt
+from ..benchmarks.fake_terragrunt import make_stack
+
+
+def _plan(drifts, changes):
+    return {
+        'resource_drifts': [{'resource': {'addr': a}, 'action': action}
+                            for a, action in drifts.items()],
+        'planned_changes': [{'resource': {'addr': a}, 'action': action}
+                            for a, action in changes.items()],
+        'change_summary': {}
+    }
+
+
+def test_plan_delta():
+    previous = _plan(
+        {'aws_s3_bucket.a': 'update', 'aws_s3_bucket.b': 'delete'},
+        {'aws_instance.x': 'create', 'aws_instance.y': 'update'})
+    current = _plan(
+        {'aws_s3_bucket.b': 'update', 'aws_s3_bucket.c': 'update'},
+        {'aws_instance.y': 'replace'})
+    index = plan_delta.plan_index(current)
+    assert index == plan_delta.plan_index(PlanModel.from_dict(current))
+
+    baseline = plan_delta.plan_delta({}, index)
+    assert baseline['summary']['baseline']
+    assert [d['address'] for d in baseline['new_drifts']] == [
+        'aws_s3_bucket.b', 'aws_s3_bucket.c']
+    assert 'First plan' in plan_delta.format_delta(baseline)
+
+    delta = plan_delta.plan_delta(plan_delta.plan_index(previous), index)
+    assert delta['new_drifts'] == [
+        {'address': 'aws_s3_bucket.c', 'action': 'update'}]
+    assert delta['resolved_drifts'] == [
+        {'address': 'aws_s3_bucket.a', 'action': 'update'}]
+    assert delta['changed_drifts'] == [
+        {'address': 'aws_s3_bucket.b', 'before': 'delete',
+         'after': 'update'}]
+    assert delta['new_changes'] == []
+    assert delta['resolved_changes'] == [
+        {'address': 'aws_instance.x', 'action': 'create'}]
+    assert delta['changed_actions'] == [
+        {'address': 'aws_instance.y', 'before': 'update',
+         'after': 'replace'}]
+    assert delta['summary'] == {
+        'baseline': False, 'changed': True, 'drifted': 2, 'planned': 1,
+        'new_drifts': 1, 'resolved_drifts': 1, 'changed_drifts': 1,
+        'new_changes': 0, 'resolved_changes': 1, 'changed_actions': 1}
+    compact = plan_delta.compact_delta(baseline, 1)
+    assert len(compact['new_drifts']) == 1
+    assert compact['summary']['new_drifts'] == 2
+
+    unchanged = plan_delta.plan_delta(index, plan_delta.plan_index(current))
+    assert not unchanged['summary']['changed']
+    assert unchanged['digest'] == unchanged['previous_digest']
+    assert 'did not change' in plan_delta.format_delta(unchanged)
+
+
+def test_plan_delta_modules():
+    previous = {'app': _plan({'aws_s3_bucket.a': 'update'}, {}),
+                'db': _plan({}, {'aws_s3_bucket.a': 'create'})}
+    current = {'app': _plan({}, {}),
+               'db': _plan({'aws_s3_bucket.a': 'update'},
+                           {'aws_s3_bucket.a': 'update'})}
+    index = plan_delta.plan_index(None, current)
+    assert index == plan_delta.plan_index(
+        None, {m: PlanModel.from_dict(p) for m, p in current.items()})
+    delta = plan_delta.plan_delta(
+        plan_delta.plan_index(None, previous), index)
+    assert delta['new_drifts'] == [
+        {'address': 'aws_s3_bucket.a', 'module': 'db', 'action': 'update'}]
+    assert delta['resolved_drifts'] == [
+        {'address': 'aws_s3_bucket.a', 'module': 'app', 'action': 'update'}]
+    assert delta['changed_drifts'] == []
+    assert delta['changed_actions'] == [
+        {'address': 'aws_s3_bucket.a', 'module': 'db', 'before': 'create',
+         'after': 'update'}]
+    assert delta['summary']['drifted'] == 1
+
+
+def test_terragrunt_plan_delta():
+    directory = tempfile.mkdtemp()
+    try:
+        make_stack(directory, 2)
+        tg = fake_terragrunt(directory, run_all=True, resources=10)
+        tg.resource_config['plan_delta'] = True
+        tg.plan()
+        assert tg.terraform_plan_delta['summary']['baseline']
+        assert tg.terraform_plan_delta['summary']['new_drifts'] == 4
+        assert [(d['module'], d['address'])
+                for d in tg.terraform_plan_delta['new_drifts']][:2] == [
+            ('m000', 'null_resource.m000_0'),
+            ('m000', 'null_resource.m000_5')]
+        tg.plan()
+        assert not tg.terraform_plan_delta['summary']['changed']
+
+        tg = fake_terragrunt(directory, run_all=True, resources=10,
+                             drift_every=2)
+        tg.resource_config.update(plan_delta=True, plan_model=True)
+        tg.plan()
+        summary = tg.terraform_plan_delta['summary']
+        assert summary['changed']
+        # r0, r2, r4, r6 and r8 of each module instead of r0 and r5.
+        assert summary['new_drifts'] == 8
+        assert summary['resolved_drifts'] == 2
+        assert summary['new_changes'] == 0
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,117 @@
+import io
+import json
+import shutil
+import logging
+import tempfile
+import tracemalloc
+
+from .. import plan_model
+from ..plan import parse_plan
+from ..drift import summarize_drift
+from ..benchmarks.bench_suite import fake_terragrunt
+from ..benchmarks.fake_terragrunt import make_stack
+
+logger = logging.getLogger('test_plan_model')
+logger.setLevel(logging.WARNING)
+
+
+def _plan_lines(count):
+    for index in range(count):
+        module = 'module.m{}'.format(index % 4)
+        resource_type = 'aws_instance' if index % 2 else 'aws_s3_bucket'
+        resource = {
+            'addr': '{m}.{t}.r[{i}]'.format(
+                m=module, t=resource_type, i=index),
+            'module': module,
+            'resource': '{t}.r[{i}]'.format(t=resource_type, i=index),
+            'implied_provider': 'aws',
+            'resource_type': resource_type,
+            'resource_name': 'r',
+            'resource_key': index
+        }
+        if index % 5 == 0:
+            yield json.dumps({
+                'type': 'resource_drift',
+                'change': {'resource': resource, 'action': 'update',
+                           'before': {'size': index},
+                           'after': {'size': index + 1}}})
+        yield json.dumps({
+            'type': 'planned_change',
+            'change': {'resource': resource,
+                       'action': 'create' if index % 3 else 'update'}})
+    yield json.dumps({'type': 'change_summary',
+                      'changes': {'add': 1, 'change': 2, 'remove': 0}})
+    yield json.dumps({'type': 'diagnostic',
+                      'diagnostic': {'severity': 'warning'}})
+    yield 'Releasing state lock.'
+
+
+def test_split_address():
+    assert plan_model.split_address('aws_instance.web') == \
+        ('', 'aws_instance', 'web')
+    assert plan_model.split_address('module.app.aws_instance.web[0]') == \
+        ('module.app', 'aws_instance', 'web[0]')
+    assert plan_model.split_address(
+        'module.a["x.y"].module.b.data.aws_ami.u["k.1"]') == \
+        ('module.a["x.y"].module.b', 'aws_ami', 'u["k.1"]')
+
+
+def test_plan_model():
+    lines = list(_plan_lines(100))
+    plan = parse_plan(lines, logger)
+    model = plan_model.parse_plan_model(lines, logger)
+    assert model.to_dict() == plan
+    assert json.loads(model.to_json()) == plan
+    exported = io.StringIO()
+    model.to_json(exported)
+    assert exported.getvalue() == model.to_json()
+    assert plan_model.PlanModel.from_dict(plan).to_dict() == plan
+    assert summarize_drift(model) == summarize_drift(plan)
+
+    changes = model.query(kind=plan_model.PLANNED, module='module.m1',
+                          resource_type='aws_instance', action='update')
+    assert [c.address for c in changes] == [
+        'module.m1.aws_instance.r[{}]'.format(i) for i in [9, 21, 33, 45,
+                                                           57, 69, 81, 93]]
+    assert model.count(kind=plan_model.DRIFT) == 20
+    assert model.count(kind=plan_model.DRIFT, action='create') == 0
+    assert model.values('module') == ['module.m{}'.format(i)
+                                      for i in range(4)]
+    drift = model.get_change('module.m0.aws_s3_bucket.r[0]',
+                             plan_model.DRIFT)
+    assert drift.before == {'size': 0}
+    assert drift.after == {'size': 1}
+    assert drift.change == plan['resource_drifts'][0]
+    assert model.get_change('aws_instance.missing') is None
+    # Decoded values are copies.
+    drift.change['before']['size'] = 7
+    assert drift.before == {'size': 0}
+
+
+def test_plan_model_memory():
+    lines = list(_plan_lines(5000))
+    sizes = []
+    for parse in [parse_plan, plan_model.parse_plan_model]:
+        tracemalloc.start()
+        try:
+            plan = parse(lines, logger)
+            sizes.append(tracemalloc.get_traced_memory()[0])
+        finally:
+            tracemalloc.stop()
+        del plan
+    assert sizes[1] < sizes[0] * 0.6
+
+
+def test_terragrunt_plan_model():
+    directory = tempfile.mkdtemp()
+    try:
+        make_stack(directory, 2)
+        tg = fake_terragrunt(directory, run_all=True, resources=10)
+        tg.resource_config['plan_model'] = True
+        plan = tg.plan()
+        assert isinstance(plan, plan_model.PlanModel)
+        assert plan.count(kind=plan_model.PLANNED) == 20
+        assert len(plan.query(kind=plan_model.DRIFT,
+                              resource_type='null_resource')) == 4
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,167 @@
+import time
+import threading
+
+from cloudify.exceptions import NonRecoverableError
+
+from .. import preflight
+from ..tg import Terragrunt
+
+
+def test_preflight_runs_stages_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def stage(value):
+        def run():
+            barrier.wait()
+            return value
+        return run
+
+    runner = preflight.Preflight(
+        [('one', stage(1)), ('two', stage(2)), ('three', stage(3))])
+    assert runner.run() == {'one': 1, 'two': 2, 'three': 3}
+    timings = runner.timings()
+    assert list(timings) == ['one', 'two', 'three']
+    assert all(t['status'] == preflight.SUCCEEDED
+               for t in timings.values())
+
+
+def test_preflight_fails_fast():
+    stop = threading.Event()
+
+    def fail():
+        raise NonRecoverableError('validate-inputs failed')
+
+    def slow():
+        if stop.wait(5):
+            raise NonRecoverableError('terminated')
+        return 'plan'
+
+    runner = preflight.Preflight(
+        [('validate_inputs', fail), ('plan', slow)],
+        on_cancel=stop.set)
+    start = time.time()
+    try:
+        runner.run()
+    except NonRecoverableError as e:
+        assert 'validate-inputs failed' in str(e)
+    else:
+        raise RuntimeError('A failed stage did not raise.')
+    assert time.time() - start < 5
+    assert runner.cancelled
+    timings = runner.timings()
+    assert timings['validate_inputs']['status'] == preflight.FAILED
+    assert timings['plan']['status'] == preflight.CANCELLED
+
+
+def test_preflight_stages_after():
+    running = []
+    overlapped = []
+
+    def stage(name):
+        def run():
+            running.append(name)
+            overlapped.extend((name, n) for n in running if n != name)
+            time.sleep(0.2)
+            running.remove(name)
+            return name
+        return run
+
+    names = ['info', 'check', 'validate', 'plan']
+    runner = preflight.Preflight([(n, stage(n)) for n in names],
+                                 after={'validate': ['info'],
+                                        'plan': ['info']})
+    start = time.time()
+    assert list(runner.run().values()) == names
+    assert time.time() - start < 0.6
+    assert ('plan', 'validate') in overlapped
+    assert not any('info' in pair for pair in overlapped
+                   if 'check' not in pair)
+    try:
+        preflight.Preflight([(n, stage(n)) for n in names],
+                            after={'info': ['plan']})
+        assert False
+    except ValueError:
+        pass
+
+
+def test_preflight_waits_for_running_stages():
+    finished = []
+
+    def fail():
+        time.sleep(0.1)
+        raise NonRecoverableError('validate-inputs failed')
+
+    def plan():
+        # A command that on_cancel can not stop.
+        time.sleep(1)
+        finished.append('plan')
+
+    def apply():
+        finished.append('apply')
+
+    runner = preflight.Preflight(
+        [('validate_inputs', fail), ('plan', plan), ('apply', apply)],
+        after={'apply': ['plan']})
+    try:
+        runner.run()
+    except NonRecoverableError:
+        pass
+    else:
+        raise RuntimeError('A failed stage did not raise.')
+    assert finished == ['plan']
+    assert runner.timings()['apply']['status'] == preflight.CANCELLED
+
+
+def test_preflight_wrapper():
+    local = threading.local()
+
+    def wrapper(func):
+        def wrapped():
+            local.value = 'set'
+            return func()
+        return wrapped
+
+    runner = preflight.Preflight(
+        [('stage', lambda: getattr(local, 'value', None))],
+        wrapper=wrapper)
+    assert runner.run() == {'stage': 'set'}
+
+
+def test_terragrunt_cancel():
+    tg = Terragrunt({'resource_config': {}})
+    process = tg._execute(['sh', '-c', 'echo started; sleep 30'],
+                          stream=True)
+    lines = iter(process)
+    assert next(lines) == 'started'
+    tg.cancel()
+    start = time.time()
+    try:
+        list(lines)
+    except NonRecoverableError as e:
+        assert 'exit code' in str(e)
+    else:
+        raise RuntimeError('A cancelled command did not raise.')
+    assert time.time() - start < 5
+
+
+def test_terragrunt_cancel_from_threads():
+    tg = Terragrunt({'resource_config': {}})
+    processes = []
+
+    def start():
+        processes.append(tg._execute(['sh', '-c', 'sleep 30'], stream=True))
+
+    threads = [threading.Thread(target=start) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(p.pid for p in tg._processes) == \
+        sorted(p.pid for p in processes)
+    tg.cancel()
+    for process in processes:
+        try:
+            process.wait()
+        except NonRecoverableError:
+            pass
+        assert not process.running
@@ -0,0 +1,73 @@
+import os
+import time
+import shutil
+import tempfile
+
+from mock import Mock
+
+from .. import prewarm
+from ..tg import Terragrunt
+from ..benchmarks.bench_suite import FAKE_TERRAGRUNT
+from ..benchmarks.fake_terragrunt import make_stack
+
+
+def stack_terragrunt(directory, executor=None, **resource_config):
+    resource_config.update(source_path=directory, prewarm=True)
+    return Terragrunt({'resource_config': resource_config},
+                      executor=executor or Mock(return_value='output'),
+                      binary_path=FAKE_TERRAGRUNT,
+                      cwd=directory)
+
+
+def test_prewarm_in_background():
+    directory = tempfile.mkdtemp()
+    try:
+        make_stack(directory, 2)
+        tg = stack_terragrunt(
+            directory, run_all=True,
+            environment_variables={'FAKE_TG_LATENCY': '0.5'})
+        start = time.time()
+        assert tg.start_prewarm()
+        assert time.time() - start < 0.5
+        # Already being warmed.
+        assert not tg.start_prewarm()
+        assert tg.prewarmer.status()['status'] == prewarm.RUNNING
+
+        tg.execute('plan')
+        assert time.time() - start >= 1
+        command = tg.executor.call_args[0][0]
+        assert command[:4] == [FAKE_TERRAGRUNT, 'run-all', 'plan',
+                               prewarm.NO_AUTO_INIT]
+        status = tg.prewarmer.status()
+        assert status['status'] == prewarm.SUCCEEDED
+        with open(os.path.join(directory, prewarm.PREWARM_LOG)) as f:
+            assert f.read().count('successfully initialized') == 2
+        # Warm for these sources.
+        assert not tg.start_prewarm()
+        tg.execute('graph-dependencies')
+        assert prewarm.NO_AUTO_INIT not in tg.executor.call_args[0][0]
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_prewarm_stale_or_failed():
+    directory = tempfile.mkdtemp()
+    try:
+        make_stack(directory, 1)
+        tg = stack_terragrunt(
+            directory, environment_variables={'FAKE_TG_FAIL': 'init'})
+        assert tg.start_prewarm()
+        assert tg.prewarmer.wait()['status'] == prewarm.FAILED
+        tg.execute('plan')
+        assert prewarm.NO_AUTO_INIT not in tg.executor.call_args[0][0]
+
+        tg = stack_terragrunt(directory)
+        assert tg.start_prewarm()
+        assert tg.workspace_warm()
+        with open(os.path.join(directory, 'm000', 'extra.tf'), 'w') as f:
+            f.write('# changed')
+        tg = stack_terragrunt(directory)
+        tg.execute('apply')
+        assert prewarm.NO_AUTO_INIT not in tg.executor.call_args[0][0]
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+from unittest.mock import MagicMock
+
+from .. import probe
+
+
+def test_binary_key():
+    assert probe.binary_key(None) is None
+    assert probe.binary_key('/no/such/binary') is None
+    with tempfile.NamedTemporaryFile() as f:
+        key = probe.binary_key(f.name)
+        assert key.startswith(os.path.realpath(f.name))
+        f.write(b'changed')
+        f.flush()
+        assert probe.binary_key(f.name) != key
+
+
+def test_probe_cache():
+    directory = tempfile.mkdtemp()
+    try:
+        binary = os.path.join(directory, 'terraform')
+        with open(binary, 'w') as f:
+            f.write('binary')
+        runner = MagicMock(return_value='Terraform v1.5.7')
+        cache = probe.BinaryProbeCache(
+            os.path.join(directory, probe.PROBE_CACHE_FILE))
+        assert cache.probe(binary, runner) == 'Terraform v1.5.7'
+        assert cache.probe(binary, runner) == 'Terraform v1.5.7'
+        runner.assert_called_once_with([binary, '--version'])
+        assert cache.stats == {'hits': 1, 'misses': 1}
+
+        reloaded = probe.BinaryProbeCache(cache.cache_file)
+        assert reloaded.probe(binary, runner) == 'Terraform v1.5.7'
+        assert reloaded.stats == {'hits': 1, 'misses': 0}
+        runner.assert_called_once()
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_probe_cache_missing_binary():
+    runner = MagicMock(return_value='1.0.4')
+    cache = probe.BinaryProbeCache()
+    cache.probe('/no/such/binary', runner)
+    cache.probe('/no/such/binary', runner)
+    assert runner.call_count == 2
+    assert cache.stats == {'hits': 0, 'misses': 2}
+
+
+def test_get_probe_cache():
+    assert probe.get_probe_cache() is probe.get_probe_cache()
+    assert probe.get_probe_cache('/tmp').cache_file == \
+        os.path.join('/tmp', probe.PROBE_CACHE_FILE)
@@ -0,0 +1,171 @@
+import os
+import time
+import fcntl
+import shutil
+import tempfile
+
+from mock import Mock
+
+from .. import providers
+from ..tg import Terragrunt
+
+LOCK_FILE = '''# This file is maintained automatically by "terraform init".
+
+provider "registry.terraform.io/hashicorp/aws" {
+  version     = "5.31.0"
+  constraints = "~> 5.0"
+  hashes = [
+    "h1:abc=",
+  ]
+}
+
+provider "registry.terraform.io/hashicorp/random" {
+  version = "3.6.0"
+}
+'''
+
+AWS = ('registry.terraform.io/hashicorp/aws', '5.31.0')
+RANDOM = ('registry.terraform.io/hashicorp/random', '3.6.0')
+
+
+def write(path, content=''):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def add_provider(cache, address, version, size=10):
+    write(os.path.join(cache.version_path(address, version),
+                       'linux_amd64', 'terraform-provider'), 'x' * size)
+
+
+def test_locked_providers():
+    workspace = tempfile.mkdtemp()
+    try:
+        write(os.path.join(workspace, 'vpc', '.terragrunt-cache', 'abc',
+                           '.terraform.lock.hcl'), LOCK_FILE)
+        write(os.path.join(workspace, 'vpc', '.terragrunt-cache', 'abc',
+                           '.terraform', 'modules', '.terraform.lock.hcl'),
+              'provider "example.com/ignored/ignored" {\n'
+              '  version = "1.0.0"\n}\n')
+        assert providers.locked_providers(workspace) == {AWS, RANDOM}
+    finally:
+        shutil.rmtree(workspace)
+
+
+def test_provider_cache_session_stats():
+    root = tempfile.mkdtemp()
+    workspace = tempfile.mkdtemp()
+    try:
+        cache = providers.ProviderCache(root)
+        add_provider(cache, *AWS)
+        with cache.session(workspace), cache.install(workspace):
+            # What terraform init does in the workspace.
+            add_provider(cache, *RANDOM)
+            write(os.path.join(workspace, '.terraform.lock.hcl'), LOCK_FILE)
+            os.makedirs(os.path.join(workspace, '.terraform'))
+        assert set(cache.versions()) == {AWS, RANDOM}
+        usage = cache.usage()
+        assert usage['entries'] == 2
+        assert usage['size'] == 20
+        assert usage['hits'] == 1
+        assert usage['misses'] == 1
+        assert usage['hit_rate'] == 0.5
+        # Commands that do not initialize do not count.
+        with cache.session(workspace):
+            pass
+        assert cache.stats() == {'hits': 1, 'misses': 1}
+    finally:
+        shutil.rmtree(root)
+        shutil.rmtree(workspace)
+
+
+def test_provider_cache_evict():
+    root = tempfile.mkdtemp()
+    workspace = tempfile.mkdtemp()
+    try:
+        cache = providers.ProviderCache(root, max_size=15)
+        add_provider(cache, *AWS)
+        add_provider(cache, *RANDOM)
+        old = time.time() - 100
+        os.utime(cache.version_path(*AWS), (old, old))
+        assert cache.evict() == [os.path.join(*AWS)]
+        assert set(cache.versions()) == {RANDOM}
+
+        # A workspace that links to an evicted provider is initialized
+        # again.
+        link = os.path.join(workspace, '.terraform', 'providers',
+                            AWS[0], AWS[1], 'linux_amd64')
+        os.makedirs(os.path.dirname(link))
+        os.symlink(os.path.join(cache.version_path(*AWS), 'linux_amd64'),
+                   link)
+        assert not cache.prepare(workspace)
+        assert not os.path.exists(os.path.join(workspace, '.terraform'))
+    finally:
+        shutil.rmtree(root)
+        shutil.rmtree(workspace)
+
+
+def test_provider_cache_mirror():
+    root = tempfile.mkdtemp()
+    try:
+        cache = providers.ProviderCache(root, mirror='/opt/mirror')
+        env = cache.environment()
+        assert env[providers.PLUGIN_CACHE_ENV] == root
+        with open(env[providers.CLI_CONFIG_ENV]) as f:
+            config = f.read()
+        assert 'plugin_cache_dir = "{}"'.format(root) in config
+        assert 'path = "/opt/mirror"' in config
+        assert 'direct {}' in config
+    finally:
+        shutil.rmtree(root)
+
+
+def test_terragrunt_provider_cache():
+    root = tempfile.mkdtemp()
+    workspace = tempfile.mkdtemp()
+    try:
+        executor = Mock(return_value='output')
+        tg = Terragrunt(
+            {'resource_config': {
+                'source_path': workspace,
+                'environment_variables': {'TF_LOG': 'debug'}}},
+            executor=executor,
+            binary_path='terragrunt',
+            cwd=workspace,
+            provider_cache=providers.ProviderCache(root))
+        install_lock = os.path.join(root, providers.LOCKS_DIR,
+                                    'install.lock')
+
+        def execute(command, **kwargs):
+            # The install lock is only held while init runs.
+            with open(install_lock, 'a') as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = False
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                except OSError:
+                    locked = True
+            assert locked == (command[1] == 'init')
+            return 'output'
+
+        executor.side_effect = execute
+        tg.execute('plan')
+        commands = [c[0][0] for c in executor.call_args_list]
+        assert [c[1] for c in commands] == ['init', 'plan']
+        assert '--terragrunt-no-auto-init' in commands[1]
+        env = executor.call_args[1]['additional_env']
+        assert env == {providers.PLUGIN_CACHE_ENV: root, 'TF_LOG': 'debug'}
+        # Only the first command, or a change of what init depends on,
+        # runs init.
+        tg.execute('output')
+        with open(os.path.join(workspace, providers.DEPENDENCY_LOCK_FILE),
+                  'w') as f:
+            f.write(LOCK_FILE)
+        tg.execute('plan')
+        commands = [c[0][0] for c in executor.call_args_list]
+        assert [c[1] for c in commands] == [
+            'init', 'plan', 'output', 'init', 'plan']
+    finally:
+        shutil.rmtree(root)
+        shutil.rmtree(workspace)
@@ -0,0 +1,77 @@
+import threading
+
+from cloudify.exceptions import NonRecoverableError
+
+from .. import scheduler
+
+DOT = '''digraph {
+\t"/stack/vpc" ;
+\t"/stack/db" ;
+\t"/stack/db" -> "/stack/vpc";
+\t"/stack/app" ;
+\t"/stack/app" -> "/stack/db";
+\t"/stack/app" -> "/stack/vpc";
+\t"/stack/dns" ;
+}
+'''
+
+
+def test_parse_dependency_graph():
+    assert scheduler.parse_dependency_graph(DOT) == {
+        '/stack/vpc': set(),
+        '/stack/db': {'/stack/vpc'},
+        '/stack/app': {'/stack/db', '/stack/vpc'},
+        '/stack/dns': set()
+    }
+
+
+def test_topological_order():
+    graph = scheduler.parse_dependency_graph(DOT)
+    assert scheduler.topological_order(graph) == \
+        ['/stack/dns', '/stack/vpc', '/stack/db', '/stack/app']
+    try:
+        scheduler.topological_order({'a': {'b'}, 'b': {'a'}})
+    except NonRecoverableError as e:
+        assert 'cycle' in str(e)
+    else:
+        raise RuntimeError('A cycle was not detected.')
+
+
+def test_dag_scheduler_order():
+    graph = scheduler.parse_dependency_graph(DOT)
+    lock = threading.Lock()
+    calls = []
+
+    def runner(command, module):
+        with lock:
+            calls.append(module)
+        return command
+
+    result = scheduler.DagScheduler(graph, runner, max_workers=4).run('apply')
+    assert result.ok
+    assert calls.index('/stack/vpc') < calls.index('/stack/db') < \
+        calls.index('/stack/app')
+    assert result['/stack/app'].output == 'apply'
+
+    calls[:] = []
+    result = scheduler.DagScheduler(graph, runner).run('destroy')
+    assert result.ok
+    assert calls.index('/stack/app') < calls.index('/stack/db') < \
+        calls.index('/stack/vpc')
+
+
+def test_dag_scheduler_isolates_failures():
+    graph = scheduler.parse_dependency_graph(DOT)
+
+    def runner(command, module):
+        if module == '/stack/db':
+            raise RuntimeError('db failed')
+        return command
+
+    result = scheduler.DagScheduler(graph, runner, max_workers=2).run('plan')
+    assert not result.ok
+    assert result.failed == ['/stack/db']
+    assert result.skipped == ['/stack/app']
+    assert sorted(result.succeeded) == ['/stack/dns', '/stack/vpc']
+    assert result['/stack/db'].error == 'db failed'
+    assert result.to_dict()['command'] == 'plan'
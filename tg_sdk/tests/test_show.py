@@ -0,0 +1,146 @@
+import os
+import json
+import shutil
+import logging
+import tempfile
+import tracemalloc
+
+from cloudify.exceptions import NonRecoverableError
+
+from .. import show
+from ..plan_model import PlanModel
+from ..benchmarks.bench_suite import fake_terragrunt
+from ..benchmarks.fake_terragrunt import make_stack
+
+logger = logging.getLogger('test_show')
+logger.setLevel(logging.WARNING)
+
+DOCUMENT = {
+    'format_version': '1.2',
+    'terraform_version': '1.5.7',
+    'planned_values': {'root_module': {'resources': [
+        {'address': 'a', 'values': {'text': '}]\\"{[', 'list': [1, None]}}]}},
+    'resource_drift': [{
+        'address': 'aws_s3_bucket.logs',
+        'type': 'aws_s3_bucket',
+        'name': 'logs',
+        'provider_name': 'registry.terraform.io/hashicorp/aws',
+        'change': {'actions': ['update'],
+                   'before': {'acl': 'private'},
+                   'after': {'acl': 'public-read'}}}],
+    'resource_changes': [{
+        'address': 'module.app.aws_instance.web[0]',
+        'module_address': 'module.app',
+        'type': 'aws_instance',
+        'name': 'web',
+        'index': 0,
+        'provider_name': 'registry.terraform.io/hashicorp/aws',
+        'action_reason': 'replace_because_cannot_update',
+        'change': {'actions': ['delete', 'create'],
+                   'before': {'ami': 'a', 'tags': ['x', 'y']},
+                   'after': {'ami': 'b', 'tags': ['x', 'z']},
+                   'after_unknown': {'id': True},
+                   'before_sensitive': {'tags': [False, True]},
+                   'after_sensitive': {'ami': True},
+                   'replace_paths': [['ami']]}}, {
+        'address': 'null_resource.same',
+        'type': 'null_resource',
+        'name': 'same',
+        'change': {'actions': ['no-op']}}],
+    'output_changes': {
+        'ip': {'actions': ['create'], 'after_sensitive': True},
+        'name': {'actions': ['no-op']}},
+    'prior_state': {'values': {'root_module': {}}},
+    'errored': False,
+    'timestamp': 1700000000
+}
+
+
+def test_show_decoder():
+    text = 'not json\n' + json.dumps(DOCUMENT) + '\n' + \
+        json.dumps(DOCUMENT, indent=2)
+    events = list(show.iter_show_events(text, logger))
+    assert [k for k, _ in events] == [
+        'format_version', 'terraform_version', 'resource_drift',
+        'resource_changes', 'resource_changes', 'output_changes', 'errored',
+        'end'] * 2
+    assert events[3][1] == DOCUMENT['resource_changes'][0]
+    for size in [1, 2, 5, 64]:
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        assert list(show.iter_show_events(chunks, logger)) == events
+    try:
+        list(show.iter_show_events(text[:-20], logger))
+        assert False
+    except NonRecoverableError as e:
+        assert 'middle of a document' in str(e)
+
+
+def test_show_messages():
+    messages = list(show.iter_show_messages(json.dumps(DOCUMENT), logger))
+    assert [m['type'] for m in messages] == [
+        'resource_drift', 'planned_change', 'outputs', 'change_summary']
+    change = messages[1]['change']
+    assert change['resource'] == {
+        'addr': 'module.app.aws_instance.web[0]',
+        'module': 'module.app',
+        'resource': 'aws_instance.web[0]',
+        'implied_provider': 'aws',
+        'resource_type': 'aws_instance',
+        'resource_name': 'web',
+        'resource_key': 0}
+    assert change['action'] == 'replace'
+    assert change['reason'] == 'replace_because_cannot_update'
+    assert change['before'] == {'ami': 'a',
+                                'tags': ['x', show.SENSITIVE_VALUE]}
+    assert change['after'] == {'ami': show.SENSITIVE_VALUE,
+                               'tags': ['x', 'z']}
+    assert messages[2]['outputs'] == {
+        'ip': {'sensitive': True, 'action': 'create'}}
+    assert messages[3]['changes'] == {'add': 1, 'change': 0, 'import': 0,
+                                      'remove': 1, 'operation': 'plan'}
+
+
+def test_structured_plan():
+    directory = tempfile.mkdtemp()
+    try:
+        make_stack(directory, 3)
+        for native_run_all in [False, True]:
+            tg = fake_terragrunt(directory, run_all=True,
+                                 native_run_all=native_run_all,
+                                 resources=4)
+            tg.resource_config['structured_plan'] = True
+            plan = tg.plan()
+            assert len(plan['planned_changes']) == 12
+            assert len(plan['resource_drifts']) == 3
+            assert plan['change_summary']['add'] == 12
+            assert len(plan['outputs']) == 9
+            change = plan['planned_changes'][0]
+            assert change['after'] == {'value': '',
+                                       'secret': show.SENSITIVE_VALUE}
+            assert 'show' in [r['name'] for r in tg.telemetry.records]
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_structured_plan_memory():
+    directory = tempfile.mkdtemp()
+    try:
+        make_stack(directory, 1)
+        module = os.path.join(directory, 'm000')
+        tg = fake_terragrunt(module, resources=500, payload=2000,
+                             drift_every=0)
+        tg.resource_config.update(structured_plan=True, plan_model=True)
+        tracemalloc.start()
+        try:
+            plan = tg.plan()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert isinstance(plan, PlanModel)
+        assert plan.count(kind='planned_change') == 500
+        # Less than the text of the document, which has four copies of
+        # every after value, where the plan keeps one.
+        size = os.path.getsize(os.path.join(module, 'cloudify.tfplan'))
+        assert peak < size * 0.6
+    finally:
+        shutil.rmtree(directory)
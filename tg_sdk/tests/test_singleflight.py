@@ -0,0 +1,131 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+
+from mock import Mock, patch
+
+from .. import singleflight
+from ..benchmarks.bench_suite import fake_terragrunt
+from ..benchmarks.fake_terragrunt import make_stack
+
+
+def _run_together(funcs):
+    results = [None] * len(funcs)
+
+    def run(index):
+        try:
+            results[index] = funcs[index]()
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=run, args=(i,))
+               for i in range(len(funcs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_singleflight():
+    directory = tempfile.mkdtemp()
+    try:
+        flight = singleflight.SingleFlight(directory)
+        calls = []
+
+        def plan():
+            calls.append(1)
+            time.sleep(0.5)
+            return 'plan {}'.format(len(calls))
+
+        assert _run_together(
+            [lambda: flight.run('key', plan)] * 4) == ['plan 1'] * 4
+        assert flight.shared == 3
+        # Not in flight any more, so it runs again.
+        assert flight.run('key', plan) == 'plan 2'
+        assert flight.run('other', plan) == 'plan 3'
+
+        failing = Mock(side_effect=RuntimeError('failed'))
+        try:
+            flight.run('failing', failing)
+        except RuntimeError:
+            pass
+        assert flight.run('failing', lambda: 'ok') == 'ok'
+        result = os.path.join(directory, 'key' + singleflight.RESULT_SUFFIX)
+        assert oct(os.stat(result).st_mode & 0o777) == oct(0o600)
+    finally:
+        shutil.rmtree(directory)
+
+
+REMOTE_STATE = """
+remote_state {
+  backend = "s3"
+  config = {
+    bucket = "${get_env("STATE_BUCKET", "states")}"
+    key    = "${path_relative_to_include()}/terraform.tfstate"
+  }
+}
+"""
+
+
+def _instances(directory, flight, names, backend=''):
+    instances = []
+    for name in names:
+        module = make_stack(os.path.join(directory, name), 1)[0]
+        with open(os.path.join(module, 'terragrunt.hcl'), 'w') as f:
+            f.write(backend)
+        tg = fake_terragrunt(module, latency=0.3)
+        tg.singleflight = flight
+        instances.append(tg)
+    return instances
+
+
+def test_singleflight_terragrunt():
+    directory = tempfile.mkdtemp()
+    try:
+        flight = singleflight.SingleFlight(os.path.join(directory, 'flight'))
+        instances = _instances(directory, flight, ['a', 'b', 'c'],
+                               REMOTE_STATE)
+        keys = {tg.request_key('output') for tg in instances}
+        assert len(keys) == 1
+        outputs = _run_together([tg.output for tg in instances])
+        assert outputs[0]['m000_output_0']['value'] == 'm000-0'
+        assert outputs[0] == outputs[1] == outputs[2]
+        assert sum(r['name'] == 'output' for tg in instances
+                   for r in tg.telemetry.records) == 1
+        assert flight.shared == 2
+
+        with open(os.path.join(directory, 'a', 'm000', 'main0.tf'), 'a') as f:
+            f.write('changed')
+        assert instances[0].request_key('output') not in keys
+        assert instances[1].request_key('output') in keys
+        assert instances[1].request_key('plan') not in keys
+        other = fake_terragrunt(os.path.join(directory, 'b', 'm000'),
+                                latency=0.3, outputs=1)
+        assert other.request_key('output') not in keys
+        # Another bucket is another state.
+        with patch.dict(os.environ, {'STATE_BUCKET': 'other'}):
+            assert instances[2].request_key('output') not in keys
+        assert instances[2].request_key('output') in keys
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_singleflight_terragrunt_local_state():
+    directory = tempfile.mkdtemp()
+    try:
+        flight = singleflight.SingleFlight(os.path.join(directory, 'flight'))
+        for names, backend in [
+                (['a', 'b', 'c'], ''),
+                (['d', 'e'], REMOTE_STATE.replace('"s3"', '"local"'))]:
+            instances = _instances(directory, flight, names, backend)
+            keys = {tg.request_key('output') for tg in instances}
+            assert len(keys) == len(names)
+            _run_together([tg.output for tg in instances])
+            assert sum(r['name'] == 'output' for tg in instances
+                       for r in tg.telemetry.records) == len(names)
+        assert flight.shared == 0
+    finally:
+        shutil.rmtree(directory)
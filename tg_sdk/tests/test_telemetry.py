@@ -0,0 +1,94 @@
+import os
+import json
+import shutil
+import tempfile
+
+from mock import Mock
+from cloudify_common_sdk.utils import CommonSDKSecret
+
+from .. import telemetry
+from ..tg import Terragrunt
+from ..utils import basic_executor
+
+
+def test_mask_command():
+    command = ['terragrunt', 'plan', '-var=password=hunter2',
+               '-backend-config', 'token=abc', '-var-file=/tmp/x.json',
+               '--header', 'Bearer s3cr3t']
+    assert telemetry.mask_command(command, ['s3cr3t', '']) == [
+        'terragrunt', 'plan', '-var=password=****',
+        '-backend-config', 'token=****', '-var-file=/tmp/x.json',
+        '--header', 'Bearer ****']
+
+
+def test_telemetry_streaming_executor():
+    directory = tempfile.mkdtemp()
+    try:
+        log_path = os.path.join(directory, telemetry.TELEMETRY_FILE)
+        tg = Terragrunt(
+            {'resource_config': {
+                'source_path': directory,
+                'environment_variables': {'TOKEN': 's3cr3t'}}},
+            executor=basic_executor,
+            binary_path='sh',
+            masked_env_vars=['TOKEN'],
+            telemetry=telemetry.Telemetry(log_path))
+        tg._execute(['sh', '-c', 'echo one; echo two >&2; echo s3cr3t'],
+                    name='plan')
+        try:
+            tg._execute(['sh', '-c', 'exit 3'], name='apply')
+        except Exception:
+            pass
+        plan, apply = tg.telemetry.records
+        assert plan['name'] == 'plan'
+        assert plan['command'][-1] == 'echo one; echo two >&2; echo ****'
+        assert plan['returncode'] == 0
+        assert plan['stdout_bytes'] == len('one\ns3cr3t\n')
+        assert plan['stderr_bytes'] == len('two\n')
+        assert plan['max_rss'] > 0
+        assert plan['cpu_user_time'] is not None
+        assert plan['end_time'] >= plan['start_time']
+        assert apply['returncode'] == 3
+        with open(log_path) as f:
+            assert [json.loads(line) for line in f] == [plan, apply]
+        summary = tg.telemetry.summary()
+        assert summary['count'] == 2
+        assert summary['failed'] == 1
+        assert summary['commands']['plan']['count'] == 1
+        assert summary['max_rss'] == plan['max_rss']
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_telemetry_other_executor():
+    executor = Mock(return_value='output')
+    tg = Terragrunt(
+        {'resource_config': {}},
+        executor=executor,
+        binary_path='terragrunt',
+        variables={'password': Mock(spec=CommonSDKSecret,
+                                    secret='hunter2')})
+    tg._execute(['terragrunt', 'output', '-var=x=hunter2'], name='output')
+    executor.side_effect = RuntimeError('failed')
+    try:
+        tg._execute(['terragrunt', 'apply'], name='apply')
+    except RuntimeError:
+        pass
+    output, apply = tg.telemetry.records
+    assert output['command'][-1] == '-var=x=****'
+    assert output['stdout_bytes'] == len('output')
+    assert output['returncode'] == 0
+    assert output['cpu_user_time'] is not None
+    assert output['max_rss'] is None
+    assert apply['returncode'] is None
+    assert 'on_complete' not in executor.call_args[1]
+
+
+def test_telemetry_concurrent_measurements():
+    measurements = telemetry.Telemetry()
+    first = measurements.start(['a'])
+    second = measurements.start(['b'])
+    measurements.finish(first, name='a')
+    record = measurements.finish(second, name='b')
+    assert not first.exclusive
+    assert record['cpu_user_time'] is None
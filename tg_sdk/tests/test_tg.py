@@ -89,6 +89,9 @@ def test_terraform_binary_path():
 
     assert tg.terraform_binary_path == \
            tg.resource_config.get('terraform_binary_path')
+    assert tg.terraform_binary_path == \
+           tg.resource_config.get('terraform_binary_path')
+    mocked_executor.assert_called_once()
 
 
 def test_run_all():
@@ -291,6 +294,8 @@ def test_plan(*_):
                  '"change": {"change_foo": "change_bar"}}'
     expected = {
         'resource_drifts': [{'change_foo': 'change_bar'}],
+        'planned_changes': [],
+        'diagnostics': [],
         'outputs': {'output_foo': 'output_bar'},
         'change_summary': {'change_foo': 'change_bar'}
     }
@@ -315,6 +320,8 @@ def test_terraform_plan(*_):
                     '"change": {"change_foo": "change_bar"}}'
     expected = {
         'resource_drifts': [{'change_foo': 'change_bar'}],
+        'planned_changes': [],
+        'diagnostics': [],
         'outputs': {'output_foo': 'output_bar'},
         'change_summary': {'change_foo': 'change_bar'}
     }
@@ -357,3 +364,132 @@ def test_terraform_output(*_):
     result = tg.output()
 
     assert tg.terraform_output == result
+
+
+@patch('tg_sdk.tg.utils.get_version_string', return_value='1.0.1')
+def test_native_run_all(*_):
+    dot = 'digraph {\n' \
+          '\t"/stack/a" ;\n' \
+          '\t"/stack/b" ;\n' \
+          '\t"/stack/b" -> "/stack/a";\n' \
+          '}\n'
+
+    def executor(command, **_):
+        if 'graph-dependencies' in command:
+            return dot
+        return '{"type": "resource_drift", "change": {"module": "%s"}}' \
+            % command[-1]
+
+    native_properties = {
+        'resource_config': dict(properties['resource_config'],
+                                run_all=True,
+                                native_run_all=True,
+                                max_workers=2)
+    }
+    tg = Terragrunt(properties=native_properties,
+                    source=source,
+                    executor=MagicMock(side_effect=executor))
+    assert tg.native_run_all
+    plan = tg.plan()
+    assert plan['resource_drifts'] == [{'module': '/stack/a'},
+                                       {'module': '/stack/b'}]
+    assert tg.stack_result.succeeded == ['/stack/a', '/stack/b']
+    for call in tg.executor.call_args_list:
+        assert 'run-all' not in call[0][0]
+
+
+@patch('tg_sdk.tg.utils.get_version_string', return_value='1.0.1')
+def test_incremental(*_):
+    cwd = tempfile.mkdtemp()
+    dot = 'digraph {\n' \
+          '\t"/stack/a" ;\n' \
+          '\t"/stack/b" ;\n' \
+          '\t"/stack/b" -> "/stack/a";\n' \
+          '\t"/stack/c" ;\n' \
+          '}\n'
+    mocked_executor = MagicMock(return_value=dot)
+    incremental_properties = {
+        'resource_config': dict(properties['resource_config'],
+                                run_all=True,
+                                incremental=True)
+    }
+    try:
+        tg = Terragrunt(properties=incremental_properties,
+                        source=source,
+                        executor=mocked_executor,
+                        cwd=cwd)
+        assert tg.incremental
+        tg.apply()
+        command = mocked_executor.call_args[0][0]
+        assert command[1:3] == ['run-all', 'apply']
+        assert command[-1] == '--terragrunt-strict-include'
+        assert command.count('--terragrunt-include-dir') == 3
+
+        mocked_executor.reset_mock()
+        tg.apply()
+        mocked_executor.assert_called_once()
+        assert 'graph-dependencies' in mocked_executor.call_args[0][0]
+
+        tg.fingerprint_index.save({'/stack/a': 'old'})
+        tg.plan()
+        command = mocked_executor.call_args[0][0]
+        assert command[1:3] == ['run-all', 'plan']
+        assert command[command.index('/stack/a') - 1] == \
+            '--terragrunt-include-dir'
+        assert '/stack/b' in command
+    finally:
+        shutil.rmtree(cwd)
+
+
+@patch('tg_sdk.tg.utils.get_version_string', return_value='1.0.1')
+def test_reuse_plan(*_):
+    cwd = tempfile.mkdtemp()
+    mocked_executor = MagicMock(return_value='')
+    reuse_properties = {
+        'resource_config': dict(properties['resource_config'],
+                                reuse_plan=True)
+    }
+    try:
+        tg = Terragrunt(properties=reuse_properties,
+                        source=source,
+                        executor=mocked_executor,
+                        cwd=cwd)
+        tg.tfvars_file = 'vars.json'
+        tg.plan()
+        command = mocked_executor.call_args[0][0]
+        assert '-out=cloudify.tfplan' in command
+        assert '-var-file=vars.json' in command
+
+        tg.apply()
+        command = mocked_executor.call_args[0][0]
+        assert command[1] == 'apply'
+        assert command[-1] == 'cloudify.tfplan'
+        assert '-var-file=vars.json' not in command
+
+        tg.apply()
+        command = mocked_executor.call_args[0][0]
+        assert 'cloudify.tfplan' not in command
+        assert '-var-file=vars.json' in command
+
+        tg.plan()
+        tg.variables = {'changed': True}
+        tg.apply()
+        assert 'cloudify.tfplan' not in mocked_executor.call_args[0][0]
+    finally:
+        shutil.rmtree(cwd)
+
+
+@patch('tg_sdk.tg.utils.get_version_string', return_value='1.0.1')
+def test_plan_stream(*_):
+    calls = []
+
+    def executor(command, **kwargs):
+        calls.append(kwargs)
+        return iter(['{"type": "change_summary", "changes": {"add": 1}}'])
+
+    executor.supports_streaming = True
+    tg = Terragrunt(properties=properties,
+                    source=source,
+                    executor=executor)
+    assert tg.plan()['change_summary'] == {'add': 1}
+    assert calls[-1]['stream'] is True
@@ -1,5 +1,7 @@
 import logging
 
+from cloudify.exceptions import NonRecoverableError
+
 from .. import utils
 
 
@@ -19,6 +21,43 @@ def test_basic_executor():
         raise RuntimeError('Executing "foo bar" succeeded.')
 
 
+def test_basic_executor_env():
+    output = utils.basic_executor(['sh', '-c', 'echo $TG_TEST_VALUE'],
+                                  additional_env={'TG_TEST_VALUE': 'foo'})
+    assert output == 'foo'
+
+
+def test_basic_executor_stream():
+    stderr = []
+    completed = []
+    process = utils.basic_executor(
+        ['sh', '-c', 'echo one; echo two >&2; echo three'],
+        stream=True,
+        on_stderr=stderr.append,
+        on_complete=completed.append)
+    assert list(process) == ['one', 'three']
+    assert stderr == ['two']
+    assert completed == [process.result]
+    assert process.result.returncode == 0
+    assert process.result.stdout_bytes == len('one\nthree\n')
+    assert process.result.stderr_bytes == len('two\n')
+    assert process.result.wall_time >= 0
+
+
+def test_basic_executor_failure():
+    try:
+        utils.basic_executor(
+            ['sh', '-c', 'for i in $(seq 1 500); do echo line$i; done; '
+                         'echo failed >&2; exit 3'])
+    except NonRecoverableError as e:
+        assert 'exit code 3' in str(e)
+        assert 'failed' in str(e)
+        assert 'line500' in str(e)
+        assert 'line1\n' not in str(e)
+    else:
+        raise RuntimeError('A failed command did not raise.')
+
+
 def test_get_version_string():
     assert utils.get_version_string('v2.1.3') == '2.1.3'
     assert utils.get_version_string('v2.1') == '2.1'
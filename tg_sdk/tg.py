@@ -1,9 +1,49 @@
 import os
-import re
 import json
+import math
+import time
 import tempfile
+import threading
+from functools import partial
+from contextlib import ExitStack
 
 from . import utils
+from .plan import (
+    iter_lines,
+    iter_json_messages,
+    new_plan,
+    fold_message,
+    parse_plan
+)
+from .plan_model import PlanModel, parse_plan_model
+from .show import iter_show_messages
+from .plan_delta import (
+    PLAN_INDEX_FILE,
+    plan_index,
+    plan_delta,
+    format_delta
+)
+from .drift import summarize_drift
+from .artifacts import ARTIFACTS_DIR, ArtifactStore
+from .telemetry import Telemetry
+from .prewarm import NO_AUTO_INIT, Prewarm, is_warm
+from .probe import binary_key, get_probe_cache
+from .cache import file_lock
+from .fingerprint import (
+    SAVED_PLAN_FILE,
+    FINGERPRINTS_FILE,
+    INIT_FINGERPRINTS_FILE,
+    FingerprintIndex,
+    hash_file,
+    hash_values,
+    find_modules,
+    changed_modules,
+    state_identity,
+    init_fingerprint,
+    module_fingerprints,
+    directory_fingerprint
+)
+from .scheduler import DagScheduler, parse_dependency_graph
 from cloudify.exceptions import NonRecoverableError
 from cloudify_common_sdk.utils import v1_gteq_v2
 
@@ -31,10 +71,27 @@ class Terragrunt(object):
         self.executor = executor or utils.basic_executor
         self.cwd = kwargs.get('cwd')
         self._terraform_plan = None
+        self._terraform_plan_delta = None
         self._terraform_output = []
         self._run_all = None
         self.tfvars_file = None
         self.masked_env_vars = masked_env_vars
+        self._probe_cache = kwargs.get('probe_cache')
+        self._checked_terraform_binary_path = None
+        self.stack_result = None
+        self._processes = []
+        # Preflight stages start commands from several threads.
+        self._processes_lock = threading.Lock()
+        self.provider_cache = kwargs.get('provider_cache')
+        self.admission_controller = kwargs.get('admission_controller')
+        self.command_timeout = kwargs.get('command_timeout')
+        # The time after which no command may run any more, so that a
+        # timeout applies to every command of an operation together.
+        self.deadline = kwargs.get('deadline')
+        self.telemetry = kwargs.get('telemetry') or Telemetry()
+        self._warm = False
+        self.singleflight = kwargs.get('singleflight')
+        self.stack_modules = None
 
     @property
     def properties(self):
@@ -107,15 +164,32 @@ class Terragrunt(object):
     def binary_path(self, value):
         self._binary_path = value
 
+    @property
+    def probe_cache(self):
+        """Cache of binary version probes, persisted in the working
+        directory when there is one.
+
+        :return: BinaryProbeCache
+        """
+        if not self._probe_cache:
+            self._probe_cache = get_probe_cache(self.cwd, self._logger)
+        return self._probe_cache
+
     @property
     def terraform_binary_path(self):
         if not self._terraform_binary_path:
             self._terraform_binary_path = \
                 self.resource_config.get('terraform_binary_path')
+        if self._checked_terraform_binary_path == \
+                self._terraform_binary_path:
+            return self._terraform_binary_path
 
-        version_output = \
-            self._execute([self._terraform_binary_path, '--version'])
+        version_output = self.probe_cache.probe(
+            self._terraform_binary_path, self._execute)
+        self._check_terraform_version(version_output)
+        return self._terraform_binary_path
 
+    def _check_terraform_version(self, version_output):
         version = utils.get_version_string(version_output)
         if v1_gteq_v2('1.0.0', version):
             raise NonRecoverableError(
@@ -123,7 +197,7 @@ class Terragrunt(object):
              ' use be above version 1.0.0.')
         self.logger.info('terraform_path: {p}, version: {v}'
                          .format(p=self._terraform_binary_path, v=version))
-        return self._terraform_binary_path
+        self._checked_terraform_binary_path = self._terraform_binary_path
 
     @terraform_binary_path.setter
     def terraform_binary_path(self, value):
@@ -142,6 +216,23 @@ class Terragrunt(object):
     def run_all(self, value):
         self._run_all = value
 
+    @property
+    def native_run_all(self):
+        """ True or False, whether run_all commands are scheduled module by
+        module by the SDK instead of by terragrunt run-all.
+        :return: bool
+        """
+        return bool(self.run_all and
+                    self.resource_config.get('native_run_all', False))
+
+    @property
+    def max_workers(self):
+        """ The number of modules to run at once with native_run_all.
+        None means one per CPU.
+        :return: int
+        """
+        return self.resource_config.get('max_workers') or None
+
     @property
     def environment_variables(self):
         """ A dictionary of key values to export to env.
@@ -150,6 +241,30 @@ class Terragrunt(object):
         """
         return self.resource_config.get('environment_variables', {})
 
+    @property
+    def insecure_environment_variables(self):
+        """The environment variables with the values of their secrets, for
+        fingerprints, which must change when a secret is rotated.
+
+        :return: dict
+        """
+        return utils.convert_secrets(self.environment_variables or {})
+
+    @property
+    def secrets(self):
+        """The values that must never be logged: secret variables and
+        environment variables, and the environment variables named in
+        masked_env_vars.
+        :return: list
+        """
+        env = self.environment_variables or {}
+        secrets = [v.secret for v in
+                   list((self.variables or {}).values()) + list(env.values())
+                   if isinstance(v, utils.CommonSDKSecret)]
+        secrets.extend(str(env[n]) for n in self.masked_env_vars or []
+                       if n in env)
+        return secrets
+
     @property
     def insecure_variables(self):
         return utils.convert_secrets(self._variables)
@@ -177,7 +292,7 @@ class Terragrunt(object):
     @property
     def version(self):
         return utils.get_version_string(
-            self._execute([self.binary_path, '--version']))
+            self.probe_cache.probe(self.binary_path, self._execute))
 
     def render_inputs(self):
         with tempfile.NamedTemporaryFile(suffix=".json",
@@ -188,66 +303,766 @@ class Terragrunt(object):
             f.close()
             self.tfvars_file = f.name
 
-    def _execute(self, command, return_output=True):
+    @property
+    def supports_streaming(self):
+        return getattr(self.executor, 'supports_streaming', False) is True
+
+    @property
+    def additional_env(self):
+        """The environment variables that commands get on top of the
+        environment of this process.
+        :return: dict
+        """
+        env = {}
+        if self.provider_cache:
+            env.update(self.provider_cache.environment())
+        env.update(self.environment_variables or {})
+        return env
+
+    def _execute(self, command, return_output=True, stream=False,
+                 session=None, name=None, on_result=None, chunk_size=None):
+        """
+        :param session: ExitStack, closed once the command completed.
+        :param name: str, the Terragrunt command, for telemetry.
+        :param on_result: callable, called with whether the command
+            succeeded once it completed.
+        :param chunk_size: int, stream the output in chunks of this many
+            bytes instead of lines.
+        """
         args = [command]
         kwargs = {'logger': self.logger}
         if self.cwd:
             kwargs['cwd'] = self.cwd
-        if self.environment_variables:
-            kwargs['additional_env'] = self.environment_variables
+        env = self.additional_env
+        if env:
+            kwargs['additional_env'] = env
         if self.masked_env_vars:
             kwargs['masked_env_vars'] = self.masked_env_vars
         kwargs['return_output'] = return_output
-        return self.executor(*args, **kwargs)
+        if stream and self.supports_streaming:
+            kwargs['stream'] = True
+            if chunk_size:
+                kwargs['chunk_size'] = chunk_size
+        session = session or ExitStack()
+        measurement = self.telemetry.start(command)
+        completed = []
+
+        def on_complete(execution_result):
+            # Streamed commands are still running when the executor
+            # returns.
+            completed.append(execution_result)
+            self.telemetry.finish(measurement, name=name,
+                                  secrets=self.secrets,
+                                  result=execution_result)
+            session.close()
+            if on_result:
+                on_result(execution_result.returncode == 0)
 
-    def execute(self, name, return_output=True):
+        if self.supports_streaming:
+            kwargs['on_complete'] = on_complete
+        try:
+            result = self.executor(*args, **kwargs)
+        except Exception as e:
+            if not completed:
+                self.telemetry.finish(measurement,
+                                      returncode=getattr(e, 'exit_code',
+                                                         None),
+                                      name=name,
+                                      secrets=self.secrets)
+            session.close()
+            if on_result and not completed:
+                on_result(False)
+            raise
+        if kwargs.get('stream'):
+            with self._processes_lock:
+                self._processes = [p for p in self._processes if p.running]
+                self._processes.append(result)
+        else:
+            if not completed:
+                self.telemetry.finish(measurement, result, name=name,
+                                      secrets=self.secrets)
+            session.close()
+            if on_result and not completed:
+                on_result(True)
+        return result
+
+    def cancel(self):
+        """Terminate the streamed commands that are still running, from
+        another thread. Commands run by executors that do not stream can
+        not be stopped and run to the end."""
+        with self._processes_lock:
+            processes = list(self._processes)
+        for process in processes:
+            process.terminate()
+
+    def build_command(self, name, working_dir=None, extra_args=None,
+                      saved_plan=None):
+        """The full command line for a Terragrunt command.
+
+        :param name: str, the command, for example plan.
+        :param working_dir: str, run in this module only, not run-all.
+        :param extra_args: list, appended after the command options.
+        :param saved_plan: str, a plan file for apply to execute.
+        :return: list
+        """
         command = [self.binary_path, name]
-        if self.run_all:
+        if self.run_all and not working_dir:
             command.insert(1, 'run-all')
-        if name in utils.COMMAND_WITH_INPUTS and self.tfvars_file:
+        if name in utils.COMMAND_WITH_INPUTS and self.tfvars_file and \
+                not saved_plan:
             command.extend(['-var-file={}'.format(self.tfvars_file)])
         command.extend(self.command_options.get('all', []))
         command.extend(self.command_options.get(name, []))
         if 'terragrunt-tfpath' not in command and self.terraform_binary_path:
             command.extend(['--terragrunt-tfpath', self.terraform_binary_path])
-        return self._execute(command, return_output)
+        if working_dir:
+            command.extend(['--terragrunt-working-dir', working_dir])
+        command.extend(extra_args or [])
+        if saved_plan:
+            command.append(saved_plan)
+        return command
+
+    def execute(self, name, return_output=True, working_dir=None,
+                extra_args=None, saved_plan=None, stream=False,
+                chunk_size=None):
+        if self.singleflight and name in utils.SINGLEFLIGHT_COMMANDS and \
+                not saved_plan and \
+                not any(a.startswith('-out') for a in extra_args or []):
+            # Identical callers get the leader's output, so it is not
+            # streamed.
+            return self.singleflight.run(
+                self.request_key(name, working_dir, extra_args),
+                lambda: self._execute_command(
+                    name, return_output, working_dir, extra_args))
+        return self._execute_command(
+            name, return_output, working_dir, extra_args, saved_plan, stream,
+            chunk_size)
+
+    def request_key(self, name, working_dir=None, extra_args=None):
+        """Identify what a read-only command computes, the same in every
+        node instance that runs it: the command without the paths of the
+        workspace, the sources, the rendered variables, the environment,
+        the versions of the binaries and the state that the command reads,
+        see state_identity. Node instances with local state never share.
+
+        :return: str
+        """
+        source_dir = os.path.abspath(self.source_path or self.cwd or
+                                     os.getcwd())
+        if working_dir:
+            modules = [os.path.abspath(working_dir)]
+        elif self.run_all:
+            modules = find_modules(source_dir)
+        else:
+            modules = [source_dir]
+        environment = dict(os.environ, **self.insecure_environment_variables)
+        workspace = os.path.abspath(self.cwd or os.getcwd())
+        binaries = [self.binary_path, self.terraform_binary_path]
+        command = []
+        for arg in self.build_command(name, working_dir, extra_args):
+            if arg in binaries:
+                continue
+            if arg.startswith('-var-file='):
+                path = arg[len('-var-file='):]
+                if os.path.isfile(path):
+                    arg = '-var-file=' + hash_file(path)
+            command.append(arg.replace(source_dir, '<source>')
+                           .replace(workspace, '<workspace>'))
+        return hash_values(
+            command,
+            directory_fingerprint(source_dir),
+            self.insecure_environment_variables,
+            [self.probe_cache.probe(b, self._execute)
+             for b in binaries if b],
+            [state_identity(m, source_dir, environment)
+             for m in modules if os.path.isdir(m)])
+
+    def _execute_command(self, name, return_output=True, working_dir=None,
+                         extra_args=None, saved_plan=None, stream=False,
+                         chunk_size=None):
+        command = self.build_command(
+            name, working_dir, extra_args, saved_plan)
+        if self.prewarm and name != 'init' and \
+                name not in utils.PROVIDERLESS_COMMANDS and \
+                NO_AUTO_INIT not in command and self.workspace_warm():
+            command.insert(command.index(name) + 1, NO_AUTO_INIT)
+        on_result = None
+        if self.reuse_init and name != 'init' and \
+                name not in utils.PROVIDERLESS_COMMANDS:
+            modules = self.init_modules(command, working_dir)
+            if self.initialize_changed(modules) and \
+                    NO_AUTO_INIT not in command:
+                command.insert(command.index(name) + 1, NO_AUTO_INIT)
+            on_result = partial(self.record_init, modules)
+        if self.provider_cache and name != 'init' and \
+                name not in utils.PROVIDERLESS_COMMANDS and \
+                NO_AUTO_INIT not in command:
+            # Auto-init would install providers in the middle of the
+            # command, without the install lock, for instance in the modules
+            # that were added to a stack. init runs first instead, where it
+            # is needed, and the lock is released before the command.
+            self.initialize_stale(command, working_dir)
+            command.insert(command.index(name) + 1, NO_AUTO_INIT)
+        timeout = self.command_timeout
+        if self.deadline:
+            remaining = int(math.ceil(self.deadline - time.time()))
+            if remaining <= 0:
+                raise NonRecoverableError(
+                    'Command {c} was not started, the operation timed '
+                    'out.'.format(c=name))
+            timeout = min(timeout or remaining, remaining)
+        if timeout:
+            # timeout signals its whole process group, so the Terraform
+            # processes started by Terragrunt stop as well.
+            command = ['timeout',
+                       '--kill-after={}'.format(utils.TERMINATE_TIMEOUT),
+                       str(timeout)] + command
+        session = ExitStack()
+        try:
+            if self.admission_controller:
+                grant = session.enter_context(
+                    self.admission_controller.admit(name))
+                if 'run-all' in command and \
+                        '--terragrunt-parallelism' not in command:
+                    # Before the saved plan, which must come last.
+                    end = len(command) - 1 if saved_plan else len(command)
+                    command[end:end] = \
+                        ['--terragrunt-parallelism', str(grant.slots)]
+            if self.provider_cache and \
+                    name not in utils.PROVIDERLESS_COMMANDS:
+                workspace = working_dir or self.source_path or self.cwd
+                session.enter_context(self.provider_cache.session(workspace))
+                if name == 'init':
+                    session.enter_context(
+                        self.provider_cache.install(workspace))
+        except Exception:
+            session.close()
+            raise
+        return self._execute(command, return_output, stream, session, name,
+                             on_result, chunk_size)
+
+    def dependency_graph(self):
+        """The stack's modules and the modules each of them depends on.
+
+        :return: dict
+        """
+        return parse_dependency_graph(self.execute(
+            'graph-dependencies',
+            working_dir=self.source_path or self.cwd or os.getcwd()))
+
+    def run_modules(self, name, return_output=False, graph=None,
+                    modules=None, **kwargs):
+        """Run a command in every module of the stack in dependency order,
+        using a pool of max_workers.
+
+        :param name: str, the command, for example plan.
+        :param return_output: bool
+        :param graph: dict, the dependency graph if it is already known.
+        :param modules: set, run only in these modules.
+        :param kwargs: more arguments for execute.
+        :return: StackResult
+        """
+        graph = graph or self.dependency_graph()
+        if modules is not None:
+            graph = {m: graph[m] & modules for m in graph if m in modules}
+        scheduler = DagScheduler(
+            graph,
+            lambda command, module: self.execute(
+                command, return_output, working_dir=module, **kwargs),
+            self.max_workers,
+            self.logger)
+        self.stack_result = scheduler.run(name)
+        return self.stack_result
+
+    def _run_modules_or_raise(self, name, return_output=False, graph=None,
+                              modules=None, **kwargs):
+        stack_result = self.run_modules(
+            name, return_output, graph, modules, **kwargs)
+        if not stack_result.ok:
+            raise NonRecoverableError(
+                '{c} did not succeed in every module: {r}'.format(
+                    c=name,
+                    r=[r.to_dict() for r in stack_result
+                       if r.status != 'succeeded']))
+        return stack_result
+
+    @property
+    def incremental(self):
+        """ True or False, whether run_all plan and apply only run in the
+        modules that changed since the last apply, and their dependents.
+        :return: bool
+        """
+        return bool(self.run_all and
+                    self.resource_config.get('incremental', False))
+
+    @property
+    def prewarm(self):
+        """ True or False, whether the workspace is initialized in the
+        background as soon as its source is in place, see start_prewarm.
+        :return: bool
+        """
+        return bool(self.resource_config.get('prewarm', False))
+
+    @property
+    def prewarmer(self):
+        return Prewarm(self.cwd or os.getcwd(), self.logger)
+
+    def source_fingerprint(self):
+        return directory_fingerprint(self.source_path or self.cwd or
+                                     os.getcwd())
+
+    def start_prewarm(self):
+        """Start init, in every module with run_all, in a background
+        process that outlives this one, unless the workspace is already
+        warm for the current sources or being warmed.
+
+        :return: bool, whether it started.
+        """
+        fingerprint = self.source_fingerprint()
+        if is_warm(self.prewarmer.status(), fingerprint):
+            return False
+        return self.prewarmer.start(
+            self.build_command('init'),
+            self.cwd or os.getcwd(),
+            utils.convert_secrets(self.additional_env),
+            fingerprint,
+            self.provider_cache)
+
+    def workspace_warm(self):
+        """Wait for a background init to end, and tell whether it
+        initialized the current sources, so that commands can skip
+        auto-init.
+
+        :return: bool
+        """
+        if not self._warm:
+            status = self.prewarmer.wait()
+            self._warm = bool(status) and \
+                is_warm(status, self.source_fingerprint())
+        return self._warm
+
+    @property
+    def reuse_init(self):
+        """ True or False, whether commands skip auto-init in the modules
+        whose init fingerprint did not change since they last succeeded,
+        and init runs only in the modules whose fingerprint changed.
+        :return: bool
+        """
+        return bool(self.resource_config.get('reuse_init', False))
+
+    @property
+    def init_fingerprint_index(self):
+        return FingerprintIndex(
+            os.path.join(self.cwd, INIT_FINGERPRINTS_FILE)
+            if self.cwd else None,
+            self.logger)
+
+    def init_modules(self, command, working_dir=None):
+        """The modules that a command initializes.
+
+        :param command: list, the command line.
+        :param working_dir: str, the module the command runs in.
+        :return: list of absolute paths.
+        """
+        directory = working_dir or self.source_path or self.cwd or \
+            os.getcwd()
+        if 'run-all' in command:
+            return find_modules(directory)
+        return [os.path.abspath(directory)]
+
+    def init_fingerprint(self, module):
+        """Fingerprint what init depends on in module, see
+        fingerprint.init_fingerprint.
+
+        :param module: str
+        :return: str
+        """
+        return init_fingerprint(
+            module,
+            self.source_path or self.cwd or os.getcwd(),
+            binary_key(self.binary_path),
+            binary_key(self.terraform_binary_path))
+
+    def initialize_changed(self, modules):
+        """Run init in those of modules whose init fingerprint changed
+        since a command last succeeded in them.
+
+        :param modules: list
+        :return: bool, whether every module is initialized, so the command
+            can skip auto-init. False when no module was recorded yet, to
+            leave init to auto-init the first time.
+        """
+        recorded = self.init_fingerprint_index.load()
+        if not any(m in recorded for m in modules):
+            return False
+        changed = [m for m in modules
+                   if recorded.get(m) != self.init_fingerprint(m)]
+        for module in changed:
+            self.logger.info('Running init in {m}, whose lock file, sources, '
+                             'backend or binaries changed.'.format(m=module))
+            self.execute('init', working_dir=module)
+        if changed:
+            self.record_init(changed, True)
+        return True
+
+    def initialize_stale(self, command, working_dir=None):
+        """Run init, before a command that must not auto-init, in the
+        modules that were not initialized with their current init
+        fingerprint yet, or that link to providers that were evicted from
+        the provider cache.
+
+        :param command: list, the command line.
+        :param working_dir: str, the module the command runs in.
+        """
+        self.provider_cache.prepare(
+            working_dir or self.source_path or self.cwd or os.getcwd())
+        modules = self.init_modules(command, working_dir)
+        recorded = self.init_fingerprint_index.load()
+        stale = [m for m in modules
+                 if recorded.get(m) != self.init_fingerprint(m)]
+        if not stale:
+            return
+        if len(stale) == len(modules):
+            self.execute('init', working_dir=working_dir)
+        else:
+            for module in stale:
+                self.execute('init', working_dir=module)
+        self.record_init(stale, True)
+
+    def record_init(self, modules, succeeded):
+        """Record the init fingerprints of modules after a command ran in
+        them, or forget them when it failed, so that the next command runs
+        auto-init.
+
+        :param modules: list
+        :param succeeded: bool
+        """
+        index = self.init_fingerprint_index
+        if not index.path:
+            return
+        fingerprints = {m: self.init_fingerprint(m)
+                        for m in modules} if succeeded else {}
+        # Modules of a native run_all record their fingerprints at once.
+        with file_lock(index.path + '.lock'):
+            recorded = index.load()
+            for module in modules:
+                recorded.pop(module, None)
+            recorded.update(fingerprints)
+            index.save(recorded)
+
+    @property
+    def fingerprint_index(self):
+        return FingerprintIndex(
+            os.path.join(self.cwd, FINGERPRINTS_FILE) if self.cwd else None,
+            self.logger)
+
+    def module_fingerprints(self, graph):
+        """Fingerprint the sources and inputs of every module.
+
+        :param graph: dict, the dependency graph.
+        :return: dict of module to digest.
+        """
+        return module_fingerprints(
+            graph,
+            self.source_path or self.cwd or os.getcwd(),
+            self.insecure_variables,
+            self.insecure_environment_variables)
+
+    @staticmethod
+    def _include_args(modules):
+        """The terragrunt run-all options that run in modules only.
+
+        :param modules: set, None for every module.
+        :return: list
+        """
+        extra_args = []
+        for module in sorted(modules or []):
+            extra_args.extend(['--terragrunt-include-dir', module])
+        if modules:
+            extra_args.append('--terragrunt-strict-include')
+        return extra_args
+
+    def _execute_stack(self, name, return_output=True, extra_args=None,
+                       saved_plan=None, stream=False, incremental=True,
+                       per_module=False):
+        """Run a command across the stack.
+
+        :param stream: bool, whether the output may be returned as an
+            iterable of lines, when the executor supports it.
+        :param incremental: bool, False to run in every module even when
+            the incremental property is set.
+        :param per_module: bool, schedule a run_all command module by
+            module even without native_run_all, to tell the output of
+            every module apart.
+        :return: list of outputs, one per module with native_run_all.
+        """
+        extra_args = list(extra_args or [])
+        graph = fingerprints = modules = None
+        self.stack_result = None
+        if incremental and self.incremental and \
+                name in utils.INCREMENTAL_COMMANDS:
+            graph = self.dependency_graph()
+            fingerprints = self.module_fingerprints(graph)
+            modules = changed_modules(
+                graph, fingerprints, self.fingerprint_index.load())
+            if not modules:
+                self.logger.info(
+                    'No module changed since the last apply, '
+                    'skipping {}.'.format(name))
+                return []
+            self.logger.info('Running {c} in changed modules: {m}'.format(
+                c=name, m=sorted(modules)))
+        self.stack_modules = modules
+        if self.native_run_all or per_module and self.run_all:
+            outputs = [r.output or '' for r in self._run_modules_or_raise(
+                name, return_output, graph, modules,
+                extra_args=extra_args, saved_plan=saved_plan)]
+        else:
+            outputs = [self.execute(name, return_output,
+                                    extra_args=extra_args +
+                                    self._include_args(modules),
+                                    saved_plan=saved_plan,
+                                    stream=stream)]
+        if name == 'apply' and fingerprints:
+            self.fingerprint_index.save(fingerprints)
+        elif name == 'destroy' and self.incremental:
+            self.fingerprint_index.save({})
+        return outputs
+
+    @property
+    def reuse_plan(self):
+        """ True or False, whether plan saves the plan, for the next
+        apply to use while nothing changed in between.
+        :return: bool
+        """
+        return bool(self.resource_config.get('reuse_plan', False))
+
+    @property
+    def saved_plan_index(self):
+        return FingerprintIndex(
+            os.path.join(self.cwd, SAVED_PLAN_FILE) if self.cwd else None,
+            self.logger)
+
+    def workspace_fingerprint(self):
+        """Fingerprint everything that a saved plan depends on: the
+        stack's sources, the variables, the environment, the binaries and
+        the plan options.
+
+        :return: str
+        """
+        return hash_values(
+            directory_fingerprint(self.source_path or self.cwd or
+                                  os.getcwd()),
+            self.insecure_variables,
+            self.insecure_environment_variables,
+            binary_key(self.binary_path),
+            binary_key(self.terraform_binary_path),
+            self.command_options.get('all', []),
+            self.command_options.get('plan', []),
+            bool(self.run_all))
+
+    def _valid_saved_plan(self):
+        saved = self.saved_plan_index.load()
+        if not saved:
+            return False
+        if saved.get('fingerprint') != self.workspace_fingerprint():
+            self.logger.info(
+                'The stack changed since the last plan, planning again.')
+            return False
+        return True
+
+    @property
+    def plan_model(self):
+        """ True or False, whether plans are parsed into a PlanModel,
+        which takes a fraction of the memory of the plan dict and can be
+        queried, instead of a dict.
+        :return: bool
+        """
+        return bool(self.resource_config.get('plan_model', False))
+
+    def parse_plan(self, output):
+        if self.plan_model:
+            return parse_plan_model(output, self.logger)
+        return parse_plan(output, self.logger)
+
+    @property
+    def structured_plan(self):
+        """ True or False, whether plan saves a plan file in every module
+        and reads the plan from `show -json` of the files, which has the
+        attribute values of every change, instead of from the `plan -json`
+        messages.
+        :return: bool
+        """
+        return bool(self.resource_config.get('structured_plan', False))
+
+    def _plan(self, extra_args=None, incremental=True, per_module=False):
+        result = (line for output in
+                  self._execute_stack('plan', False, extra_args,
+                                      stream=True, incremental=incremental,
+                                      per_module=per_module)
+                  for line in iter_lines(output))
+        return self.parse_plan(result)
+
+    def _structured_plan(self, extra_args=None, incremental=True,
+                         per_module=False):
+        extra_args = [a for a in extra_args or [] if not a.startswith('-out')]
+        extra_args.append('-out={}'.format(utils.SAVED_PLAN_NAME))
+        plan = PlanModel() if self.plan_model else new_plan()
+        fold = plan.fold if self.plan_model else partial(fold_message, plan)
+        outputs = self._execute_stack('plan', False, extra_args,
+                                      stream=True, incremental=incremental,
+                                      per_module=per_module)
+        if not outputs:
+            return plan
+        # Only the diagnostics are not in the saved plans.
+        for output in outputs:
+            for message in iter_json_messages(iter_lines(output),
+                                              self.logger):
+                if isinstance(message, dict) and \
+                        message.get('type') == 'diagnostic':
+                    fold(message)
+        for message in iter_show_messages(
+                self.show_plans(utils.SAVED_PLAN_NAME), self.logger):
+            fold(message)
+        return plan
+
+    def show_plans(self, plan_file):
+        """Stream `show -json` of a plan file in every module that the
+        last plan ran in, in chunks.
+
+        :param plan_file: str, the name of the plan file in the modules.
+        :return: generator of str
+        """
+        if self.stack_result:
+            # The last plan ran module by module.
+            commands = [(m, ['-json']) for m in self.stack_result.succeeded]
+        else:
+            commands = [
+                (None, ['-json'] + self._include_args(self.stack_modules))]
+        for working_dir, extra_args in commands:
+            output = self.execute('show', False, working_dir, extra_args,
+                                  plan_file, stream=True,
+                                  chunk_size=utils.SHOW_CHUNK_SIZE)
+            if isinstance(output, str):
+                yield output
+                continue
+            for chunk in output:
+                yield chunk
 
     def plan(self):
-        plan = {
-            'resource_drifts': [],
-            'outputs': [],
-            'change_summary': {}
-        }
-        result = self.execute('plan', return_output=False)
-        new_result = re.sub('}\s*{', '}____TG_PLUGIN_PLAN____{', result)
-        for item in new_result.split('____TG_PLUGIN_PLAN____'):
-            try:
-                rendered = json.loads(item)
-                if 'type' not in rendered:
-                    continue
-                elif rendered['type'] == 'outputs':
-                    plan['outputs'] = rendered['outputs']
-                elif rendered['type'] == 'resource_drift':
-                    plan['resource_drifts'].append(rendered['change'])
-                elif rendered['type'] == 'change_summary':
-                    plan['change_summary'] = rendered['changes']
-            except json.decoder.JSONDecodeError:
-                # ignoring non json output like releasing state lock
-                self.logger.info('JSONDecodeError in line: {}'.format(item))
-
-        self._terraform_plan = plan
+        extra_args = []
+        if self.reuse_plan:
+            self.saved_plan_index.save({})
+            extra_args.append('-out={}'.format(utils.SAVED_PLAN_NAME))
+        # The delta tells the changes of every module apart.
+        per_module = self.plan_delta
+        if self.structured_plan:
+            self._terraform_plan = self._structured_plan(
+                extra_args, per_module=per_module)
+        else:
+            self._terraform_plan = self._plan(extra_args,
+                                              per_module=per_module)
+        if self.reuse_plan:
+            self.saved_plan_index.save(
+                {'fingerprint': self.workspace_fingerprint()})
+        if self.plan_delta:
+            self._terraform_plan_delta = self.record_plan_delta(
+                self._terraform_plan)
         return self.terraform_plan
 
+    @property
+    def plan_delta(self):
+        """ True or False, whether plan compares the plan with the
+        previous plan, see terraform_plan_delta.
+        :return: bool
+        """
+        return bool(self.resource_config.get('plan_delta', False))
+
+    @property
+    def plan_delta_index(self):
+        return FingerprintIndex(
+            os.path.join(self.cwd, PLAN_INDEX_FILE) if self.cwd else None,
+            self.logger)
+
+    def record_plan_delta(self, plan):
+        """Compare a plan with the index of the previous plan, and keep
+        its index for the next one. With run_all the changes are told
+        apart by the module directory that the last plan ran them in.
+
+        :param plan: dict or PlanModel
+        :return: dict, see plan_delta.
+        """
+        modules = None
+        if self.run_all and self.stack_result:
+            source_dir = self.source_path or self.cwd or os.getcwd()
+            modules = {
+                os.path.relpath(r.module, source_dir):
+                    self.parse_plan(r.output or '')
+                for r in self.stack_result}
+        current = plan_index(plan, modules)
+        delta = plan_delta(self.plan_delta_index.load(), current)
+        self.plan_delta_index.save(current)
+        self.logger.info(format_delta(delta))
+        return delta
+
+    @property
+    def terraform_plan_delta(self):
+        """What changed since the previous plan, when plan_delta is set.
+        :return: dict or None
+        """
+        return self._terraform_plan_delta
+
+    def drift(self):
+        """Compare the real infrastructure with the state, with a
+        refresh-only plan in every module. Neither the plan nor the state
+        are kept. With run_all the plans run module by module, so that the
+        drift of every Terragrunt module is counted on its own, even when
+        resources of different modules have the same address.
+
+        :return: dict of module to add, change and destroy counts and the
+            drifted addresses, empty if nothing drifted. The modules are
+            the Terragrunt module directories with run_all, and the
+            Terraform modules otherwise.
+        """
+        plan = self._plan(['-refresh-only'], incremental=False,
+                          per_module=True)
+        if not self.run_all or not self.stack_result:
+            return summarize_drift(plan)
+        modules = {}
+        for result in self.stack_result:
+            modules.update(summarize_drift(
+                self.parse_plan(result.output or ''), result.module))
+        return modules
+
     @property
     def terraform_plan(self):
-        self.logger.debug(self._terraform_plan)
+        if not self.plan_delta:
+            # Otherwise only the delta is logged.
+            self.logger.debug(self._terraform_plan)
         return self._terraform_plan
 
+    @staticmethod
+    def _join_outputs(outputs):
+        if len(outputs) == 1:
+            return outputs[0]
+        return '\n'.join(outputs)
+
     def apply(self):
-        return self.execute('apply')
+        saved_plan = None
+        if self.reuse_plan and self._valid_saved_plan():
+            self.logger.info('Applying the saved plan.')
+            saved_plan = utils.SAVED_PLAN_NAME
+        try:
+            return self._join_outputs(
+                self._execute_stack('apply', saved_plan=saved_plan))
+        finally:
+            if self.reuse_plan:
+                self.saved_plan_index.save({})
 
     def destroy(self):
-        return self.execute('destroy')
+        if self.reuse_plan:
+            self.saved_plan_index.save({})
+        return self._join_outputs(self._execute_stack('destroy'))
 
     def output(self):
         result = self.execute('output', return_output=False)
@@ -258,6 +1073,27 @@ class Terragrunt(object):
     def terraform_output(self):
         return self._terraform_output
 
+    @property
+    def artifacts(self):
+        """The payloads, such as plans and outputs, that are kept in the
+        node instance directory instead of in runtime properties.
+        :return: ArtifactStore
+        """
+        return ArtifactStore(os.path.join(self.cwd or os.getcwd(),
+                                          ARTIFACTS_DIR))
+
+    def stored(self, name, stored=None):
+        """The full payload kept for the compact runtime property name,
+        read only when it is used.
+
+        :param name: str, terraform_plan or terraform_output.
+        :param stored: dict, the compact runtime property, whose digest
+            selects the version of the payload. Defaults to the latest.
+        :return: LazyArtifact
+        """
+        digest = stored.get('digest') if isinstance(stored, dict) else None
+        return self.artifacts.lazy(name, digest)
+
     def terragrunt_info(self):
         return self.execute('terragrunt-info')
 
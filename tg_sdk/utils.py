@@ -1,13 +1,31 @@
 import os
 import re
+import codecs
+import time
+import signal
 import logging
+import threading
+from collections import deque
+from functools import partial
 from contextlib import contextmanager
 from copy import deepcopy
 from tempfile import NamedTemporaryFile
-from subprocess import check_output, CalledProcessError
+from subprocess import PIPE, Popen
 
+from cloudify.exceptions import NonRecoverableError
 from cloudify_common_sdk.utils import CommonSDKSecret
 
+# Seconds a command that reached its timeout gets to stop gracefully,
+# which lets Terraform release state locks, before it is killed.
+TERMINATE_TIMEOUT = 10
+
+# How much output a failed command keeps for its error report.
+TAIL_LINES = 200
+TAIL_LINE_LENGTH = 4096
+
+# How much show -json output is read at a time, see StreamingProcess.
+SHOW_CHUNK_SIZE = 256 * 1024
+
 
 COMMAND_WITH_INPUTS = [
     'plan',
@@ -17,6 +35,29 @@ COMMAND_WITH_INPUTS = [
     'validate-inputs'
 ]
 
+# Commands that never initialize Terraform or install providers.
+PROVIDERLESS_COMMANDS = [
+    'terragrunt-info',
+    'graph-dependencies',
+    'validate-inputs',
+    'render-json'
+]
+
+# The plan file that plan -out writes in each module's working directory.
+SAVED_PLAN_NAME = 'cloudify.tfplan'
+
+# Read-only commands whose output does not depend on the workspace they
+# run in, which identical concurrent callers share, see SingleFlight.
+SINGLEFLIGHT_COMMANDS = [
+    'plan',
+    'output'
+]
+
+INCREMENTAL_COMMANDS = [
+    'plan',
+    'apply'
+]
+
 
 def convert_secrets(data):
     data = deepcopy(data)
@@ -33,20 +74,234 @@ def get_logger(logger_name=None):
     return logging.getLogger(logger_name)
 
 
+def exit_code(status):
+    """The exit code of a wait status, negative for a signal, like
+    Popen.returncode."""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class ExecutionResult(object):
+    """What is known about a command once it ran: exit code, wall time,
+    CPU time and peak memory where they are known, output volume and the
+    last lines of output for error reports."""
+
+    def __init__(self, command, tail_lines=TAIL_LINES):
+        self.command = command
+        self.returncode = None
+        self.start_time = None
+        self.end_time = None
+        self.cpu_user_time = None
+        self.cpu_system_time = None
+        self.max_rss = None
+        self.stdout_bytes = 0
+        self.stderr_bytes = 0
+        self.tail = deque(maxlen=tail_lines)
+
+    @property
+    def wall_time(self):
+        if self.start_time is None or self.end_time is None:
+            return
+        return self.end_time - self.start_time
+
+    def set_rusage(self, rusage, max_rss=True):
+        """
+        :param rusage: resource.struct_rusage of the command.
+        :param max_rss: bool, whether ru_maxrss is the peak of the command.
+        """
+        self.cpu_user_time = rusage.ru_utime
+        self.cpu_system_time = rusage.ru_stime
+        if max_rss:
+            self.max_rss = rusage.ru_maxrss * 1024
+
+    def add_line(self, line):
+        if len(line) > TAIL_LINE_LENGTH:
+            line = line[:TAIL_LINE_LENGTH] + '...'
+        self.tail.append(line)
+
+    def to_dict(self):
+        return {
+            'returncode': self.returncode,
+            'wall_time': self.wall_time,
+            'cpu_user_time': self.cpu_user_time,
+            'cpu_system_time': self.cpu_system_time,
+            'max_rss': self.max_rss,
+            'stdout_bytes': self.stdout_bytes,
+            'stderr_bytes': self.stderr_bytes
+        }
+
+
+class StreamingProcess(object):
+    """Run a command and hand out its output line by line, as it is
+    written, without ever holding more than the tail of it.
+
+    Iterating yields stdout lines, or with chunk_size, chunks of stdout of
+    up to chunk_size bytes, for output that is not split into lines, such
+    as show -json. stderr is read in a thread and only goes to on_stderr
+    and the tail. When the output ends the process is
+    reaped, and a non zero exit code raises NonRecoverableError with the
+    tail of the output.
+    """
+
+    def __init__(self,
+                 command,
+                 cwd=None,
+                 env=None,
+                 on_stdout=None,
+                 on_stderr=None,
+                 on_complete=None,
+                 tail_lines=TAIL_LINES,
+                 chunk_size=None):
+        """
+        :param command: list
+        :param cwd: str
+        :param env: dict, the whole environment, or None to inherit.
+        :param on_stdout: callable(line) for every stdout line.
+        :param on_stderr: callable(line) for every stderr line.
+        :param on_complete: callable(ExecutionResult) once it exited.
+        :param tail_lines: how many lines to keep for error reports.
+        :param chunk_size: int, yield chunks of this many bytes instead of
+            lines. Chunks are not kept in the tail.
+        """
+        self.on_stdout = on_stdout
+        self.chunk_size = chunk_size
+        self.on_stderr = on_stderr
+        self.on_complete = on_complete
+        self.result = ExecutionResult(command, tail_lines)
+        self.result.start_time = time.time()
+        self._process = Popen(command, cwd=cwd, env=env,
+                              stdout=PIPE, stderr=PIPE,
+                              start_new_session=True)
+        self._stderr_thread = threading.Thread(target=self._read_stderr)
+        self._stderr_thread.daemon = True
+        self._stderr_thread.start()
+        self._started = False
+
+    @property
+    def pid(self):
+        return self._process.pid
+
+    @property
+    def running(self):
+        return self._process.poll() is None
+
+    def terminate(self):
+        """Ask the process, and everything it started, to stop. Reading
+        the output then ends and raises NonRecoverableError for the exit
+        code."""
+        if self.running:
+            try:
+                os.killpg(self._process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _read_stderr(self):
+        for raw in self._process.stderr:
+            self.result.stderr_bytes += len(raw)
+            line = raw.decode('utf-8', errors='replace').rstrip('\n')
+            self.result.add_line(line)
+            if self.on_stderr:
+                self.on_stderr(line)
+
+    def __iter__(self):
+        if self._started:
+            raise RuntimeError('The output of {} was already read.'.format(
+                self.result.command))
+        self._started = True
+        return self._lines()
+
+    def _stdout(self):
+        if self.chunk_size:
+            decoder = codecs.getincrementaldecoder('utf-8')('replace')
+            for raw in iter(partial(self._process.stdout.read1,
+                                    self.chunk_size), b''):
+                self.result.stdout_bytes += len(raw)
+                yield decoder.decode(raw)
+            return
+        for raw in self._process.stdout:
+            self.result.stdout_bytes += len(raw)
+            line = raw.decode('utf-8', errors='replace').rstrip('\n')
+            self.result.add_line(line)
+            yield line
+
+    def _lines(self):
+        completed = False
+        try:
+            for line in self._stdout():
+                if self.on_stdout:
+                    self.on_stdout(line)
+                yield line
+            completed = True
+        finally:
+            if not completed and self._process.poll() is None:
+                self._process.kill()
+            self._finish(raise_on_error=completed)
+
+    def _reap(self):
+        """Wait for the process with wait4, which also tells how much
+        CPU and memory it used."""
+        try:
+            _, status, rusage = os.wait4(self._process.pid, 0)
+        except ChildProcessError:
+            # Reaped by a concurrent poll.
+            return self._process.wait()
+        self._process.returncode = exit_code(status)
+        self.result.set_rusage(rusage)
+        return self._process.returncode
+
+    def _finish(self, raise_on_error=True):
+        self.result.returncode = self._reap()
+        self._stderr_thread.join()
+        self._process.stdout.close()
+        self._process.stderr.close()
+        self.result.end_time = time.time()
+        if self.on_complete:
+            self.on_complete(self.result)
+        if raise_on_error and self.result.returncode:
+            raise NonRecoverableError(
+                'Command {c} failed with exit code {r}. '
+                'Last output:\n{t}'.format(
+                    c=self.result.command,
+                    r=self.result.returncode,
+                    t='\n'.join(self.result.tail)))
+
+    def wait(self):
+        """Read the process to the end, discarding what the callbacks did
+        not take.
+
+        :return: ExecutionResult
+        """
+        for _ in self:
+            pass
+        return self.result
+
+
 def basic_executor(command, *args, **kwargs):
+    """Run a command and return its stdout.
+
+    With stream=True the StreamingProcess is returned instead, so the
+    caller can consume stdout line by line. on_stdout, on_stderr and
+    on_complete are passed to it either way.
+    """
     if isinstance(command, str):
         command = command.split(' ')
-    if 'logger' in kwargs:
-        kwargs.pop('logger')
-    if 'return_output' in kwargs:
-        kwargs.pop('return_output')
-    try:
-        result = check_output(command, *args, **kwargs)
-    except CalledProcessError as e:
-        result = str(e)
-    if isinstance(result, bytes):
-        return result.decode('utf-8').strip()
-    return result.strip()
+    for ignored in ['logger', 'return_output', 'masked_env_vars']:
+        kwargs.pop(ignored, None)
+    stream = kwargs.pop('stream', False)
+    env = None
+    additional_env = kwargs.pop('additional_env', None)
+    if additional_env:
+        env = dict(os.environ)
+        env.update(additional_env)
+    process = StreamingProcess(command, *args, env=env, **kwargs)
+    if stream:
+        return process
+    return '\n'.join(process).strip()
+
+
+# The Terragrunt class only asks executors that declare it to stream.
+basic_executor.supports_streaming = True
 
 
 def dump_hcl(data, file_obj):